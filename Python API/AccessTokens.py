@@ -0,0 +1,157 @@
+import argparse
+import threading
+import time
+import uuid
+from datetime import datetime, timedelta
+from Database import Database
+
+
+class AccessTokens:
+
+    def __init__(self, database) -> None:
+        self.database = database
+        # Every statement of a login and a logout, Migrations --check runs EXPLAIN on the same SQL
+        self.queries = {
+            # One round trip for the user and the tokens a login will replace
+            "find_user": (
+                "SELECT users.email, users.password, access_tokens.jti, access_tokens.created_at FROM users "
+                "LEFT JOIN access_tokens ON access_tokens.email = users.email "
+                "WHERE users.email = %s"
+            ),
+            "expire_email": (
+                "INSERT INTO expired_access_tokens (jti, token, email, created_at, updated_at, expired_at) "
+                "SELECT jti, token, email, created_at, %s, %s FROM access_tokens WHERE email = %s"
+            ),
+            "delete_email": "DELETE FROM access_tokens WHERE email = %s",
+            "insert": "INSERT INTO access_tokens (jti, token, email, created_at, updated_at, expired_at) VALUES (%s, %s, %s, %s, %s, %s)",
+            "expire_token": (
+                "INSERT INTO expired_access_tokens (jti, token, email, created_at, updated_at, expired_at) "
+                "SELECT jti, token, email, created_at, %s, %s FROM access_tokens WHERE token = %s"
+            ),
+            "delete_token": "DELETE FROM access_tokens WHERE token = %s",
+        }
+
+    def check_queries(self) -> list:
+        # (query, params) pairs with example values, for EXPLAIN
+        now = datetime.now()
+        return [
+            (self.queries["find_user"], ("user@example.com",)),
+            (self.queries["expire_email"], (now, now, "user@example.com")),
+            (self.queries["delete_email"], ("user@example.com",)),
+            (self.queries["expire_token"], (now, now, "token")),
+            (self.queries["delete_token"], ("token",)),
+        ]
+
+    def find_user(self, cursor, email):
+        # Rows are (email, password, jti, created_at) with NULL jti when the user has no token
+        cursor.execute(self.queries["find_user"], (email,))
+        return self.user_from_rows(cursor.fetchall())
+
+    def user_from_rows(self, rows):
+        # Returns ((email, password), [(jti, created_at)]) or (None, []), shared with the async server
+        if not rows:
+            return None, []
+        return (rows[0][0], rows[0][1]), [(jti, created_at) for _, _, jti, created_at in rows if jti is not None]
+
+    def rotate(self, connection, cursor, email, jti, token, now, expired_at) -> None:
+        # Old tokens move to expired_access_tokens and the new one is saved in one transaction,
+        # so a failed login never leaves a user with neither or both
+        try:
+            cursor.execute(self.queries["expire_email"], (now, now, email))
+            cursor.execute(self.queries["delete_email"], (email,))
+            cursor.execute(self.queries["insert"], (jti, token, email, now, now, expired_at))
+            connection.commit()
+        except Exception:
+            connection.rollback()
+            raise
+
+    def expire(self, connection, cursor, token, now) -> bool:
+        # Moves one token to expired_access_tokens, False when it was not found
+        try:
+            cursor.execute(self.queries["expire_token"], (now, now, token))
+            if cursor.rowcount == 0:
+                connection.rollback()
+                return False
+            cursor.execute(self.queries["delete_token"], (token,))
+            connection.commit()
+            return True
+        except Exception:
+            connection.rollback()
+            raise
+
+
+def legacy_login(connection, cursor, email, jti, token, now, expired_at):
+    # The statements authenticate_user ran before, one commit per step
+    cursor.execute("SELECT * FROM users where email = %s", (email,))
+    cursor.fetchone()
+    cursor.execute("SELECT * FROM access_tokens where email = %s", (email,))
+    old_token = cursor.fetchone()
+    if old_token:
+        cursor.execute(
+            "INSERT INTO expired_access_tokens (jti, token, email, created_at, updated_at, expired_at) VALUES (%s, %s, %s, %s, %s, %s)",
+            (old_token[1], old_token[2], old_token[3], old_token[4], now, now)
+        )
+        connection.commit()
+        cursor.execute("DELETE FROM access_tokens WHERE email = %s", (email,))
+        connection.commit()
+    cursor.execute(
+        "INSERT INTO access_tokens (jti, token, email, created_at, updated_at, expired_at) VALUES (%s, %s, %s, %s, %s, %s)",
+        (jti, token, email, now, now, expired_at)
+    )
+    connection.commit()
+
+
+def single_transaction_login(tokens):
+    def login(connection, cursor, email, jti, token, now, expired_at):
+        tokens.find_user(cursor, email)
+        tokens.rotate(connection, cursor, email, jti, token, now, expired_at)
+    return login
+
+
+def measure(database, login, emails, logins, threads):
+    # Logins per second without bcrypt, every user already has a token so each login rotates one
+    counter = iter(range(logins))
+    lock = threading.Lock()
+
+    def worker():
+        connection = database.db_connection()
+        cursor = connection.cursor()
+        try:
+            while True:
+                with lock:
+                    index = next(counter, None)
+                if index is None:
+                    return
+                now = datetime.now()
+                login(connection, cursor, emails[index % len(emails)], uuid.uuid4().hex, f"bench-{uuid.uuid4().hex}", now, now + timedelta(days=1))
+        finally:
+            cursor.close()
+            connection.close()
+
+    workers = [threading.Thread(target=worker) for _ in range(threads)]
+    start = time.perf_counter()
+    for thread in workers:
+        thread.start()
+    for thread in workers:
+        thread.join()
+    return logins / (time.perf_counter() - start)
+
+
+if __name__ == "__main__":
+    # Writes tokens for the seeded users, only run it against a benchmark database
+    parser = argparse.ArgumentParser(description="Compare the old and the single transaction login on the configured database")
+    parser.add_argument("--logins", type=int, default=2000)
+    parser.add_argument("--threads", type=int, default=8)
+    parser.add_argument("--users", type=int, default=200, help="Seeded users user1@example.com ... to log in as")
+    args = parser.parse_args()
+
+    database = Database()
+    emails = [f"user{id}@example.com" for id in range(1, args.users + 1)]
+    candidates = [("legacy", legacy_login), ("single transaction", single_transaction_login(AccessTokens(database)))]
+    # Warm up so every user has a token to rotate in both runs
+    measure(database, candidates[1][1], emails, len(emails), 1)
+    baseline = None
+    for name, login in candidates:
+        rate = measure(database, login, emails, args.logins, args.threads)
+        baseline = baseline or rate
+        print(f"{name:<20} {args.logins} logins  {args.threads} threads  {rate:8.1f} logins/s  {rate / baseline:5.2f}x")
@@ -1,797 +1,671 @@
-import re
-import bcrypt
+import codecs
+import math
+import os
+import time
 import uuid
-import secrets
-import jwt
 from flask import Flask
-from flask import request, jsonify
+from flask import request, jsonify, g, send_file
 from Database import Database
-from Logger import Logger
+from Logger import Logger, request_context
+from Cache import Cache
+from Conditional import Conditional
+from Pagination import Pagination
+from Expansion import Expansion
+from Filters import Filters
+from Streaming import Streaming
+from TokenVerifier import TokenVerifier
+from PasswordHasher import PasswordHasher, HasherBusy
+from BulkInsert import BulkInsert
+from Importer import Importer
+from SearchIndex import SearchIndex
+from Metrics import Metrics
+from JsonEncoder import JsonEncoder
+from JsonProvider import JsonProvider
+from Schema import Schema
+from QueryRegistry import QueryRegistry
+from TokenSweeper import TokenSweeper
+from AccessTokens import AccessTokens
+from RateLimiter import RateLimiter, MemoryBuckets, SQLiteBuckets
+from ImageStore import ImageStore
 from datetime import datetime, timedelta
 from flask_cors import CORS
+from werkzeug.middleware.proxy_fix import ProxyFix
 
 class Api:
     
     def __init__(self) -> None:
         self.app = Flask(__name__)
-        CORS(self.app)  # Enable CORS for Flask app
+        # Responses are encoded with orjson when it is installed, API_JSON_BACKEND=json forces the stdlib
+        self.app.json = JsonProvider(self.app, JsonEncoder(os.environ.get("API_JSON_BACKEND"), os.environ.get("API_JSON_DATES", "http")))
+        CORS(self.app, expose_headers=["X-Next-Cursor", "Link", "ETag", "X-Request-ID", "Retry-After", "Content-Range"])  # Enable CORS for Flask app
+        # Behind a reverse proxy the client address comes from X-Forwarded-For, set to the number of proxies in front
+        if int(os.environ.get("API_PROXY_HOPS", 0)) > 0:
+            self.app.wsgi_app = ProxyFix(self.app.wsgi_app, x_for=int(os.environ["API_PROXY_HOPS"]))
         # Create an instance class of DBConnection
         self.database = Database()
         # Create an instance class of Logger
         self.logger = Logger()
+        # Create an instance class of Metrics, exposed in Prometheus format at /metrics
+        self.metrics = Metrics()
+        self.database.metrics = self.metrics
+        # Create an instance class of Schema describing the CRUD resources
+        self.schema = Schema()
+        # Create an instance class of QueryRegistry holding the CRUD queries compiled once
+        self.queries = QueryRegistry(self.schema, self.database.columns)
+        # Create an instance class of Cache for the per-id GET endpoints
+        self.cache = Cache(
+            max_entries=int(os.environ.get("API_CACHE_MAX_ENTRIES", 10000)),
+            max_bytes=int(os.environ["API_CACHE_MAX_BYTES"]) if "API_CACHE_MAX_BYTES" in os.environ else None,
+            ttl=float(os.environ.get("API_CACHE_TTL", 2))
+        )
+        # Create an instance class of Conditional for ETag and Last-Modified handling
+        self.conditional = Conditional()
+        # Create an instance class of TokenVerifier for signing and checking access tokens
+        self.token_verifier = TokenVerifier(self.database, self.logger)
+        # Create an instance class of PasswordHasher so bcrypt does not run on request threads
+        self.password_hasher = PasswordHasher(
+            workers=int(os.environ.get("API_HASH_WORKERS", 4)),
+            queue_size=int(os.environ.get("API_HASH_QUEUE_SIZE", 32)),
+            queue_timeout=float(os.environ.get("API_HASH_QUEUE_TIMEOUT", 0.5)),
+            metrics=self.metrics
+        )
+        # Create an instance class of RateLimiter shedding /api/auth requests before any database or bcrypt work,
+        # API_RATE_LIMIT_FILE shares the counters between the workers of a host through a SQLite file
+        self.rate_limiter = RateLimiter(
+            {
+                name: limit for name, limit in [
+                    ("global", RateLimiter.parse(os.environ.get("API_AUTH_LIMIT_GLOBAL", "50/1"))),
+                    ("ip", RateLimiter.parse(os.environ.get("API_AUTH_LIMIT_IP", "20/60"))),
+                    ("email", RateLimiter.parse(os.environ.get("API_AUTH_LIMIT_EMAIL", "10/60"))),
+                ] if limit is not None
+            },
+            store=SQLiteBuckets(os.environ["API_RATE_LIMIT_FILE"]) if os.environ.get("API_RATE_LIMIT_FILE") else MemoryBuckets(int(os.environ.get("API_RATE_LIMIT_MAX_KEYS", 100000))),
+            logger=self.logger,
+            metrics=self.metrics
+        )
+        # Create an instance class of ImageStore keeping uploads by content hash, thumbnails are made on a process pool
+        self.image_store = ImageStore(
+            os.environ.get("API_IMAGE_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), "images")),
+            widths=[int(width) for width in os.environ.get("API_IMAGE_WIDTHS", "160,480,1024").split(",")],
+            workers=int(os.environ.get("API_IMAGE_WORKERS", 2)),
+            max_bytes=int(os.environ.get("API_IMAGE_MAX_BYTES", 10 * 1024 * 1024)),
+            logger=self.logger,
+            metrics=self.metrics
+        )
+        # With a front server that understands X-Sendfile, Flask only sends the path of the image
+        self.app.config["USE_X_SENDFILE"] = os.environ.get("API_X_SENDFILE") == "1"
+        # Create an instance class of AccessTokens for the login and logout transactions
+        self.access_tokens = AccessTokens(self.database)
+        # Create an instance class of TokenSweeper moving expired tokens out of access_tokens in the background
+        self.token_sweeper = TokenSweeper(
+            self.database,
+            self.logger,
+            lifetime=self.token_verifier.lifetime,
+            retention=timedelta(days=float(os.environ.get("API_TOKEN_RETENTION_DAYS", 7))),
+            interval=float(os.environ.get("API_TOKEN_SWEEP_INTERVAL", 60)),
+            batch_size=int(os.environ.get("API_TOKEN_SWEEP_BATCH", 500)),
+            archive=os.environ.get("API_TOKEN_ARCHIVE"),
+            metrics=self.metrics
+        )
+        # Create an instance class of BulkInsert for JSON array payloads on create_*
+        self.bulk_insert = BulkInsert(self.database)
+        # Create an instance class of SearchIndex, built in the background from the cars table
+        self.search_index = SearchIndex(self.database, self.logger)
+        # Create an instance class of Pagination for the all_* endpoints
+        self.pagination = Pagination()
+        # Create an instance class of Filters for filtering and sorting the all_* endpoints
+        self.filters = Filters()
+        # Create an instance class of Expansion for ?expand= on cars
+        self.expansion = Expansion(self.database)
+        # Create an instance class of Streaming for NDJSON exports
+        self.streaming = Streaming(self.app.json, self.logger)
+        # Seconds a client that wrote keeps reading from the primary, so replica lag never hides its own writes
+        self.read_your_writes = float(os.environ.get("API_READ_YOUR_WRITES", 5))
+        # Monotonic time of the last successful write in this process
+        self.last_write = 0.0
+        # Time every request, registered first so the other hooks are included
+        self.instrument()
+        # Start per-process background work once the worker serves its first request
+        self.app.before_request(self.search_index.start)
+        self.app.before_request(self.token_sweeper.start)
         # Run routes method
         self.routes()
         
     def routes(self):
     
-        @self.app.route("/api/create_car", methods=["POST"])
-        def create_car():
+        # create_*, all_*, get, update_* and delete_* for every resource in the schema
+        for name, resource in self.schema.resources.items():
+            self.add_resource_routes(name, resource)
+        
+        @self.app.route("/api/auth", methods=["POST"])         
+        def authenticate_user():
             connection = None
             cursor = None
             try:
                 if request.method != "POST":
                     return "Method Not Allowed", 405
                 
-                request_data = request.get_json()
+                # Shed load from this client before parsing the body
+                limited = self.too_many_requests("ip", request.remote_addr)
+                if limited:
+                    return limited
+                
+                auth_data = request.get_json()
                 
                 required_keys = [
-                    "car_name",
-                    "car_model",
-                    "car_description",
-                    "car_image",
-                    "brand_id",
-                    "category_id",
+                    "email",
+                    "password",
                 ]
                 
-                if not all(key in request_data for key in required_keys):
+                if not all(key in auth_data for key in required_keys):
                     return "Bad Request - Missing Parameters", 400
                 
-                created_at = datetime.now()
-                updated_at = datetime.now()
-                
-                # Make connection to Database
-                connection = self.database.db_connection()
-                cursor = connection.cursor()
-                query = (
-                    "INSERT INTO cars "
-                    "(name, model, description, image, brand_id, category_id, created_at, updated_at) "
-                    "VALUES (%s, %s, %s, %s, %s, %s, %s, %s)"
-                )
-                data = (
-                    request_data["car_name"],
-                    request_data["car_model"],
-                    request_data["car_description"],
-                    request_data["car_image"],
-                    request_data["brand_id"],
-                    request_data["category_id"],
-                    created_at,
-                    updated_at
-                )
-                cursor.execute(query, data)
-                # Make sure data is committed to the database
-                connection.commit()
-                
-                return "Car created successfully.", 200
-            
-            except Exception as error:
-                self.logger.debug(error)
-            
-            finally:
-                if cursor is not None:
-                    cursor.close()
-                if connection is not None:
-                    connection.close()
-    
-        @self.app.route("/api/all_cars", methods=["GET"])
-        def retrieve_all_cars():
-            connection = None
-            cursor = None
-            try:
-                if request.method != "GET":
-                    return "Method Not Allowed", 405
-                
-                connection = self.database.db_connection()
-                cursor = connection.cursor()
-                query = ("SELECT * FROM cars")
-                cursor.execute(query)
-                car_list_data = cursor.fetchall()
-                # Initialize empty list to store dictionaries representing cars
-                cars = []
-                for car_data in car_list_data:
-                    car = {
-                        "id": car_data[0],
-                        "name": car_data[1],
-                        "model": car_data[2],
-                        "description": car_data[3],
-                        "image": car_data[4],
-                        "brand_id": car_data[5],
-                        "category_id": car_data[6],
-                        "created_at": car_data[7],
-                        "updated_at": car_data[8]
-                    }
-                    cars.append(car)
-                
-                return jsonify(cars), 200
-            
-            except Exception as error:
-                self.logger.debug(error)
+                email = auth_data["email"]
+                password = auth_data["password"]
                 
-            finally:
-                if cursor is not None:
-                    cursor.close()
-                if connection is not None:
-                    connection.close()
-            
-        @self.app.route("/api/car/<id>", methods=["GET"])
-        def retrieve_specific_car(id):
-            connection = None
-            cursor = None
-            try:
-                if request.method != "GET":
-                    return "Method Not Allowed", 405
+                # Guessing one account from many addresses is limited by email, the shared budget is charged last
+                # so a client rejected by its own limits cannot use up the logins of everybody else
+                limited = self.too_many_requests("email", str(email).strip().lower()) or self.too_many_requests("global", "all")
+                if limited:
+                    return limited
                 
                 connection = self.database.db_connection()
                 cursor = connection.cursor()
-                query = ("SELECT * FROM cars WHERE id = %s")
-                cursor.execute(query, (id,))
-                car_data = cursor.fetchone()
-                # Initialize empty dictionaries
-                if car_data:
-                    car = {
-                        "id": car_data[0],
-                        "name": car_data[1],
-                        "model": car_data[2],
-                        "description": car_data[3],
-                        "image": car_data[4],
-                        "brand_id": car_data[5],
-                        "category_id": car_data[6],
-                        "created_at": car_data[7],
-                        "updated_at": car_data[8]
-                    }
-                    return jsonify(car), 200
-                else:
-                    return f"Car for id = {id} not found", 404
-            
-            except Exception as error:
-                self.logger.debug(error)
+                # The user and the tokens this login replaces in one query
+                user, old_tokens = self.access_tokens.find_user(cursor, email)
+                # Give the connection back before bcrypt, a login storm must not hold the pool while it queues
+                cursor.close()
+                cursor = None
+                connection.close()
+                connection = None
                 
-            finally:
-                if cursor is not None:
-                    cursor.close()
-                if connection is not None:
-                    connection.close()
-    
-        @self.app.route("/api/update_car/<id>", methods=["PUT", "POST"])        
-        def update_specific_car(id):
-            connection = None
-            cursor = None
-            try:
-                if request.method not in ["POST", "PUT"]:
-                    return "Method Not Allowed", 405
-                
-                request_data = request.get_json()
-                
-                # Create a dictionary for dynamic update query
-                update_fields = {}
-                if "car_name" in request_data:
-                    update_fields["name"] = request_data["car_name"]
+                if not user:
+                    return "Email does not exists in the record.", 401
                 
-                if "car_model" in request_data:
-                    update_fields["model"] = request_data["car_model"]
-                    
-                if "car_description" in request_data:
-                    update_fields["description"] = request_data["car_description"]
-                    
-                if "car_image" in request_data:
-                    update_fields["image"] = request_data["car_image"]
-                    
-                if "brand_id" in request_data:
-                    update_fields["brand_id"] = request_data["brand_id"]
-                    
-                if "category_id" in request_data:
-                    update_fields["category_id"] = request_data["category_id"]
-                    
-                if not update_fields:
-                    return "Please enter at least one field to update.", 400
+                email, password_db = user
                 
-                update_fields["updated_at"] = datetime.now()
+                # Converting entered password to bytes 
+                encoded_password = password.encode("utf-8")
+                # Convert password in db to bytes
                 
-                connection = self.database.db_connection()
-                cursor = connection.cursor()
+                encoded_password_db = password_db.encode("utf-8")
+                # Checking password entered with the password in db on the bounded hashing pool
+                try:
+                    correct_password = self.password_hasher.check(encoded_password, encoded_password_db)
+                except HasherBusy:
+                    return "Service Unavailable - Too many login attempts, try again later.", 503, {"Retry-After": "1"}
                 
-                # Return error message if id does not exists
-                cursor.execute("SELECT id FROM cars WHERE id = %s", (id,))
-                if not cursor.fetchone():
-                    return f"Update failed. Car for id = {id} not found.", 404
-                
-                # Build the SET clause dynamically
-                set_clause = ", ".join(f"{key} = %s" for key in update_fields.keys())
-                values = list(update_fields.values())
-                # Append the id at the end for the WHERE clause
-                values.append(id)
-                query = f"UPDATE cars SET {set_clause} WHERE id = %s"
-                cursor.execute(query, values)
-                # Make sure data is committed to the database
-                connection.commit()
-                return "Updated successfully.", 200
+                if not correct_password:
+                    return "Password is not matching with our record.", 401
                 
-            except Exception as error:
-                self.logger.debug(error)
+                # Get current time
+                current_time = datetime.now()
                 
-            finally:
-                if cursor is not None:
-                    cursor.close()
-                if connection is not None:
-                    connection.close()
-    
-        @self.app.route("/api/delete_car/<id>", methods=["DELETE"])        
-        def delete_specific_car(id):
-            connection = None
-            cursor = None
-            try:
-                if request.method != "DELETE":
-                    return "Method Not Allowed", 405
+                # Create new token signed with the current key of the key ring
+                jti = uuid.uuid4().hex
+                expired_at = current_time + self.token_verifier.lifetime
+                token = self.token_verifier.issue(email, jti)
                 
+                # Expire the old tokens and save the new one in a single transaction
                 connection = self.database.db_connection()
                 cursor = connection.cursor()
-                query = "DELETE FROM cars WHERE id = %s"
-                cursor.execute(query, (id,))
+                self.access_tokens.rotate(connection, cursor, email, jti, token, current_time, expired_at)
+                # Reject the old tokens in this worker straight away
+                for old_jti, old_created_at in old_tokens:
+                    self.token_verifier.revoke(old_jti, old_created_at)
                 
-                if cursor.rowcount == 0:
-                    return f"Delete failed. Car for id = {id} not found", 404
-                
-                connection.commit()
-                return "Deleted successfully.", 200
+                return jsonify(status="success", token=token), 200
                 
             except Exception as error:
-                self.logger.debug(error)
+                return self.internal_error(error)
                 
             finally:
                 if cursor is not None:
                     cursor.close()
                 if connection is not None:
                     connection.close()
-    
-        @self.app.route("/api/create_brand", methods=["POST"])   
-        def create_brand():
+                    
+        @self.app.route("/api/logout", methods=["POST"])         
+        @self.token_verifier.required
+        def logout_user():
             connection = None
             cursor = None
             try:
                 if request.method != "POST":
                     return "Method Not Allowed", 405
                 
-                request_data = request.get_json()
-                
-                required_keys = [
-                    "brand_name",
-                    "brand_image",
-                ]
-                
-                if not all(key in request_data for key in required_keys):
-                    return "Bad Request - Missing Parameters", 400
-                
-                created_at = datetime.now()
-                updated_at = datetime.now()
+                # Signature, exp and revocation were checked by the decorator
+                token = g.token
                 
-                # Make connection to Database
                 connection = self.database.db_connection()
                 cursor = connection.cursor()
-                query = (
-                    "INSERT INTO brands "
-                    "(name, image, created_at, updated_at)"
-                    "VALUES (%s, %s, %s, %s)"
-                )
-                data = (
-                    request_data["brand_name"],
-                    request_data["brand_image"],
-                    created_at,
-                    updated_at
-                )
-                cursor.execute(query, data)
-                # Make sure data is committed to the database
-                connection.commit()
-                
-                return "Brand created successfully.", 200
-                
-            except Exception as error:
-                self.logger.debug(error)
+                # Move the token to expired_access_tokens, one transaction and no read first
+                if not self.access_tokens.expire(connection, cursor, token, datetime.now()):
+                    return "Forbidden - Token expired or not found.", 403
+                self.token_verifier.revoke(g.token_claims["jti"], expires_at=g.token_claims["exp"])
                 
-            finally:
-                if cursor is not None:
-                    cursor.close()
-                if connection is not None:
-                    connection.close()
-    
-        @self.app.route("/api/all_brands", methods=["GET"])   
-        def retrieve_all_brands():
-            connection = None
-            cursor = None
-            try:
-                if request.method != "GET":
-                    return "Method Not Allowed", 405
+                return "Logout successful.", 200
                 
-                connection = self.database.db_connection()
-                cursor = connection.cursor()
-                query = ("SELECT * FROM brands")
-                cursor.execute(query)
-                brand_list_data = cursor.fetchall()
-                # Initialize empty list to store dictionaries representing cars
-                brands = []
-                for brand_data in brand_list_data:
-                    brand = {
-                        "id": brand_data[0],
-                        "name": brand_data[1],
-                        "image": brand_data[2],
-                        "created_at": brand_data[3],
-                        "updated_at": brand_data[4]
-                    }
-                    brands.append(brand)
-                
-                return jsonify(brands), 200
             
             except Exception as error:
-                self.logger.debug(error)
+                return self.internal_error(error)
                 
             finally:
                 if cursor is not None:
                     cursor.close()
                 if connection is not None:
                     connection.close()
-    
-        @self.app.route("/api/brand/<id>", methods=["GET"])   
-        def retrieve_specific_brand(id):
-            connection = None
-            cursor = None
+
+        @self.app.route("/api/search", methods=["GET"])
+        def search_cars():
             try:
                 if request.method != "GET":
                     return "Method Not Allowed", 405
                 
-                connection = self.database.db_connection()
-                cursor = connection.cursor()
-                query = ("SELECT * FROM brands WHERE id = %s")
-                cursor.execute(query, (id,))
-                brand_data = cursor.fetchone()
-                # Initialize empty dictionaries
-                if brand_data:
-                    brand = {
-                        "id": brand_data[0],
-                        "name": brand_data[1],
-                        "image": brand_data[2],
-                        "created_at": brand_data[3],
-                        "updated_at": brand_data[4]
-                    }
-                    return jsonify(brand), 200
-                else:
-                    return f"Brand for id = {id} not found", 404
-            
-            except Exception as error:
-                self.logger.debug(error)
-                
-            finally:
-                if cursor is not None:
-                    cursor.close()
-                if connection is not None:
-                    connection.close()
-    
-        @self.app.route("/api/update_brand/<id>", methods=["PUT", "POST"])  
-        def update_specific_brand(id):
-            connection = None
-            cursor = None
-            try:
-                if request.method not in ["POST", "PUT"]:
-                    return "Method Not Allowed", 405
-                
-                request_data = request.get_json()
-                
-                # Create a dictionary for dynamic update query
-                update_fields = {}
-                if "brand_name" in request_data:
-                    update_fields["name"] = request_data["brand_name"]
-                
-                if "brand_image" in request_data:
-                    update_fields["image"] = request_data["brand_image"]
-                    
-                if not update_fields:
-                    return "Please enter at least one field to update.", 400
-                
-                update_fields["updated_at"] = datetime.now()
+                query = request.args.get("q", "")
+                if not query.strip():
+                    return "Bad Request - Missing search query", 400
                 
-                connection = self.database.db_connection()
-                cursor = connection.cursor()
+                try:
+                    limit = min(max(int(request.args.get("limit", 20)), 1), 100)
+                except ValueError:
+                    return "Bad Request - limit must be an integer", 400
                 
-                # Return error message if id does not exists
-                cursor.execute("SELECT id FROM brands WHERE id = %s", (id,))
-                if not cursor.fetchone():
-                    return f"Update failed. Brand for id = {id} not found.", 404
-                
-                # Build the SET clause dynamically
-                set_clause = ", ".join(f"{key} = %s" for key in update_fields.keys())
-                values = list(update_fields.values())
-                # Append the id at the end for the WHERE clause
-                values.append(id)
-                query = f"UPDATE brands SET {set_clause} WHERE id = %s"
-                cursor.execute(query, values)
-                # Make sure data is committed to the database
-                connection.commit()
-                return "Updated successfully.", 200
+                if not self.search_index.ready:
+                    return "Service Unavailable - Search index is still building.", 503, {"Retry-After": "5"}
                 
+                # Answered from memory, MySQL is not touched
+                return jsonify(self.search_index.search(query, limit)), 200
+            
             except Exception as error:
-                self.logger.debug(error)
-                
-            finally:
-                if cursor is not None:
-                    cursor.close()
-                if connection is not None:
-                    connection.close()
-    
-        @self.app.route("/api/delete_brand/<id>", methods=["DELETE"])           
-        def delete_specific_brand(id):
-            connection = None
-            cursor = None
+                return self.internal_error(error)
+        
+        @self.app.route("/api/import_cars", methods=["POST"])
+        def import_cars():
             try:
-                if request.method != "DELETE":
+                if request.method != "POST":
                     return "Method Not Allowed", 405
                 
-                connection = self.database.db_connection()
-                cursor = connection.cursor()
-                query = "DELETE FROM brands WHERE id = %s"
-                cursor.execute(query, (id,))
+                job = request.args.get("job")
+                if not job:
+                    return "Bad Request - Missing job name", 400
                 
-                if cursor.rowcount == 0:
-                    return f"Delete failed. Brand for id = {id} not found", 404
+                format = request.args.get("format", "ndjson" if request.mimetype == "application/x-ndjson" else "csv")
+                if format not in ["csv", "ndjson"]:
+                    return "Bad Request - format must be csv or ndjson", 400
                 
-                connection.commit()
-                return "Deleted successfully.", 200
+                try:
+                    chunk_size = int(request.args.get("chunk_size", 1000))
+                except ValueError:
+                    return "Bad Request - chunk_size must be an integer", 400
                 
-            except Exception as error:
-                self.logger.debug(error)
+                # Decode the request body line by line instead of loading it
+                lines = codecs.getreader("utf-8")(request.stream)
+                importer = Importer(self.database, self.logger, chunk_size=max(1, chunk_size))
+                summary = importer.run(lines, format, job)
                 
-            finally:
-                if cursor is not None:
-                    cursor.close()
-                if connection is not None:
-                    connection.close()
-    
-        @self.app.route("/api/create_category", methods=["POST"])           
-        def create_category():
-            connection = None
-            cursor = None
+                return jsonify(summary), 200
+            
+            except Exception as error:
+                return self.internal_error(error)
+
+        @self.app.route("/api/upload_image", methods=["POST"])
+        def upload_image():
             try:
                 if request.method != "POST":
                     return "Method Not Allowed", 405
                 
-                request_data = request.get_json()
-                
-                created_at = datetime.now()
-                updated_at = datetime.now()
+                max_bytes = self.image_store.max_bytes
+                if request.content_length is not None and request.content_length > max_bytes + 64 * 1024:
+                    return f"Payload Too Large - Images are limited to {max_bytes} bytes", 413
                 
-                if not "category_name" in request_data:
-                    return "Bad Request - Missing Parameters", 400
-                
-                # Make connection to Database
-                connection = self.database.db_connection()
-                cursor = connection.cursor()
-                query = (
-                    "INSERT INTO categories "
-                    "(name, created_at, updated_at)"
-                    "VALUES (%s, %s, %s)"
-                )
-                data = (
-                    request_data["category_name"],
-                    created_at,
-                    updated_at
-                )
-                cursor.execute(query, data)
-                # Make sure data is committed to the database
-                connection.commit()
-                
-                return "Category created successfully.", 200
+                # A raw image body, or the "image" field of a form upload
+                if request.mimetype == "multipart/form-data":
+                    upload = request.files.get("image")
+                    if upload is None:
+                        return "Bad Request - Missing image field", 400
+                    data = upload.stream.read(max_bytes + 1)
+                else:
+                    data = request.stream.read(max_bytes + 1)
+                if len(data) > max_bytes:
+                    return f"Payload Too Large - Images are limited to {max_bytes} bytes", 413
                 
-            except Exception as error:
-                self.logger.debug(error)
+                try:
+                    digest, created = self.image_store.save(data)
+                except ValueError as error:
+                    return f"Bad Request - {error}", 400
                 
-            finally:
-                if cursor is not None:
-                    cursor.close()
-                if connection is not None:
-                    connection.close()
-       
-        @self.app.route("/api/all_categories", methods=["GET"])         
-        def retrieve_all_categories():
-            connection = None
-            cursor = None
-            try:
-                if request.method != "GET":
-                    return "Method Not Allowed", 405
-                
-                connection = self.database.db_connection()
-                cursor = connection.cursor()
-                query = ("SELECT * FROM categories")
-                cursor.execute(query)
-                category_list_data = cursor.fetchall()
-                # Initialize empty list to store dictionaries representing cars
-                categories = []
-                for category_data in category_list_data:
-                    category = {
-                        "id": category_data[0],
-                        "name": category_data[1],
-                        "created_at": category_data[2],
-                        "updated_at": category_data[3]
-                    }
-                    categories.append(category)
-                
-                return jsonify(categories), 200
+                # Store the hash in car_image or brand_image
+                return jsonify(status="success", hash=digest, url=f"/api/image/{digest}"), 201 if created else 200
             
             except Exception as error:
-                self.logger.debug(error)
-                
-            finally:
-                if cursor is not None:
-                    cursor.close()
-                if connection is not None:
-                    connection.close()
-    
-        @self.app.route("/api/category/<id>", methods=["GET"])            
-        def retrieve_specific_category(id):
-            connection = None
-            cursor = None
+                return self.internal_error(error)
+        
+        @self.app.route("/api/image/<digest>", methods=["GET"])
+        def retrieve_image(digest):
             try:
                 if request.method != "GET":
                     return "Method Not Allowed", 405
                 
-                connection = self.database.db_connection()
-                cursor = connection.cursor()
-                query = ("SELECT * FROM categories WHERE id = %s")
-                cursor.execute(query, (id,))
-                category_data = cursor.fetchone()
-                # Initialize empty dictionaries
-                if category_data:
-                    category = {
-                        "id": category_data[0],
-                        "name": category_data[1],
-                        "created_at": category_data[2],
-                        "updated_at": category_data[3]
-                    }
-                    return jsonify(category), 200
+                format = request.args.get("format")
+                if format not in [None, "webp", "jpg"]:
+                    return "Bad Request - format must be webp or jpg", 400
+                try:
+                    width = int(request.args["width"]) if "width" in request.args else None
+                except ValueError:
+                    return "Bad Request - width must be a number", 400
+                
+                found = self.image_store.variant(digest, width, format)
+                if found is None:
+                    return f"Image {digest} not found", 404
+                path, content_type, final = found
+                
+                # Range, If-None-Match and If-Modified-Since are answered by send_file, the body goes out
+                # through the server's file wrapper, which uses sendfile() under gunicorn
+                response = send_file(path, mimetype=content_type, conditional=True, etag=os.path.basename(path))
+                if final:
+                    # The content of a hash never changes
+                    response.headers["Cache-Control"] = "public, max-age=31536000, immutable"
                 else:
-                    return f"Category for id = {id} not found", 404
+                    # The original stands in while the thumbnail is generated, ask again soon
+                    response.headers["Cache-Control"] = "public, max-age=60"
+                return response
             
             except Exception as error:
-                self.logger.debug(error)
-                
-            finally:
-                if cursor is not None:
-                    cursor.close()
-                if connection is not None:
-                    connection.close()
-     
-        @self.app.route("/api/update_category/<id>", methods=["PUT", "POST"])           
-        def update_specific_category(id):
-            connection = None
-            cursor = None
-            try:
-                if request.method not in ["POST", "PUT"]:
-                    return "Method Not Allowed", 405
-                
-                request_data = request.get_json()
-                
-                # Create a dictionary for dynamic update query
-                update_fields = {}
-                if "category_name" in request_data:
-                    update_fields["name"] = request_data["category_name"]
-                    
-                if not update_fields:
-                    return "Please enter at least one field to update.", 400
-                
-                update_fields["updated_at"] = datetime.now()
-                
-                connection = self.database.db_connection()
-                cursor = connection.cursor()
-                
-                # Return error message if id does not exists
-                cursor.execute("SELECT id FROM categories WHERE id = %s", (id,))
-                if not cursor.fetchone():
-                    return f"Update failed. Category for id = {id} not found.", 404
-                
-                # Build the SET clause dynamically
-                set_clause = ", ".join(f"{key} = %s" for key in update_fields.keys())
-                values = list(update_fields.values())
-                # Append the id at the end for the WHERE clause
-                values.append(id)
-                query = f"UPDATE categories SET {set_clause} WHERE id = %s"
-                cursor.execute(query, values)
-                # Make sure data is committed to the database
-                connection.commit()
-                return "Updated successfully.", 200
-                
-            except Exception as error:
-                self.logger.debug(error)
-                
-            finally:
-                if cursor is not None:
-                    cursor.close()
-                if connection is not None:
-                    connection.close()
-    
-        @self.app.route("/api/delete_category/<id>", methods=["DELETE"])         
-        def delete_specific_category(id):
-            connection = None
-            cursor = None
+                return self.internal_error(error)
+        
+        @self.app.route("/api/stats", methods=["GET"])
+        def retrieve_stats():
             try:
-                if request.method != "DELETE":
+                if request.method != "GET":
                     return "Method Not Allowed", 405
-                
-                connection = self.database.db_connection()
-                cursor = connection.cursor()
-                query = "DELETE FROM categories WHERE id = %s"
-                cursor.execute(query, (id,))
-                
-                if cursor.rowcount == 0:
-                    return f"Delete failed. Category for id = {id} not found", 404
-                
-                connection.commit()
-                return "Deleted successfully.", 200
-                
+
+                return jsonify(pool=self.database.pool_stats(), cache=self.cache.stats(), tokens=self.token_verifier.stats(), sweeper=self.token_sweeper.stats(), rate_limits=self.rate_limiter.stats(), images=self.image_store.stats(), hasher=self.password_hasher.stats(), search=self.search_index.stats(), logging=self.logger.stats(), replicas=self.database.replica_stats()), 200
+
             except Exception as error:
-                self.logger.debug(error)
-                
-            finally:
-                if cursor is not None:
-                    cursor.close()
-                if connection is not None:
-                    connection.close()
-     
-        @self.app.route("/api/create_colour", methods=["POST"])           
-        def create_colour():
+                return self.internal_error(error)
+
+        @self.app.route("/metrics", methods=["GET"])
+        def retrieve_metrics():
+            # Metrics of this worker process only, scrape every worker or run a single one
+            return self.metrics.render(), 200, {"Content-Type": "text/plain; version=0.0.4; charset=utf-8"}
+
+    def instrument(self) -> None:
+        self.metrics.describe("api_requests_total", "counter", "Requests by method, route and status code")
+        self.metrics.describe("api_request_duration_seconds", "histogram", "Time from the first hook until the response is returned")
+        self.metrics.describe("api_requests_in_flight", "gauge", "Requests being handled")
+        self.metrics.describe("api_exceptions_total", "counter", "Exceptions caught in route handlers")
+        self.metrics.describe("db_query_duration_seconds", "histogram", "cursor.execute time by statement and table")
+        self.metrics.describe("db_pool_acquire_seconds", "histogram", "Time waiting for a pooled connection")
+        self.metrics.describe("db_pool_connections", "gauge", "Pooled connections by state")
+        self.metrics.describe("db_replicas", "gauge", "Read replicas by health")
+        self.metrics.describe("db_replica_ejections_total", "counter", "Times a replica was taken out of the read rotation")
+        self.metrics.describe("bcrypt_duration_seconds", "histogram", "bcrypt time on the hashing pool")
+        self.metrics.describe("bcrypt_queue_seconds", "histogram", "Time a bcrypt job waited for a hashing thread")
+        self.metrics.describe("bcrypt_rejected_total", "counter", "Logins rejected because the hashing queue was full")
+        self.metrics.describe("bcrypt_jobs", "gauge", "bcrypt jobs by state")
+        self.metrics.describe("cache_entries", "gauge", "Records in the per-id cache")
+        self.metrics.describe("image_variants_total", "counter", "Thumbnail and WebP files written by the image process pool")
+        self.metrics.describe("rate_limited_total", "counter", "/api/auth requests answered with 429 by limit")
+        self.metrics.describe("token_sweeper_rows_total", "counter", "Access tokens moved and revocations purged by the sweeper")
+        self.metrics.describe("token_sweeper_lag_seconds", "gauge", "Age of the oldest row waiting for the sweeper at its last run")
+        self.metrics.collector(self.collect_metrics)
+        self.app.before_request(self.start_request)
+        self.app.after_request(self.record_request)
+        self.app.teardown_request(self.finish_request)
+
+    def route_label(self) -> str:
+        # The rule, e.g. /api/car/<id>, keeps the number of series bounded
+        return request.url_rule.rule if request.url_rule is not None else "unmatched"
+
+    def start_request(self) -> None:
+        g.request_started = time.perf_counter()
+        # Log lines written while handling the request carry its id, route and elapsed time
+        g.request_id = request.headers.get("X-Request-ID") or uuid.uuid4().hex
+        request_context.set({"request_id": g.request_id, "route": self.route_label(), "started": g.request_started})
+        self.metrics.add("api_requests_in_flight", (("route", self.route_label()),), 1)
+
+    def record_request(self, response):
+        started = g.get("request_started")
+        if started is not None:
+            route = self.route_label()
+            self.metrics.increment("api_requests_total", (("method", request.method), ("route", route), ("status", str(response.status_code))))
+            self.metrics.observe("api_request_duration_seconds", (("method", request.method), ("route", route)), time.perf_counter() - started)
+            self.logger.info("request", method=request.method, status=response.status_code)
+            response.headers["X-Request-ID"] = g.request_id
+        if request.method in ["POST", "PUT", "PATCH", "DELETE"] and response.status_code < 400:
+            self.wrote(response)
+        return response
+
+    def wrote(self, response) -> None:
+        self.last_write = time.monotonic()
+        if self.database.replica_backends and self.read_your_writes > 0:
+            # The cookie carries the time of the write, so it works across workers and API nodes
+            response.set_cookie("last_write", repr(time.time()), max_age=math.ceil(self.read_your_writes), httponly=True, samesite="Lax")
+
+    def wrote_recently(self) -> bool:
+        try:
+            last_write = float(request.cookies.get("last_write", 0))
+        except ValueError:
+            return False
+        return time.time() - last_write < self.read_your_writes
+
+    def read_connection(self):
+        # Replica connection for read-only handlers, unless this client has just written
+        return self.database.db_connection(read_only=not self.wrote_recently())
+
+    def cacheable(self, connection) -> bool:
+        # A replica may not have applied a write yet, its rows are only cached once the window has passed
+        return connection.pool_name == "primary" or time.monotonic() - self.last_write >= self.read_your_writes
+
+    def finish_request(self, exception) -> None:
+        if g.get("request_started") is not None:
+            self.metrics.add("api_requests_in_flight", (("route", self.route_label()),), -1)
+        # Threads are reused, the next request must not inherit this context
+        request_context.set(None)
+
+    def too_many_requests(self, limit, key):
+        retry_after = self.rate_limiter.check(limit, key)
+        if retry_after is None:
+            return None
+        return f"Too Many Requests - Try again in {retry_after} seconds.", 429, {"Retry-After": str(retry_after)}
+
+    def internal_error(self, error):
+        # Logged and counted instead of letting the handler return None
+        self.logger.exception(error)
+        self.metrics.increment("api_exceptions_total", (("route", self.route_label()), ("exception", type(error).__name__)))
+        return "Internal Server Error", 500
+
+    def collect_metrics(self) -> dict:
+        pool = self.database.pool_stats()
+        hasher = self.password_hasher.stats()
+        replicas = self.database.replica_stats()
+        healthy = sum(1 for replica in replicas if replica["healthy"])
+        sweep = self.token_sweeper.stats()["last_run"] or {}
+        return {
+            ("token_sweeper_lag_seconds", (("table", "access_tokens"),)): sweep.get("lag_seconds", 0.0),
+            ("token_sweeper_lag_seconds", (("table", "expired_access_tokens"),)): sweep.get("retention_lag_seconds", 0.0),
+            ("db_replicas", (("state", "healthy"),)): healthy,
+            ("db_replicas", (("state", "ejected"),)): len(replicas) - healthy,
+            ("db_pool_connections", (("state", "in_use"),)): pool["in_use"],
+            ("db_pool_connections", (("state", "idle"),)): pool["idle"],
+            ("db_pool_connections", (("state", "waiting"),)): pool["waiting"],
+            ("bcrypt_jobs", (("state", "running"),)): hasher["running"],
+            ("bcrypt_jobs", (("state", "queued"),)): hasher["queue_depth"],
+            ("cache_entries", ()): self.cache.stats()["entries"],
+        }
+
+    def add_resource_routes(self, name, resource) -> None:
+        table = resource["table"]
+        title = resource["title"]
+        keys = resource["keys"]
+        columns = self.database.columns[table]
+        
+        def validate(item):
+            return self.schema.validate(resource, item)
+        
+        def create():
             connection = None
-            cursor = None
             try:
                 if request.method != "POST":
                     return "Method Not Allowed", 405
                 
                 request_data = request.get_json()
                 
-                required_keys = [
-                    "colour_name",
-                    "hex_code",
-                ]
+                # A JSON array creates every record in one transaction
+                if isinstance(request_data, list):
+                    def on_created(ids, rows):
+                        for id, row in zip(ids, rows):
+                            self.index_created(resource, id, dict(zip(keys.values(), row)))
+                    return self.bulk_insert.create(table, keys, request_data, validate, on_created)
                 
-                if not all(key in request_data for key in required_keys):
+                if not isinstance(request_data, dict) or not all(key in request_data for key in keys):
                     return "Bad Request - Missing Parameters", 400
                 
-                created_at = datetime.now()
-                updated_at = datetime.now()
-                
-                # Regular expression to match hex colour code entered by user
-                hex_pattern = re.compile(r"^#([a-f0-9]{6}|[a-f0-9]{3})$", re.IGNORECASE)
+                error = validate(request_data)
+                if error:
+                    return error, 400
                 
-                # Check if the hex code entered by user is valid format
-                if not hex_pattern.match(request_data["hex_code"]):
-                    return "Invalid hex code", 400
+                created_at = datetime.now()
+                values = {column: request_data[key] for key, column in keys.items()}
                 
-                # Make connection to Database
                 connection = self.database.db_connection()
-                cursor = connection.cursor()
-                query = (
-                    "INSERT INTO colours "
-                    "(name, hex, created_at, updated_at)"
-                    "VALUES (%s, %s, %s, %s)"
-                )
-                data = (
-                    request_data["colour_name"],
-                    request_data["hex_code"],
-                    created_at,
-                    updated_at
-                )
-                cursor.execute(query, data)
+                cursor = self.queries.execute(connection, self.queries.get(table, "insert"), list(values.values()) + [created_at, created_at])
                 # Make sure data is committed to the database
                 connection.commit()
+                self.index_created(resource, cursor.lastrowid, values)
                 
-                return "Colour created successfully.", 200
-                
+                return f"{title} created successfully.", 200
+            
             except Exception as error:
-                self.logger.debug(error)
-                
+                return self.internal_error(error)
+            
             finally:
-                if cursor is not None:
-                    cursor.close()
                 if connection is not None:
                     connection.close()
-     
-        @self.app.route("/api/all_colours", methods=["GET"])           
-        def retrieve_all_colours():
+        
+        def retrieve_all():
             connection = None
             cursor = None
             try:
                 if request.method != "GET":
                     return "Method Not Allowed", 405
                 
-                connection = self.database.db_connection()
+                try:
+                    fields, after, limit, sort = self.pagination.parse(request.args, columns, self.filters.sortable[table])
+                    filters = self.filters.parse(table, request.args)
+                    expand = self.expansion.parse(request.args.get("expand")) if resource["expand"] else []
+                except ValueError as error:
+                    return f"Bad Request - {error}", 400
+                
+                if expand and self.streaming.requested(request):
+                    return "Bad Request - expand is not supported when streaming", 400
+                # Keep the foreign keys the expansion needs in the projection
+                if expand:
+                    fields = [column for column in columns if column in fields or column in self.expansion.required_fields(expand)]
+                
+                connection = self.read_connection()
+                if self.streaming.requested(request):
+                    # Full export from the cursor onwards, one JSON object per line
+                    query, params = self.pagination.query(table, fields, after, None, sort, filters)
+                    response = self.streaming.response(connection, query, params, fields)
+                    # The response closes the connection when the server closes the body
+                    connection = None
+                    return response, 200
+                
                 cursor = connection.cursor()
-                query = ("SELECT * FROM colours")
-                cursor.execute(query)
-                colour_list_data = cursor.fetchall()
-                # Initialize empty list to store dictionaries representing cars
-                colours = []
-                for colours_data in colour_list_data:
-                    colour = {
-                        "id": colours_data[0],
-                        "name": colours_data[1],
-                        "hex": colours_data[2],
-                        "created_at": colours_data[3],
-                        "updated_at": colours_data[4]
-                    }
-                    colours.append(colour)
-                
-                return jsonify(colours), 200
+                # Cheap aggregate first so an unchanged list is answered without reading rows
+                etag, last_modified = self.conditional.list_validators(cursor, table, request.args, self.expansion.related_tables(expand))
+                if self.conditional.not_modified(request, etag, last_modified):
+                    return self.conditional.not_modified_response(etag, last_modified)
+                
+                query, params = self.pagination.query(table, fields, after, limit, sort, filters)
+                cursor.execute(query, params)
+                # Keyset pagination on the sort column and id, filters and projection run in SQL
+                if expand:
+                    records, next_cursor = self.pagination.page(cursor.fetchall(), fields, limit, sort)
+                    # Related records are loaded with one batched query per relation
+                    self.expansion.expand(cursor, records, expand)
+                    response = jsonify(records)
+                else:
+                    # Plain pages are encoded straight from the cursor rows
+                    rows, next_cursor = self.pagination.page_rows(cursor.fetchall(), fields, limit, sort)
+                    response = self.app.json.rows_response(fields, rows)
+                response = self.pagination.add_headers(response, request, next_cursor)
+                
+                return self.conditional.add_headers(response, etag, last_modified), 200
             
             except Exception as error:
-                self.logger.debug(error)
+                return self.internal_error(error)
                 
             finally:
                 if cursor is not None:
                     cursor.close()
                 if connection is not None:
                     connection.close()
-         
-        @self.app.route("/api/colour/<id>", methods=["GET"])       
-        def retrieve_specific_colour(id):
+        
+        def retrieve_specific(id):
             connection = None
             cursor = None
             try:
                 if request.method != "GET":
                     return "Method Not Allowed", 405
                 
-                connection = self.database.db_connection()
-                cursor = connection.cursor()
-                query = ("SELECT * FROM colours WHERE id = %s")
-                cursor.execute(query, (id,))
-                colour_data = cursor.fetchone()
-                # Initialize empty dictionaries
-                if colour_data:
-                    colour = {
-                        "id": colour_data[0],
-                        "name": colour_data[1],
-                        "hex": colour_data[2],
-                        "created_at": colour_data[3],
-                        "updated_at": colour_data[4]
-                    }
-                    return jsonify(colour), 200
-                else:
-                    return f"Colour for id = {id} not found", 404
+                try:
+                    expand = self.expansion.parse(request.args.get("expand")) if resource["expand"] else []
+                except ValueError as error:
+                    return f"Bad Request - {error}", 400
+                
+                cache_key = (table, str(id))
+                record = self.cache.get(cache_key)
+                if record is None:
+                    # Remember the cache generation so a concurrent update is not overwritten
+                    generation = self.cache.generation()
+                    
+                    connection = self.read_connection()
+                    record = self.queries.fetch_one(connection, self.queries.get(table, "select"), (id,))
+                    if record is None:
+                        return f"{title} for id = {id} not found", 404
+                    if self.cacheable(connection):
+                        self.cache.set(cache_key, record, generation)
+                
+                if expand:
+                    # Copy so the cached row is never modified
+                    record = dict(record)
+                    if connection is None:
+                        connection = self.read_connection()
+                    cursor = connection.cursor()
+                    self.expansion.expand(cursor, [record], expand)
+                
+                # Answer 304 before serializing when the client copy is still current
+                etag, last_modified = self.conditional.row_validators(table, record)
+                if self.conditional.not_modified(request, etag, last_modified):
+                    return self.conditional.not_modified_response(etag, last_modified)
+                return self.conditional.add_headers(jsonify(record), etag, last_modified), 200
             
             except Exception as error:
-                self.logger.debug(error)
+                return self.internal_error(error)
                 
             finally:
                 if cursor is not None:
                     cursor.close()
                 if connection is not None:
                     connection.close()
-    
-        @self.app.route("/api/update_colour/<id>", methods=["PUT", "POST"])        
-        def update_specific_colour(id):
+        
+        def update_specific(id):
             connection = None
-            cursor = None
             try:
                 if request.method not in ["POST", "PUT"]:
                     return "Method Not Allowed", 405
                 
                 request_data = request.get_json()
                 
-                # Create a dictionary for dynamic update query
-                update_fields = {}
-                if "colour_name" in request_data:
-                    update_fields["name"] = request_data["colour_name"]
-                
-                # Regular expression to match hex colour code entered by user
-                hex_pattern = re.compile(r"^#([a-f0-9]{6}|[a-f0-9]{3})$", re.IGNORECASE)
+                # Columns are always in schema order so each combination maps to one compiled query
+                update_fields = {column: request_data[key] for key, column in keys.items() if key in request_data}
                 
-                # Check if the hex code entered by user is valid format
-                if "hex_code" in request_data:
-                    if not hex_pattern.match(request_data["hex_code"]):
-                        return "Invalid hex code", 400
-                    update_fields["hex"] = request_data["hex_code"]
+                error = validate(request_data)
+                if error:
+                    return error, 400
                     
                 if not update_fields:
                     return "Please enter at least one field to update.", 400
@@ -799,247 +673,87 @@ class Api:
                 update_fields["updated_at"] = datetime.now()
                 
                 connection = self.database.db_connection()
-                cursor = connection.cursor()
                 
                 # Return error message if id does not exists
-                cursor.execute("SELECT id FROM colours WHERE id = %s", (id,))
-                if not cursor.fetchone():
-                    return f"Update failed. Colour for id = {id} not found.", 404
-                
-                # Build the SET clause dynamically
-                set_clause = ", ".join(f"{key} = %s" for key in update_fields.keys())
-                values = list(update_fields.values())
-                # Append the id at the end for the WHERE clause
-                values.append(id)
-                query = f"UPDATE colours SET {set_clause} WHERE id = %s"
-                cursor.execute(query, values)
+                if self.queries.fetch_one(connection, self.queries.get(table, "exists"), (id,)) is None:
+                    return f"Update failed. {title} for id = {id} not found.", 404
+                
+                query = self.queries.update(table, list(update_fields))
+                self.queries.execute(connection, query, list(update_fields.values()) + [id])
                 # Make sure data is committed to the database
                 connection.commit()
+                self.cache.invalidate((table, str(id)))
+                self.index_updated(resource, int(id), update_fields)
                 return "Updated successfully.", 200
                 
             except Exception as error:
-                self.logger.debug(error)
+                return self.internal_error(error)
                 
             finally:
-                if cursor is not None:
-                    cursor.close()
                 if connection is not None:
                     connection.close()
-         
-        @self.app.route("/api/delete_colour/<id>", methods=["DELETE"])       
-        def delete_specific_colour(id):
+        
+        def delete_specific(id):
             connection = None
-            cursor = None
             try:
                 if request.method != "DELETE":
                     return "Method Not Allowed", 405
                 
                 connection = self.database.db_connection()
-                cursor = connection.cursor()
-                query = "DELETE FROM colours WHERE id = %s"
-                cursor.execute(query, (id,))
+                cursor = self.queries.execute(connection, self.queries.get(table, "delete"), (id,))
                 
                 if cursor.rowcount == 0:
-                    return f"Delete failed. Colour for id = {id} not found", 404
+                    return f"Delete failed. {title} for id = {id} not found", 404
                 
                 connection.commit()
+                self.cache.invalidate((table, str(id)))
+                self.index_deleted(resource, int(id))
                 return "Deleted successfully.", 200
                 
-            except Exception as error:
-                self.logger.debug(error)
-                
-            finally:
-                if cursor is not None:
-                    cursor.close()
-                if connection is not None:
-                    connection.close()
-       
-        @self.app.route("/api/auth", methods=["POST"])         
-        def authenticate_user():
-            connection = None
-            cursor = None
-            try:
-                if request.method != "POST":
-                    return "Method Not Allowed", 405
-                
-                auth_data = request.get_json()
-                
-                required_keys = [
-                    "email",
-                    "password",
-                ]
-                
-                if not all(key in auth_data for key in required_keys):
-                    return "Bad Request - Missing Parameters", 400
-                
-                email = auth_data["email"]
-                password = auth_data["password"]
-                
-                connection = self.database.db_connection()
-                cursor = connection.cursor()
-                query = "SELECT * FROM users where email = %s"
-                cursor.execute(query, (email,))
-                user = cursor.fetchone()
-                
-                if not user:
-                    return "Email does not exists in the record.", 401
-                
-                email = user[1]
-                password_db = user[2]
-                
-                # Converting entered password to bytes 
-                encoded_password = password.encode("utf-8")
-                # Convert password in db to bytes
-                
-                encoded_password_db = password_db.encode("utf-8")
-                # Checking password entered with the password in db
-                correct_password = bcrypt.checkpw(encoded_password, encoded_password_db)
-                
-                if not correct_password:
-                    return "Password is not matching with our record.", 401
-                
-                # Get current time
-                current_time = datetime.now()
-                
-                # Invalidate old tokens
-                token_query = "SELECT * FROM access_tokens where email = %s"
-                cursor.execute(token_query, (email,))
-                old_token = cursor.fetchone()
-                if old_token:
-                    # Make old_token mutable
-                    mutable_old_token = list(old_token)
-                    mutable_old_token[5] = current_time
-                    mutable_old_token[6] = current_time
-                    # Add expired token to expired token table
-                    query = (
-                        "INSERT INTO expired_access_tokens "
-                        "(jti, token, email, created_at, updated_at, expired_at) "
-                        "VALUES (%s, %s, %s, %s, %s, %s)"
-                    )
-                    
-                    data = (
-                        old_token[1],
-                        old_token[2],
-                        old_token[3],
-                        old_token[4],
-                        mutable_old_token[5],
-                        mutable_old_token[6]
-                    )
-                    
-                    cursor.execute(query, data)
-                    # Make sure data is committed to the database
-                    connection.commit()
-                    # Delete old token in access token table
-                    cursor.execute("DELETE FROM access_tokens WHERE email = %s", (email,))
-                    connection.commit()
-                    
-                # Create new token
-                secret_key = secrets.token_hex(32)
-                jti = uuid.uuid4().hex
-                created_at = current_time
-                updated_at = current_time
-                expired_at = current_time + timedelta(days=1)
-                
-                jwt_payload = {
-                    "jti": jti,
-                    "exp": expired_at,
-                    "email": email,
-                }
-                
-                token = jwt.encode(jwt_payload, secret_key, algorithm="HS256")
-                # Save token in access token table
-                query = (
-                    "INSERT INTO access_tokens "
-                    "(jti, token, email, created_at, updated_at, expired_at) "
-                    "VALUES (%s, %s, %s, %s, %s, %s)"
-                )
-                
-                new_data = (
-                    jti,
-                    token,
-                    email,
-                    created_at,
-                    updated_at,
-                    expired_at
-                )
-                
-                cursor.execute(query, new_data)
-                # Make sure data is committed to the database
-                connection.commit()
-                
-                return jsonify(status="success", token=token), 200
+            except self.database.backend.integrity_errors:
+                # Still referenced by car_colours, the release rolls the delete back
+                return f"Delete failed. {title} for id = {id} is still in use", 409
                 
             except Exception as error:
-                self.logger.debug(error)
+                return self.internal_error(error)
                 
             finally:
-                if cursor is not None:
-                    cursor.close()
-                if connection is not None:
-                    connection.close()
-                    
-        @self.app.route("/api/logout", methods=["POST"])         
-        def logout_user():
-            connection = None
-            cursor = None
-            try:
-                if request.method != "POST":
-                    return "Method Not Allowed", 405
-                
-                headers = request.headers["Authorization"]
-                token = headers.split()[1]
-                if not token:
-                    return "Logout failed - User Unauthorized.", 401
-                
-                connection = self.database.db_connection()
-                cursor = connection.cursor()
-                find_query = "SELECT * FROM access_tokens where token = %s"
-                cursor.execute(find_query, (token,))
-                token_data = cursor.fetchone()
-                if not token_data:
-                    return "Forbidden - Token expired or not found.", 403
-                
-                # Make token mutable
-                mutable_token_data = list(token)
-                # Get current time to update field updated_at and expired_at
-                current_time = datetime.now()
-                mutable_token_data[5] = current_time
-                mutable_token_data[6] = current_time
-                
-                # Add expired token to expired token table
-                insert_query = (
-                    "INSERT INTO expired_access_tokens "
-                    "(jti, token, email, created_at, updated_at, expired_at) "
-                    "VALUES (%s, %s, %s, %s, %s, %s)"
-                )
-                
-                data = (
-                    token_data[1],
-                    token_data[2],
-                    token_data[3],
-                    token_data[4],
-                    mutable_token_data[5],
-                    mutable_token_data[6]
-                )
-                
-                cursor.execute(insert_query, data)
-                # Make sure data is committed to the database
-                connection.commit()
-                # Delete old token in access token table
-                cursor.execute("DELETE FROM access_tokens WHERE token = %s", (token,))
-                connection.commit()
-                
-                return "Logout successful.", 200
-                
-            
-            except Exception as error:
-                self.logger.debug(error)
-                
-            finally:
-                if cursor is not None:
-                    cursor.close()
                 if connection is not None:
                     connection.close()
+        
+        # Endpoint names match the functions the routes used to be written as
+        plural = resource["plural"]
+        self.app.add_url_rule(f"/api/create_{name}", f"create_{name}", create, methods=["POST"])
+        self.app.add_url_rule(f"/api/all_{plural}", f"retrieve_all_{plural}", retrieve_all, methods=["GET"])
+        self.app.add_url_rule(f"/api/{name}/<id>", f"retrieve_specific_{name}", retrieve_specific, methods=["GET"])
+        self.app.add_url_rule(f"/api/update_{name}/<id>", f"update_specific_{name}", update_specific, methods=["PUT", "POST"])
+        self.app.add_url_rule(f"/api/delete_{name}/<id>", f"delete_specific_{name}", delete_specific, methods=["DELETE"])
+    
+    def index_created(self, resource, id, values) -> None:
+        # values maps column names to the inserted values
+        if resource["search"] == "car":
+            self.search_index.add(id, values["name"], values["model"], values["description"], values["brand_id"], values["category_id"])
+        elif resource["search"] == "brand":
+            # Cars may already point at the new id, they get the name in their documents
+            self.search_index.rename_brand(id, values["name"])
+        elif resource["search"] == "category":
+            self.search_index.rename_category(id, values["name"])
+    
+    def index_updated(self, resource, id, update_fields) -> None:
+        if resource["search"] == "car":
+            self.search_index.update(id, update_fields)
+        elif resource["search"] == "brand" and "name" in update_fields:
+            self.search_index.rename_brand(id, update_fields["name"])
+        elif resource["search"] == "category" and "name" in update_fields:
+            self.search_index.rename_category(id, update_fields["name"])
+    
+    def index_deleted(self, resource, id) -> None:
+        if resource["search"] == "car":
+            self.search_index.remove(id)
+        elif resource["search"] == "brand":
+            self.search_index.rename_brand(id, None)
+        elif resource["search"] == "category":
+            self.search_index.rename_category(id, None)
 
 # Run flask
 if __name__ == "__main__":
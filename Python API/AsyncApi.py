@@ -0,0 +1,413 @@
+import asyncio
+import os
+import uuid
+import aiomysql
+from quart import Quart, Response
+from quart import request, jsonify
+from quart_cors import cors
+from Database import Database
+from AccessTokens import AccessTokens
+from Logger import Logger
+from Cache import Cache
+from Conditional import Conditional
+from Pagination import Pagination
+from Filters import Filters
+from TokenVerifier import TokenVerifier, TokenError
+from PasswordHasher import PasswordHasher, HasherBusy
+from RateLimiter import RateLimiter, MemoryBuckets, SQLiteBuckets
+from BulkInsert import BulkInsert
+from SearchIndex import SearchIndex
+from Schema import Schema
+from QueryRegistry import QueryRegistry
+from datetime import datetime
+
+
+class AsyncApi:
+
+    def __init__(self) -> None:
+        self.app = Quart(__name__)
+        self.app = cors(self.app, expose_headers=["X-Next-Cursor", "Link", "ETag", "Retry-After"])
+        # Database is still used for its credentials and by the background threads
+        self.database = Database()
+        if self.database.backend.name != "mysql":
+            raise ValueError("AsyncApi needs the mysql backend, aiomysql has no SQLite driver")
+        self.logger = Logger()
+        self.cache = Cache(
+            max_entries=int(os.environ.get("API_CACHE_MAX_ENTRIES", 10000)),
+            max_bytes=int(os.environ["API_CACHE_MAX_BYTES"]) if "API_CACHE_MAX_BYTES" in os.environ else None,
+            ttl=float(os.environ.get("API_CACHE_TTL", 2))
+        )
+        self.conditional = Conditional()
+        self.token_verifier = TokenVerifier(self.database, self.logger)
+        # Same login and logout statements as Api, run with awaiting cursors
+        self.access_tokens = AccessTokens(self.database)
+        self.password_hasher = PasswordHasher(
+            workers=int(os.environ.get("API_HASH_WORKERS", 4)),
+            queue_size=int(os.environ.get("API_HASH_QUEUE_SIZE", 32)),
+            queue_timeout=float(os.environ.get("API_HASH_QUEUE_TIMEOUT", 0.5))
+        )
+        # Same /api/auth limits and environment variables as Api
+        self.rate_limiter = RateLimiter(
+            {
+                name: limit for name, limit in [
+                    ("global", RateLimiter.parse(os.environ.get("API_AUTH_LIMIT_GLOBAL", "50/1"))),
+                    ("ip", RateLimiter.parse(os.environ.get("API_AUTH_LIMIT_IP", "20/60"))),
+                    ("email", RateLimiter.parse(os.environ.get("API_AUTH_LIMIT_EMAIL", "10/60"))),
+                ] if limit is not None
+            },
+            store=SQLiteBuckets(os.environ["API_RATE_LIMIT_FILE"]) if os.environ.get("API_RATE_LIMIT_FILE") else MemoryBuckets(int(os.environ.get("API_RATE_LIMIT_MAX_KEYS", 100000))),
+            logger=self.logger
+        )
+        self.bulk_insert = BulkInsert(self.database)
+        self.search_index = SearchIndex(self.database, self.logger)
+        self.pagination = Pagination()
+        self.filters = Filters()
+        # Same resources and compiled queries as Api, aiomysql has no server-side prepared statements
+        self.schema = Schema()
+        self.queries = QueryRegistry(self.schema, self.database.columns)
+        self.pool = None
+        self.app.before_serving(self.startup)
+        self.app.after_serving(self.shutdown)
+        self.routes()
+
+    async def startup(self) -> None:
+        # One async pool per worker process, sized like the sync pool
+        self.pool = await aiomysql.create_pool(
+            host=self.database.host,
+            user=self.database.user,
+            password=self.database.password,
+            db=self.database.database_name,
+            minsize=1,
+            maxsize=self.database.pool_size + self.database.pool_max_overflow,
+            pool_recycle=self.database.pool_recycle,
+            autocommit=False
+        )
+        # The revocation sync and the search index keep using the sync driver on their own threads
+        await asyncio.to_thread(self.token_verifier.ensure_sync_thread)
+        self.search_index.start()
+
+    async def shutdown(self) -> None:
+        if self.pool is not None:
+            self.pool.close()
+            await self.pool.wait_closed()
+
+    def routes(self):
+        for name, resource in self.schema.resources.items():
+            self.add_resource_routes(name, resource)
+
+        @self.app.route("/api/auth", methods=["POST"])
+        async def authenticate_user():
+            try:
+                # The limits are checked in the same order as Api, the shared global budget last
+                limited = await self.too_many_requests("ip", request.remote_addr)
+                if limited:
+                    return limited
+
+                auth_data = await request.get_json()
+                if not auth_data or not all(key in auth_data for key in ["email", "password"]):
+                    return "Bad Request - Missing Parameters", 400
+
+                limited = await self.too_many_requests("email", str(auth_data["email"]).strip().lower()) or await self.too_many_requests("global", "all")
+                if limited:
+                    return limited
+
+                queries = self.access_tokens.queries
+                async with self.pool.acquire() as connection:
+                    async with connection.cursor() as cursor:
+                        # The user and the tokens this login replaces in one query
+                        await cursor.execute(queries["find_user"], (auth_data["email"],))
+                        user, old_tokens = self.access_tokens.user_from_rows(await cursor.fetchall())
+                    await connection.rollback()
+                if not user:
+                    return "Email does not exists in the record.", 401
+                email, password_db = user
+
+                try:
+                    # bcrypt runs on the hashing pool with no connection held, the event loop only waits for it
+                    correct_password = await asyncio.to_thread(
+                        self.password_hasher.check,
+                        auth_data["password"].encode("utf-8"),
+                        password_db.encode("utf-8")
+                    )
+                except HasherBusy:
+                    return "Service Unavailable - Too many login attempts, try again later.", 503, {"Retry-After": "1"}
+                if not correct_password:
+                    return "Password is not matching with our record.", 401
+
+                current_time = datetime.now()
+                jti = uuid.uuid4().hex
+                token = self.token_verifier.issue(email, jti)
+                # Expire every old token and save the new one in a single transaction
+                async with self.pool.acquire() as connection:
+                    async with connection.cursor() as cursor:
+                        try:
+                            await cursor.execute(queries["expire_email"], (current_time, current_time, email))
+                            await cursor.execute(queries["delete_email"], (email,))
+                            await cursor.execute(queries["insert"], (jti, token, email, current_time, current_time, current_time + self.token_verifier.lifetime))
+                            await connection.commit()
+                        except Exception:
+                            await connection.rollback()
+                            raise
+                for old_jti, old_created_at in old_tokens:
+                    self.token_verifier.revoke(old_jti, old_created_at)
+
+                return jsonify(status="success", token=token), 200
+
+            except Exception as error:
+                self.logger.debug(error)
+                return "Internal Server Error", 500
+
+        @self.app.route("/api/logout", methods=["POST"])
+        async def logout_user():
+            try:
+                parts = request.headers.get("Authorization", "").split()
+                if len(parts) != 2 or parts[0].lower() != "bearer":
+                    return "Unauthorized - Missing bearer token.", 401
+                try:
+                    claims = self.token_verifier.verify(parts[1])
+                except TokenError as error:
+                    return f"Unauthorized - {error}.", 401
+
+                queries = self.access_tokens.queries
+                current_time = datetime.now()
+                async with self.pool.acquire() as connection:
+                    async with connection.cursor() as cursor:
+                        # Move the token to expired_access_tokens, one transaction and no read first
+                        try:
+                            await cursor.execute(queries["expire_token"], (current_time, current_time, parts[1]))
+                            if cursor.rowcount == 0:
+                                await connection.rollback()
+                                return "Forbidden - Token expired or not found.", 403
+                            await cursor.execute(queries["delete_token"], (parts[1],))
+                            await connection.commit()
+                        except Exception:
+                            await connection.rollback()
+                            raise
+                self.token_verifier.revoke(claims["jti"], expires_at=claims["exp"])
+
+                return "Logout successful.", 200
+
+            except Exception as error:
+                self.logger.debug(error)
+                return "Internal Server Error", 500
+
+        @self.app.route("/api/search", methods=["GET"])
+        async def search_cars():
+            query = request.args.get("q", "")
+            if not query.strip():
+                return "Bad Request - Missing search query", 400
+            try:
+                limit = min(max(int(request.args.get("limit", 20)), 1), 100)
+            except ValueError:
+                return "Bad Request - limit must be an integer", 400
+            if not self.search_index.ready:
+                return "Service Unavailable - Search index is still building.", 503, {"Retry-After": "5"}
+            return jsonify(self.search_index.search(query, limit)), 200
+
+        @self.app.route("/api/stats", methods=["GET"])
+        async def retrieve_stats():
+            pool = {
+                "size": self.pool.size,
+                "free": self.pool.freesize,
+                "max": self.pool.maxsize,
+            }
+            return jsonify(
+                pool=pool,
+                cache=self.cache.stats(),
+                tokens=self.token_verifier.stats(),
+                rate_limits=self.rate_limiter.stats(),
+                hasher=self.password_hasher.stats(),
+                search=self.search_index.stats()
+            ), 200
+
+    async def too_many_requests(self, limit, key):
+        if isinstance(self.rate_limiter.store, SQLiteBuckets):
+            # Shared buckets may wait for the file lock, that must not stall the event loop
+            retry_after = await asyncio.to_thread(self.rate_limiter.check, limit, key)
+        else:
+            retry_after = self.rate_limiter.check(limit, key)
+        if retry_after is None:
+            return None
+        return f"Too Many Requests - Try again in {retry_after} seconds.", 429, {"Retry-After": str(retry_after)}
+
+    def add_resource_routes(self, name, resource) -> None:
+        table = resource["table"]
+        title = resource["title"]
+        keys = resource["keys"]
+        columns = self.database.columns[table]
+
+        def validate(item):
+            return self.schema.validate(resource, item)
+
+        async def create():
+            try:
+                request_data = await request.get_json()
+                items = request_data if isinstance(request_data, list) else [request_data]
+                # Single objects keep their old error messages
+                if not isinstance(request_data, list):
+                    if not isinstance(request_data, dict) or not all(key in request_data for key in keys):
+                        return "Bad Request - Missing Parameters", 400
+                    if validate(request_data):
+                        return validate(request_data), 400
+                else:
+                    rejection = self.bulk_insert.check_size(items)
+                    if rejection is not None:
+                        return rejection
+
+                rows, errors = self.bulk_insert.prepare(keys, items, validate)
+                if errors:
+                    return jsonify(status="failed", errors=errors), 400
+
+                async with self.pool.acquire() as connection:
+                    async with connection.cursor() as cursor:
+                        await cursor.executemany(self.bulk_insert.insert_query(table, keys), rows)
+                        first_id = cursor.lastrowid
+                        await connection.commit()
+
+                ids = list(range(first_id, first_id + len(rows)))
+                if table == "cars":
+                    for car_id, row in zip(ids, rows):
+                        self.search_index.add(car_id, row[0], row[1], row[2], row[4], row[5])
+                elif table == "brands":
+                    for brand_id, row in zip(ids, rows):
+                        self.search_index.rename_brand(brand_id, row[0])
+                elif table == "categories":
+                    for category_id, row in zip(ids, rows):
+                        self.search_index.rename_category(category_id, row[0])
+                if not isinstance(request_data, list):
+                    return f"{title} created successfully.", 200
+                return jsonify(status="success", ids=ids), 200
+
+            except Exception as error:
+                self.logger.debug(error)
+                return "Internal Server Error", 500
+
+        async def retrieve_all():
+            try:
+                try:
+                    fields, after, limit, sort = self.pagination.parse(request.args, columns, self.filters.sortable[table])
+                    filters = self.filters.parse(table, request.args)
+                except ValueError as error:
+                    return f"Bad Request - {error}", 400
+
+                async with self.pool.acquire() as connection:
+                    async with connection.cursor() as cursor:
+                        await cursor.execute(self.conditional.aggregate_query(table))
+                        etag, last_modified = self.conditional.validators_from_aggregates(table, await cursor.fetchall(), request.args)
+                        if self.conditional.not_modified(request, etag, last_modified):
+                            return self.conditional.not_modified_response(etag, last_modified, Response)
+
+                        query, params = self.pagination.query(table, fields, after, limit, sort, filters)
+                        await cursor.execute(query, params)
+                        records, next_cursor = self.pagination.page(await cursor.fetchall(), fields, limit, sort)
+                    await connection.rollback()
+
+                response = self.pagination.add_headers(jsonify(records), request, next_cursor)
+                return self.conditional.add_headers(response, etag, last_modified), 200
+
+            except Exception as error:
+                self.logger.debug(error)
+                return "Internal Server Error", 500
+
+        async def retrieve_specific(id):
+            try:
+                cache_key = (table, str(id))
+                record = self.cache.get(cache_key)
+                if record is None:
+                    generation = self.cache.generation()
+                    async with self.pool.acquire() as connection:
+                        async with connection.cursor() as cursor:
+                            query = self.queries.get(table, "select")
+                            await cursor.execute(query, (id,))
+                            row = await cursor.fetchone()
+                            convert = self.queries.converter(query, cursor)
+                        await connection.rollback()
+                    if not row:
+                        return f"{title} for id = {id} not found", 404
+                    record = convert(row)
+                    self.cache.set(cache_key, record, generation)
+
+                etag, last_modified = self.conditional.row_validators(table, record)
+                if self.conditional.not_modified(request, etag, last_modified):
+                    return self.conditional.not_modified_response(etag, last_modified, Response)
+                return self.conditional.add_headers(jsonify(record), etag, last_modified), 200
+
+            except Exception as error:
+                self.logger.debug(error)
+                return "Internal Server Error", 500
+
+        async def update_specific(id):
+            try:
+                request_data = await request.get_json()
+                update_fields = {column: request_data[key] for key, column in keys.items() if key in (request_data or {})}
+                if validate(request_data or {}):
+                    return validate(request_data), 400
+                if not update_fields:
+                    return "Please enter at least one field to update.", 400
+                update_fields["updated_at"] = datetime.now()
+
+                async with self.pool.acquire() as connection:
+                    async with connection.cursor() as cursor:
+                        await cursor.execute(self.queries.get(table, "exists"), (id,))
+                        if not await cursor.fetchone():
+                            await connection.rollback()
+                            return f"Update failed. {title} for id = {id} not found.", 404
+                        await cursor.execute(self.queries.update(table, list(update_fields)), list(update_fields.values()) + [id])
+                        await connection.commit()
+
+                self.cache.invalidate((table, str(id)))
+                if table == "cars":
+                    self.search_index.update(int(id), update_fields)
+                elif table == "brands" and "name" in update_fields:
+                    self.search_index.rename_brand(int(id), update_fields["name"])
+                elif table == "categories" and "name" in update_fields:
+                    self.search_index.rename_category(int(id), update_fields["name"])
+                return "Updated successfully.", 200
+
+            except Exception as error:
+                self.logger.debug(error)
+                return "Internal Server Error", 500
+
+        async def delete_specific(id):
+            try:
+                async with self.pool.acquire() as connection:
+                    async with connection.cursor() as cursor:
+                        try:
+                            await cursor.execute(self.queries.get(table, "delete"), (id,))
+                        except aiomysql.IntegrityError:
+                            # Still referenced by car_colours, same answer as the Flask API
+                            await connection.rollback()
+                            return f"Delete failed. {title} for id = {id} is still in use", 409
+                        if cursor.rowcount == 0:
+                            await connection.rollback()
+                            return f"Delete failed. {title} for id = {id} not found", 404
+                        await connection.commit()
+
+                self.cache.invalidate((table, str(id)))
+                if table == "cars":
+                    self.search_index.remove(int(id))
+                elif table == "brands":
+                    self.search_index.rename_brand(int(id), None)
+                elif table == "categories":
+                    self.search_index.rename_category(int(id), None)
+                return "Deleted successfully.", 200
+
+            except Exception as error:
+                self.logger.debug(error)
+                return "Internal Server Error", 500
+
+        # Same URLs as the Flask routes, endpoint names must be unique per resource
+        self.app.add_url_rule(f"/api/create_{name}", f"create_{name}", create, methods=["POST"])
+        self.app.add_url_rule(f"/api/all_{resource['plural']}", f"retrieve_all_{resource['plural']}", retrieve_all, methods=["GET"])
+        self.app.add_url_rule(f"/api/{name}/<id>", f"retrieve_specific_{name}", retrieve_specific, methods=["GET"])
+        self.app.add_url_rule(f"/api/update_{name}/<id>", f"update_specific_{name}", update_specific, methods=["PUT", "POST"])
+        self.app.add_url_rule(f"/api/delete_{name}/<id>", f"delete_specific_{name}", delete_specific, methods=["DELETE"])
+
+
+def create_app():
+    # Entry point for ASGI servers, e.g. uvicorn --factory AsyncApi:create_app
+    return AsyncApi().app
+
+
+if __name__ == "__main__":
+    AsyncApi().app.run(host="0.0.0.0", port=5001)
@@ -0,0 +1,380 @@
+import os
+import re
+import sqlite3
+import threading
+from datetime import date, datetime
+from urllib.parse import quote
+
+
+class Backend:
+
+    # Every query in the API is written with %s placeholders, backends with another style translate them
+    paramstyle = "format"
+    name = None
+    # Exceptions raised for constraint violations, e.g. deleting a colour that cars still use
+    integrity_errors = ()
+    # Upper bound on open connections, None when the server decides
+    max_connections = None
+
+    def connect(self):
+        raise NotImplementedError
+
+    def close(self) -> None:
+        pass
+
+    def column_type(self, kind) -> str:
+        return kind
+
+    def table_options(self) -> str:
+        return ""
+
+    def create_table(self, name, definition) -> str:
+        # definition is {"columns": [(name, type, options)], "keys": [...]}, see Database.create_tables
+        parts = []
+        for column, kind, options in definition["columns"]:
+            parts.append(f"`{column}` {self.column_type(kind)} {options}".rstrip())
+        parts.extend(self.key_definition(name, key) for key in self.table_keys(definition))
+        return f"CREATE TABLE IF NOT EXISTS `{name}` ({', '.join(parts)}){self.table_options()}"
+
+    def table_keys(self, definition) -> list:
+        return definition.get("keys", [])
+
+    def key_definition(self, table, key) -> str:
+        kind = key[0]
+        if kind == "primary":
+            return f"PRIMARY KEY ({', '.join(key[1])})"
+        if kind == "unique":
+            return f"CONSTRAINT `{key[1]}` UNIQUE ({', '.join(key[2])})"
+        if kind == "foreign":
+            return f"FOREIGN KEY ({key[1]}) REFERENCES {key[2]} ON UPDATE CASCADE"
+        raise ValueError(f"Unknown key {kind}")
+
+    def create_index(self, table, name, columns, unique=False) -> str:
+        return f"CREATE {'UNIQUE ' if unique else ''}INDEX `{name}` ON `{table}` ({', '.join(columns)})"
+
+    def index_exists(self, cursor, table, name) -> bool:
+        raise NotImplementedError
+
+    def primary_key_name(self, table) -> str:
+        raise NotImplementedError
+
+    def add_primary_key(self, table, columns) -> str:
+        raise NotImplementedError
+
+    def drop_temporary_table(self, name) -> str:
+        raise NotImplementedError
+
+    def full_scans(self, connection, query, params) -> list:
+        # Tables the query can only read with a full scan
+        raise NotImplementedError
+
+    def first_insert_id(self, cursor, count) -> int:
+        # Id of the first row written by the last executemany INSERT of count rows
+        raise NotImplementedError
+
+    def replica_lag(self, connection):
+        # Seconds a replica is behind its primary, None when it is not replicating
+        return 0
+
+
+class MySQLBackend(Backend):
+
+    name = "mysql"
+
+    def __init__(self, settings) -> None:
+        # Imported here so SQLite deployments do not need the MySQL driver
+        import mysql.connector
+        self.driver = mysql.connector
+        self.host = settings["host"]
+        self.user = settings["user"]
+        self.password = settings["password"]
+        self.database_name = settings["database"]
+        self.integrity_errors = (mysql.connector.IntegrityError,)
+
+    def connect(self):
+        return self.driver.connect(
+            user=self.user,
+            password=self.password,
+            host=self.host,
+            database=self.database_name
+        )
+
+    def column_type(self, kind) -> str:
+        return {
+            "id": "bigint(20) UNSIGNED NOT NULL AUTO_INCREMENT",
+            "bigint": "bigint(20) UNSIGNED",
+            "int": "int UNSIGNED",
+        }.get(kind, kind)
+
+    def table_keys(self, definition) -> list:
+        keys = definition.get("keys", [])
+        if any(kind == "id" for _, kind, _ in definition["columns"]):
+            keys = [("primary", ["id"])] + keys
+        return keys
+
+    def table_options(self) -> str:
+        return " ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci"
+
+    def index_exists(self, cursor, table, name) -> bool:
+        cursor.execute(
+            "SELECT 1 FROM information_schema.statistics "
+            "WHERE table_schema = DATABASE() AND table_name = %s AND index_name = %s LIMIT 1",
+            (table, name)
+        )
+        return cursor.fetchone() is not None
+
+    def primary_key_name(self, table) -> str:
+        return "PRIMARY"
+
+    def add_primary_key(self, table, columns) -> str:
+        return f"ALTER TABLE `{table}` ADD PRIMARY KEY ({', '.join(columns)})"
+
+    def drop_temporary_table(self, name) -> str:
+        return f"DROP TEMPORARY TABLE `{name}`"
+
+    def full_scans(self, connection, query, params) -> list:
+        cursor = connection.cursor(dictionary=True)
+        try:
+            cursor.execute(f"EXPLAIN {query}", params)
+            # Tiny tables may still be scanned, but there must be an index to choose from
+            return [plan.get("table") for plan in cursor.fetchall() if plan.get("type") == "ALL" and not plan.get("possible_keys")]
+        finally:
+            cursor.close()
+
+    def first_insert_id(self, cursor, count) -> int:
+        # mysql.connector sends one multi-row INSERT, lastrowid is the id of its first row
+        return cursor.lastrowid
+
+    def replica_lag(self, connection):
+        cursor = connection.cursor(dictionary=True)
+        try:
+            try:
+                cursor.execute("SHOW REPLICA STATUS")
+            except self.driver.Error:
+                # Servers before 8.0.22 only know the old name
+                cursor.execute("SHOW SLAVE STATUS")
+            rows = cursor.fetchall()
+        finally:
+            cursor.close()
+        if not rows:
+            return None
+        # NULL while the replication threads are stopped
+        return rows[0].get("Seconds_Behind_Source", rows[0].get("Seconds_Behind_Master"))
+
+
+class SQLiteCursor:
+
+    def __init__(self, cursor, backend, dictionary=False) -> None:
+        self._cursor = cursor
+        self._backend = backend
+        self._dictionary = dictionary
+        self._converted = ()
+        self._names = None
+
+    def execute(self, query, params=()):
+        self._cursor.execute(self._backend.translate(query), params or ())
+        self.describe()
+
+    def executemany(self, query, params):
+        self._cursor.executemany(self._backend.translate(query), params)
+        self.describe()
+
+    def describe(self) -> None:
+        description = self._cursor.description
+        if description is None:
+            self._converted = ()
+            self._names = None
+            return
+        self._names = tuple(column[0] for column in description)
+        self._converted = self._backend.timestamp_columns(self._names)
+
+    def convert(self, row):
+        if row is None:
+            return None
+        if self._converted:
+            row = list(row)
+            for index in self._converted:
+                if isinstance(row[index], str):
+                    row[index] = datetime.fromisoformat(row[index])
+            row = tuple(row)
+        if self._dictionary:
+            return dict(zip(self._names, row))
+        return row
+
+    def fetchone(self):
+        return self.convert(self._cursor.fetchone())
+
+    def fetchmany(self, size=None):
+        rows = self._cursor.fetchmany(size) if size is not None else self._cursor.fetchmany()
+        return [self.convert(row) for row in rows] if self._converted or self._dictionary else rows
+
+    def fetchall(self):
+        rows = self._cursor.fetchall()
+        return [self.convert(row) for row in rows] if self._converted or self._dictionary else rows
+
+    def __iter__(self):
+        row = self.fetchone()
+        while row is not None:
+            yield row
+            row = self.fetchone()
+
+    @property
+    def description(self):
+        return self._cursor.description
+
+    @property
+    def rowcount(self):
+        return self._cursor.rowcount
+
+    @property
+    def lastrowid(self):
+        return self._cursor.lastrowid
+
+    @property
+    def column_names(self):
+        return self._names or ()
+
+    def close(self) -> None:
+        self._cursor.close()
+
+
+class SQLiteConnection:
+
+    def __init__(self, connection, backend) -> None:
+        self._connection = connection
+        self._backend = backend
+
+    def cursor(self, dictionary=False, buffered=None, prepared=None):
+        # sqlite3 keeps its own statement cache and always reads rows lazily, so buffered and prepared need no work
+        return SQLiteCursor(self._connection.cursor(), self._backend, dictionary)
+
+    def ping(self, reconnect=False) -> None:
+        self._connection.execute("SELECT 1")
+
+    def commit(self) -> None:
+        self._connection.commit()
+
+    def rollback(self) -> None:
+        self._connection.rollback()
+
+    def close(self) -> None:
+        self._connection.close()
+
+
+class SQLiteBackend(Backend):
+
+    name = "sqlite"
+    integrity_errors = (sqlite3.IntegrityError,)
+
+    def __init__(self, settings, base_path=".") -> None:
+        path = settings.get("path", "car_collection.db")
+        self.busy_timeout = int(settings.get("busy_timeout", 5000))
+        # Read-only connections are used for replicas, a missing file then fails to connect instead of being created
+        self.read_only = bool(settings.get("read_only", False))
+        self.memory = path == ":memory:"
+        if self.memory:
+            # A shared cache lets every pooled connection see the same in-memory database
+            self.path = f"file:{settings.get('name', 'car_collection')}?mode=memory&cache=shared"
+            # Shared cache locks whole tables, so connections take turns instead of failing with SQLITE_LOCKED
+            self.max_connections = 1
+        else:
+            self.path = path if os.path.isabs(path) else os.path.join(base_path, path)
+            if self.read_only:
+                self.path = f"file:{quote(os.path.abspath(self.path))}?mode=ro"
+        self.uri = self.memory or self.read_only
+        # query text -> same query with ? placeholders
+        self.queries = {}
+        # column names -> indexes of timestamp columns
+        self.timestamps = {}
+        self.lock = threading.Lock()
+        # Keeps the in-memory database alive while the pool closes and reopens its connections
+        self.anchor = None
+        # Stored as text in the same form MySQL prints timestamps, which also sorts in time order
+        sqlite3.register_adapter(datetime, lambda value: value.strftime("%Y-%m-%d %H:%M:%S"))
+        sqlite3.register_adapter(date, lambda value: value.isoformat())
+
+    def connect(self):
+        connection = sqlite3.connect(self.path, uri=self.uri, timeout=self.busy_timeout / 1000, check_same_thread=False)
+        if self.memory:
+            with self.lock:
+                if self.anchor is None:
+                    self.anchor = sqlite3.connect(self.path, uri=True, check_same_thread=False)
+        elif not self.read_only:
+            # WAL lets readers run while a write is in progress, NORMAL only syncs at checkpoints
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+        connection.execute(f"PRAGMA busy_timeout={self.busy_timeout}")
+        connection.execute("PRAGMA foreign_keys=ON")
+        return SQLiteConnection(connection, self)
+
+    def close(self) -> None:
+        with self.lock:
+            if self.anchor is not None:
+                self.anchor.close()
+                self.anchor = None
+
+    def translate(self, query) -> str:
+        translated = self.queries.get(query)
+        if translated is None:
+            # None of the API queries contain a literal %, so a plain replace is enough
+            translated = query.replace("%s", "?")
+            # Dynamic list queries have many texts, keep the cache bounded
+            if len(self.queries) > 1000:
+                self.queries.clear()
+            self.queries[query] = translated
+        return translated
+
+    def timestamp_columns(self, names) -> tuple:
+        # SQLite returns timestamps as text, columns are found by the *_at naming the schema uses,
+        # which also covers aggregates such as MAX(updated_at)
+        indexes = self.timestamps.get(names)
+        if indexes is None:
+            indexes = tuple(index for index, name in enumerate(names) if name.lower().rstrip(")").endswith("_at"))
+            if len(self.timestamps) > 1000:
+                self.timestamps.clear()
+            self.timestamps[names] = indexes
+        return indexes
+
+    def column_type(self, kind) -> str:
+        return {
+            "id": "INTEGER PRIMARY KEY AUTOINCREMENT",
+            "bigint": "INTEGER",
+            "int": "INTEGER",
+        }.get(kind, kind)
+
+    def index_exists(self, cursor, table, name) -> bool:
+        cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'index' AND tbl_name = %s AND name = %s LIMIT 1", (table, name))
+        return cursor.fetchone() is not None
+
+    def primary_key_name(self, table) -> str:
+        # SQLite cannot add a primary key to an existing table, a unique index gives the same lookups
+        return f"{table}_primary"
+
+    def add_primary_key(self, table, columns) -> str:
+        return self.create_index(table, self.primary_key_name(table), columns, unique=True)
+
+    def drop_temporary_table(self, name) -> str:
+        return f"DROP TABLE temp.`{name}`"
+
+    def full_scans(self, connection, query, params) -> list:
+        cursor = connection.cursor()
+        try:
+            cursor.execute(f"EXPLAIN QUERY PLAN {query}", params)
+            plan = cursor.fetchall()
+            # A scan in rowid order without a sort step stops at the LIMIT, like a keyset page
+            if "ORDER BY" in query and "LIMIT" in query and not any("TEMP B-TREE FOR ORDER BY" in row[-1] for row in plan):
+                return []
+            tables = []
+            for row in plan:
+                # "SCAN cars" (older versions: "SCAN TABLE cars") reads every row, "SCAN cars USING INDEX" does not
+                match = re.match(r"SCAN (?:TABLE )?(\w+)", row[-1])
+                if match and "USING" not in row[-1] and match.group(1) != "CONSTANT":
+                    tables.append(match.group(1))
+            return tables
+        finally:
+            cursor.close()
+
+    def first_insert_id(self, cursor, count) -> int:
+        # executemany runs one INSERT per row, in one transaction the AUTOINCREMENT ids are consecutive
+        cursor.execute("SELECT last_insert_rowid()")
+        return cursor.fetchone()[0] - count + 1
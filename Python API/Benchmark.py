@@ -0,0 +1,366 @@
+import argparse
+import asyncio
+import hashlib
+import json
+import os
+import random
+import shlex
+import statistics
+import subprocess
+import sys
+import time
+from urllib.parse import urlsplit
+
+
+class Benchmark:
+
+    def __init__(self, concurrency=50, requests=2000, timeout=10.0) -> None:
+        self.concurrency = concurrency
+        self.requests = requests
+        self.timeout = timeout
+
+    async def open(self, url):
+        parts = urlsplit(url)
+        reader, writer = await asyncio.open_connection(parts.hostname, parts.port or 80)
+        return reader, writer
+
+    async def send(self, reader, writer, host, method, path, body=b"", headers=None):
+        # Plain HTTP/1.1 with keep-alive, enough for comparing servers on localhost
+        lines = [f"{method} {path} HTTP/1.1", f"Host: {host}", "Connection: keep-alive", f"Content-Length: {len(body)}"]
+        lines.extend(f"{key}: {value}" for key, value in (headers or {}).items())
+        writer.write(("\r\n".join(lines) + "\r\n\r\n").encode("latin-1") + body)
+        await writer.drain()
+
+        status_line = await reader.readline()
+        if not status_line:
+            raise ConnectionError("Connection closed by server")
+        status = int(status_line.split()[1])
+        length = None
+        chunked = False
+        # HTTP/1.0 servers close after every response unless they say otherwise
+        close = status_line.startswith(b"HTTP/1.0")
+        while True:
+            line = await reader.readline()
+            if line in (b"\r\n", b"\n", b""):
+                break
+            key, _, value = line.decode("latin-1").partition(":")
+            key = key.strip().lower()
+            value = value.strip()
+            if key == "content-length":
+                length = int(value)
+            elif key == "transfer-encoding" and "chunked" in value.lower():
+                chunked = True
+            elif key == "connection":
+                close = value.lower() == "close"
+
+        if chunked:
+            payload = b""
+            while True:
+                size = int((await reader.readline()).split(b";")[0], 16)
+                chunk = await reader.readexactly(size + 2)
+                if size == 0:
+                    break
+                payload += chunk[:-2]
+        elif length is not None:
+            payload = await reader.readexactly(length)
+        else:
+            payload = await reader.read()
+            close = True
+        return status, payload, close
+
+    async def request(self, url, method, path, body=b"", headers=None):
+        # Single request on its own connection, for setup steps and metric scrapes
+        reader, writer = await self.open(url)
+        try:
+            status, payload, _ = await asyncio.wait_for(self.send(reader, writer, urlsplit(url).netloc, method, path, body, headers), self.timeout)
+            return status, payload
+        finally:
+            writer.close()
+
+    async def worker(self, url, pending, latencies, statuses, payloads):
+        # pending is shared by the workers, each takes the next request until none are left
+        host = urlsplit(url).netloc
+        reader, writer = await self.open(url)
+        try:
+            while pending:
+                index, (method, path, body, headers) = pending.pop()
+                start = time.perf_counter()
+                status, payload, close = await asyncio.wait_for(self.send(reader, writer, host, method, path, body, headers), self.timeout)
+                latencies.append(time.perf_counter() - start)
+                statuses[status] = statuses.get(status, 0) + 1
+                if payloads is not None:
+                    payloads[index] = (status, payload)
+                if close:
+                    writer.close()
+                    reader, writer = await self.open(url)
+        finally:
+            writer.close()
+
+    async def run_requests(self, url, requests, keep_payloads=False):
+        # requests is a list of (method, path, body, headers), built before the clock starts
+        latencies = []
+        statuses = {}
+        payloads = {} if keep_payloads else None
+        pending = list(enumerate(requests))[::-1]
+        start = time.perf_counter()
+        await asyncio.gather(*(self.worker(url, pending, latencies, statuses, payloads) for _ in range(min(self.concurrency, len(requests)))))
+        elapsed = time.perf_counter() - start
+        return latencies, statuses, elapsed, payloads
+
+    async def run(self, url, path):
+        requests = [("GET", path, b"", None)] * self.requests
+        latencies, statuses, elapsed, _ = await self.run_requests(url, requests)
+        return self.summary(url, path, latencies, statuses, elapsed)
+
+    def summary(self, url, path, latencies, statuses, elapsed) -> dict:
+        latencies = sorted(latencies)
+        return {
+            "url": url,
+            "path": path,
+            "requests": len(latencies),
+            "throughput": len(latencies) / elapsed if elapsed else 0.0,
+            "p50_ms": self.percentile(latencies, 50) * 1000,
+            "p95_ms": self.percentile(latencies, 95) * 1000,
+            "p99_ms": self.percentile(latencies, 99) * 1000,
+            "mean_ms": statistics.fmean(latencies) * 1000 if latencies else 0.0,
+            "statuses": statuses,
+        }
+
+    def percentile(self, values, percent) -> float:
+        # values must be sorted, nearest rank
+        if not values:
+            return 0.0
+        index = max(0, min(len(values) - 1, int(round(percent / 100 * len(values))) - 1))
+        return values[index]
+
+    def report(self, result) -> None:
+        statuses = ", ".join(f"{status}: {count}" for status, count in sorted(result["statuses"].items()))
+        print(
+            f"{result['url']}{result['path']}  "
+            f"{result['requests']} requests  {result['throughput']:.0f} req/s  "
+            f"p50 {result['p50_ms']:.2f} ms  p99 {result['p99_ms']:.2f} ms  [{statuses}]"
+        )
+
+
+class Suite:
+
+    def __init__(self, benchmark, url, cars, brands, categories, colours, users, plain_cars, password="benchmark", seed=42) -> None:
+        # Sizes must match the seeded data so every generated id exists
+        self.benchmark = benchmark
+        self.url = url
+        self.cars = cars
+        self.brands = brands
+        self.categories = categories
+        self.colours = colours
+        self.users = users
+        self.plain_cars = min(plain_cars, cars)
+        self.password = password
+        self.seed = seed
+        self.words = ["classic", "roadster", "coupe", "racing", "vintage", "turbo", "touring", "rally", "sport", "grand"]
+        self.json_headers = {"Content-Type": "application/json"}
+        # Image columns hold the hash /api/upload_image returns
+        self.image = hashlib.sha256(b"benchmark").hexdigest()
+
+    def body(self, value) -> bytes:
+        return json.dumps(value).encode("utf-8")
+
+    def scenarios(self):
+        # (name, function(generator, index) -> (method, path, body, headers), maximum number of requests)
+        car = lambda generator: generator.randrange(1, self.cars - self.plain_cars + 1)
+        return [
+            ("get_car", lambda generator, index: ("GET", f"/api/car/{car(generator)}", b"", None), None),
+            ("get_car_expand", lambda generator, index: ("GET", f"/api/car/{car(generator)}?expand=brand,category,colours", b"", None), None),
+            ("get_brand", lambda generator, index: ("GET", f"/api/brand/{generator.randrange(1, self.brands + 1)}", b"", None), None),
+            ("get_category", lambda generator, index: ("GET", f"/api/category/{generator.randrange(1, self.categories + 1)}", b"", None), None),
+            ("get_colour", lambda generator, index: ("GET", f"/api/colour/{generator.randrange(1, self.colours + 1)}", b"", None), None),
+            ("all_cars", lambda generator, index: ("GET", f"/api/all_cars?limit=50&after={car(generator)}", b"", None), None),
+            ("all_cars_filtered", lambda generator, index: ("GET", f"/api/all_cars?limit=50&sort=-created_at&brand_id={generator.randrange(1, self.brands + 1)}", b"", None), None),
+            ("all_cars_expand", lambda generator, index: ("GET", f"/api/all_cars?limit=50&expand=brand,category,colours&after={car(generator)}", b"", None), None),
+            ("all_brands", lambda generator, index: ("GET", "/api/all_brands?limit=50", b"", None), None),
+            ("all_categories", lambda generator, index: ("GET", "/api/all_categories?limit=50", b"", None), None),
+            ("all_colours", lambda generator, index: ("GET", "/api/all_colours?limit=50", b"", None), None),
+            ("search", lambda generator, index: ("GET", f"/api/search?q={generator.choice(self.words)}+{generator.choice(self.words)}", b"", None), None),
+            ("stats", lambda generator, index: ("GET", "/api/stats", b"", None), None),
+            ("create_car", lambda generator, index: ("POST", "/api/create_car", self.body(self.new_car(generator, index)), self.json_headers), None),
+            ("create_cars_bulk", lambda generator, index: ("POST", "/api/create_car", self.body([self.new_car(generator, index * 100 + offset) for offset in range(100)]), self.json_headers), None),
+            ("create_brand", lambda generator, index: ("POST", "/api/create_brand", self.body({"brand_name": f"Bench brand {index}", "brand_image": self.image}), self.json_headers), None),
+            ("create_category", lambda generator, index: ("POST", "/api/create_category", self.body({"category_name": f"Bench category {index}"}), self.json_headers), None),
+            ("create_colour", lambda generator, index: ("POST", "/api/create_colour", self.body({"colour_name": f"Bench colour {index}", "hex_code": "#%06x" % generator.randrange(0x1000000)}), self.json_headers), None),
+            ("update_car", lambda generator, index: ("PUT", f"/api/update_car/{car(generator)}", self.body({"car_name": f"Updated car {index}"}), self.json_headers), None),
+            ("update_brand", lambda generator, index: ("PUT", f"/api/update_brand/{generator.randrange(1, self.brands + 1)}", self.body({"brand_image": self.image}), self.json_headers), None),
+            ("update_colour", lambda generator, index: ("PUT", f"/api/update_colour/{generator.randrange(1, self.colours + 1)}", self.body({"hex_code": "#%06x" % generator.randrange(0x1000000)}), self.json_headers), None),
+            # Every user logs in once, then again so the first token is rotated out, the second tokens are used by logout
+            ("auth", lambda generator, index: ("POST", "/api/auth", self.body({"email": f"user{index + 1}@example.com", "password": self.password}), self.json_headers), self.users),
+            ("auth_rotate", lambda generator, index: ("POST", "/api/auth", self.body({"email": f"user{index + 1}@example.com", "password": self.password}), self.json_headers), self.users),
+            ("logout", None, self.users),
+            # Seeded cars without colours, each deleted once
+            ("delete_car", lambda generator, index: ("DELETE", f"/api/delete_car/{self.cars - index}", b"", None), self.plain_cars),
+        ]
+
+    def new_car(self, generator, index) -> dict:
+        return {
+            "car_name": f"Bench {generator.choice(self.words)} {index}",
+            "car_model": f"Model {generator.randrange(1, 500)}",
+            "car_description": " ".join(generator.choice(self.words) for _ in range(12)),
+            "car_image": self.image,
+            "brand_id": generator.randrange(1, self.brands + 1),
+            "category_id": generator.randrange(1, self.categories + 1),
+        }
+
+    async def query_count(self) -> float:
+        # Total cursor.execute calls so far, from the server's own /metrics
+        status, payload = await self.benchmark.request(self.url, "GET", "/metrics")
+        if status != 200:
+            return None
+        total = 0.0
+        for line in payload.decode("utf-8").splitlines():
+            if line.startswith("db_query_duration_seconds_count"):
+                total += float(line.rsplit(" ", 1)[1])
+        return total
+
+    async def wait_for_search(self, timeout=60.0) -> None:
+        # The index is built in the background after the first request
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            status, _ = await self.benchmark.request(self.url, "GET", "/api/search?q=car")
+            if status != 503:
+                return
+            await asyncio.sleep(0.5)
+
+    async def run(self, only=None) -> list:
+        results = []
+        tokens = []
+        for name, make_request, maximum in self.scenarios():
+            if only and name not in only:
+                continue
+            count = self.benchmark.requests if maximum is None else min(self.benchmark.requests, maximum)
+            generator = random.Random(f"{self.seed}:{name}")
+            if name == "search":
+                await self.wait_for_search()
+            if name == "logout":
+                requests = [("POST", "/api/logout", b"", {"Authorization": f"Bearer {token}"}) for token in tokens[:count]]
+            else:
+                requests = [make_request(generator, index) for index in range(count)]
+            if not requests:
+                continue
+
+            before = await self.query_count()
+            latencies, statuses, elapsed, payloads = await self.benchmark.run_requests(self.url, requests, keep_payloads=name in ["auth", "auth_rotate"])
+            after = await self.query_count()
+
+            if name in ["auth", "auth_rotate"]:
+                tokens = [json.loads(payload)["token"] for _, (status, payload) in sorted(payloads.items()) if status == 200]
+            result = self.benchmark.summary(self.url, name, latencies, statuses, elapsed)
+            result["scenario"] = name
+            result["errors"] = sum(count for status, count in statuses.items() if status >= 400)
+            # Background threads also query, so this is an upper bound on short runs
+            result["queries_per_request"] = (after - before) / len(latencies) if before is not None and after is not None and latencies else None
+            results.append(result)
+            self.report(result)
+        return results
+
+    def report(self, result, baseline=None) -> None:
+        queries = result["queries_per_request"]
+        line = (
+            f"{result['scenario']:<20} {result['requests']:>6} req  {result['throughput']:>8.1f} req/s  "
+            f"p50 {result['p50_ms']:>8.2f}  p95 {result['p95_ms']:>8.2f}  p99 {result['p99_ms']:>8.2f} ms  "
+            f"{'-' if queries is None else f'{queries:.2f}':>6} q/req  {result['errors']} errors"
+        )
+        if baseline is not None:
+            throughput = (result["throughput"] / baseline["throughput"] - 1) * 100 if baseline["throughput"] else 0.0
+            p99 = (result["p99_ms"] / baseline["p99_ms"] - 1) * 100 if baseline["p99_ms"] else 0.0
+            line += f"  throughput {throughput:+.1f}%  p99 {p99:+.1f}%"
+        print(line)
+
+
+def start_server(command, port):
+    # The API runs in its own process so the benchmark client does not compete for its GIL
+    env = dict(os.environ)
+    # Every login comes from one address, the auth limits stay off unless they are set explicitly
+    for name in ["API_AUTH_LIMIT_GLOBAL", "API_AUTH_LIMIT_IP", "API_AUTH_LIMIT_EMAIL"]:
+        env.setdefault(name, "")
+    process = subprocess.Popen(shlex.split(command.format(port=port, python=sys.executable)), cwd=os.path.dirname(os.path.abspath(__file__)), env=env)
+    url = f"http://127.0.0.1:{port}"
+    benchmark = Benchmark()
+    deadline = time.monotonic() + 30
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"Server exited with status {process.returncode}")
+        try:
+            status, _ = asyncio.run(benchmark.request(url, "GET", "/metrics"))
+            if status == 200:
+                return process, url
+        except OSError:
+            pass
+        time.sleep(0.2)
+    process.terminate()
+    raise RuntimeError("Server did not start within 30 seconds")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Load test the API and compare servers or commits")
+    parser.add_argument("--url", action="append", help="Server base URL, repeat to compare servers")
+    parser.add_argument("--path", action="append", help="Only load these paths with GET instead of running the suite")
+    parser.add_argument("--concurrency", type=int, default=16, help="Open connections")
+    parser.add_argument("--requests", type=int, default=1000, help="Requests per scenario or path")
+    parser.add_argument("--start", action="store_true", help="Start the API in a subprocess instead of using --url")
+    parser.add_argument("--port", type=int, default=5050, help="Port for --start")
+    parser.add_argument("--command", default="{python} -c \"from Api import Api; Api().app.run(host='127.0.0.1', port={port}, threaded=True)\"", help="Server command for --start")
+    parser.add_argument("--seed-data", action="store_true", help="Replace the API tables with synthetic data first, destroys existing rows")
+    parser.add_argument("--cars", type=int, default=10000)
+    parser.add_argument("--brands", type=int, default=50)
+    parser.add_argument("--categories", type=int, default=20)
+    parser.add_argument("--colours", type=int, default=30)
+    parser.add_argument("--users", type=int, default=200)
+    parser.add_argument("--plain-cars", type=int, default=1000, help="Cars without colours at the end of the id range, used by delete_car")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--scenario", action="append", help="Only run these suite scenarios")
+    parser.add_argument("--output", help="Write the results as JSON")
+    parser.add_argument("--compare", help="JSON results of an earlier run to compare against")
+    args = parser.parse_args()
+
+    benchmark = Benchmark(concurrency=args.concurrency, requests=args.requests)
+    if args.path:
+        for path in args.path:
+            for url in args.url or []:
+                benchmark.report(asyncio.run(benchmark.run(url.rstrip("/"), path)))
+        sys.exit(0)
+
+    if args.seed_data:
+        from Database import Database
+        from Logger import Logger
+        from Seeder import Seeder
+        print(Seeder(Database(), Logger(), seed=args.seed).run(args.brands, args.categories, args.colours, args.cars, args.users, plain_cars=args.plain_cars))
+
+    process = None
+    urls = [url.rstrip("/") for url in args.url or []]
+    if args.start:
+        process, url = start_server(args.command, args.port)
+        urls.append(url)
+    if not urls:
+        parser.error("--url or --start is required")
+
+    baseline = {}
+    if args.compare:
+        with open(args.compare, "r") as file:
+            baseline = {result["scenario"]: result for result in json.load(file)["runs"][0]["results"]}
+
+    try:
+        runs = []
+        for url in urls:
+            print(f"{url}  concurrency {args.concurrency}")
+            suite = Suite(benchmark, url, args.cars, args.brands, args.categories, args.colours, args.users, args.plain_cars, seed=args.seed)
+            results = asyncio.run(suite.run(args.scenario))
+            if baseline:
+                print("compared with", args.compare)
+                for result in results:
+                    suite.report(result, baseline.get(result["scenario"]))
+            runs.append({"url": url, "results": results})
+    finally:
+        if process is not None:
+            process.terminate()
+            process.wait()
+
+    if args.output:
+        with open(args.output, "w") as file:
+            json.dump({"concurrency": args.concurrency, "requests": args.requests, "seed": args.seed, "cars": args.cars, "runs": runs}, file, indent=2)
@@ -0,0 +1,82 @@
+from datetime import datetime
+from flask import jsonify
+
+
+class BulkInsert:
+
+    def __init__(self, database, max_items=1000) -> None:
+        self.database = database
+        self.max_items = max_items
+
+    def create(self, table, key_columns, items, validate=None, on_created=None):
+        # key_columns maps request keys to table columns, e.g. {"brand_name": "name"}
+        rejection = self.check_size(items)
+        if rejection is not None:
+            return rejection
+
+        rows, errors = self.prepare(key_columns, items, validate)
+        if errors:
+            return jsonify(status="failed", errors=errors), 400
+
+        connection = None
+        cursor = None
+        try:
+            connection = self.database.db_connection()
+            cursor = connection.cursor()
+            # mysql.connector turns this into one multi-row INSERT
+            cursor.executemany(self.insert_query(table, key_columns), rows)
+            first_id = self.database.backend.first_insert_id(cursor, len(rows))
+            connection.commit()
+        except Exception:
+            if connection is not None:
+                connection.rollback()
+            raise
+        finally:
+            if cursor is not None:
+                cursor.close()
+            if connection is not None:
+                connection.close()
+
+        # The rows of one INSERT get consecutive auto increment ids starting at first_id
+        ids = list(range(first_id, first_id + len(rows)))
+        if on_created is not None:
+            # Rows are in key_columns order followed by created_at and updated_at
+            on_created(ids, rows)
+        return jsonify(status="success", ids=ids), 200
+
+    def check_size(self, items):
+        # Returns an error response for empty or oversized payloads, otherwise None
+        if len(items) == 0:
+            return "Bad Request - Empty list", 400
+        if len(items) > self.max_items:
+            return f"Payload Too Large - At most {self.max_items} items per request", 413
+        return None
+
+    def prepare(self, key_columns, items, validate=None):
+        # Validate everything before touching the database so the insert is all or nothing
+        errors = []
+        rows = []
+        now = datetime.now()
+        for index, item in enumerate(items):
+            if not isinstance(item, dict):
+                errors.append({"index": index, "error": "Item must be an object"})
+                continue
+            missing = [key for key in key_columns if key not in item]
+            if missing:
+                errors.append({"index": index, "error": f"Missing Parameters - {', '.join(missing)}"})
+                continue
+            error = validate(item) if validate is not None else None
+            if error:
+                errors.append({"index": index, "error": error})
+                continue
+            rows.append(tuple(item[key] for key in key_columns) + (now, now))
+
+        return rows, errors
+
+    def insert_query(self, table, key_columns) -> str:
+        columns = list(key_columns.values()) + ["created_at", "updated_at"]
+        return (
+            f"INSERT INTO {table} "
+            f"({', '.join(columns)}) "
+            f"VALUES ({', '.join(['%s'] * len(columns))})"
+        )
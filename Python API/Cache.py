@@ -0,0 +1,102 @@
+import sys
+import threading
+import time
+from collections import OrderedDict
+
+
+class Cache:
+
+    def __init__(self, max_entries=10000, max_bytes=None, ttl=2) -> None:
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        # Writes only invalidate the worker that made them, the TTL bounds how stale the other workers can be
+        self.ttl = ttl
+        self.lock = threading.Lock()
+        # key -> (value, size, expires_at), least recently used first
+        self.entries = OrderedDict()
+        self.bytes = 0
+        # Bumped on every invalidation so reads that raced a write are not stored
+        self.invalidations = 0
+        # Counters for cache stats
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            value, size, expires_at = entry
+            if expires_at <= time.monotonic():
+                self.remove(key)
+                self.expirations += 1
+                self.misses += 1
+                return None
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def generation(self) -> int:
+        # Take this before reading from the database and pass it to set()
+        with self.lock:
+            return self.invalidations
+
+    def set(self, key, value, generation=None) -> None:
+        size = self.size_of(value)
+        with self.lock:
+            if generation is not None and generation != self.invalidations:
+                # Something was invalidated while the value was loaded, it may be stale
+                return
+            if self.max_bytes is not None and size > self.max_bytes:
+                return
+            if key in self.entries:
+                self.remove(key)
+            self.entries[key] = (value, size, time.monotonic() + self.ttl)
+            self.bytes += size
+            while len(self.entries) > self.max_entries or (self.max_bytes is not None and self.bytes > self.max_bytes):
+                oldest = next(iter(self.entries))
+                self.remove(oldest)
+                self.evictions += 1
+
+    def invalidate(self, key) -> None:
+        with self.lock:
+            self.invalidations += 1
+            if key in self.entries:
+                self.remove(key)
+
+    def clear(self) -> None:
+        with self.lock:
+            self.invalidations += 1
+            self.entries.clear()
+            self.bytes = 0
+
+    def remove(self, key) -> None:
+        # Caller must hold the lock
+        _, size, _ = self.entries.pop(key)
+        self.bytes -= size
+
+    def size_of(self, value) -> int:
+        # Shallow estimate of a row dictionary, good enough for a byte budget
+        size = sys.getsizeof(value)
+        if isinstance(value, dict):
+            for key, item in value.items():
+                size += sys.getsizeof(key) + sys.getsizeof(item)
+        return size
+
+    def stats(self) -> dict:
+        with self.lock:
+            return {
+                "entries": len(self.entries),
+                "bytes": self.bytes,
+                "max_entries": self.max_entries,
+                "max_bytes": self.max_bytes,
+                "ttl": self.ttl,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+                "invalidations": self.invalidations,
+            }
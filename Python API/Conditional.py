@@ -0,0 +1,76 @@
+import hashlib
+import json
+from datetime import timezone
+from flask import Response
+
+
+class Conditional:
+
+    def row_validators(self, table, row):
+        # The tag of a single record hashes every column value, including expanded relations,
+        # updated_at alone misses a second update within the same second
+        etag = self.make_etag(table, json.dumps(row, sort_keys=True, default=str))
+        last_modified = None
+        for record in self.records(row):
+            updated_at = record.get("updated_at")
+            if updated_at is not None and (last_modified is None or updated_at > last_modified):
+                last_modified = updated_at
+        return etag, last_modified
+
+    def records(self, row):
+        # The row itself followed by expanded records such as brand or colours
+        yield row
+        for value in row.values():
+            if isinstance(value, dict):
+                yield value
+            elif isinstance(value, list):
+                for item in value:
+                    if isinstance(item, dict):
+                        yield item
+
+    def list_validators(self, cursor, table, args, related=()):
+        cursor.execute(self.aggregate_query(table, related))
+        return self.validators_from_aggregates(table, cursor.fetchall(), args)
+
+    def aggregate_query(self, table, related=()):
+        # Row count and max id catch inserts and deletes, max updated_at catches updates. A list tag can miss an update
+        # made in the same second as the current MAX(updated_at), until the next write moves it
+        queries = [f"SELECT COUNT(*), MAX(id), MAX(updated_at) FROM {table}"]
+        # Expanded relations are aggregated in the same round trip
+        queries.extend(f"SELECT COUNT(*), NULL, MAX(updated_at) FROM {other}" for other in related)
+        return " UNION ALL ".join(queries)
+
+    def validators_from_aggregates(self, table, aggregates, args):
+        # Different pages and projections of the same table need different tags
+        query_string = "&".join(f"{key}={value}" for key, value in sorted(args.items(multi=True)))
+        etag = self.make_etag(table, *aggregates, query_string)
+        last_modified = max((row[2] for row in aggregates if row[2] is not None), default=None)
+        return etag, last_modified
+
+    def make_etag(self, *parts) -> str:
+        return hashlib.sha1(":".join(str(part) for part in parts).encode("utf-8")).hexdigest()[:32]
+
+    def not_modified(self, request, etag, last_modified) -> bool:
+        # If-None-Match wins over If-Modified-Since when both are sent
+        if request.if_none_match:
+            return request.if_none_match.contains_weak(etag)
+        if request.if_modified_since and last_modified is not None:
+            return self.to_http_time(last_modified) <= request.if_modified_since
+        return False
+
+    def not_modified_response(self, etag, last_modified, response_class=Response):
+        return self.add_headers(response_class(status=304), etag, last_modified)
+
+    def add_headers(self, response, etag, last_modified):
+        # Weak tags, list tags only have the second precision of updated_at
+        response.set_etag(etag, weak=True)
+        if last_modified is not None:
+            response.last_modified = self.to_http_time(last_modified)
+        return response
+
+    def to_http_time(self, value):
+        # HTTP dates have no sub-second part and MySQL timestamps come back naive
+        value = value.replace(microsecond=0)
+        if value.tzinfo is None:
+            value = value.replace(tzinfo=timezone.utc)
+        return value
@@ -0,0 +1,251 @@
+import threading
+import time
+from collections import deque, OrderedDict
+
+
+class PoolTimeout(Exception):
+    pass
+
+
+class TimedCursor:
+
+    def __init__(self, cursor, metrics) -> None:
+        self._cursor = cursor
+        self._metrics = metrics
+
+    def __getattr__(self, name):
+        return getattr(self._cursor, name)
+
+    def __iter__(self):
+        return iter(self._cursor)
+
+    def execute(self, query, *args, **kwargs):
+        # Buffered cursors read the whole result here, so this is the full query time
+        start = time.perf_counter()
+        try:
+            return self._cursor.execute(query, *args, **kwargs)
+        finally:
+            self._metrics.observe_query(query, time.perf_counter() - start)
+
+    def executemany(self, query, *args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return self._cursor.executemany(query, *args, **kwargs)
+        finally:
+            self._metrics.observe_query(query, time.perf_counter() - start)
+
+
+class PooledConnection:
+
+    def __init__(self, pool, connection, created_at) -> None:
+        self._pool = pool
+        self._connection = connection
+        self._created_at = created_at
+
+    def __getattr__(self, name):
+        # Everything except close() is forwarded to the real connection
+        return getattr(self._connection, name)
+
+    def close(self) -> None:
+        # Return the connection to the pool instead of closing the socket
+        if self._connection is not None:
+            self._pool.release(self._connection, self._created_at)
+            self._connection = None
+
+    def cursor(self, *args, **kwargs):
+        cursor = self._connection.cursor(*args, **kwargs)
+        if self._pool.metrics is not None:
+            cursor = TimedCursor(cursor, self._pool.metrics)
+        return cursor
+
+    def prepared(self, query):
+        return self._pool.prepared(self._connection, query)
+
+    @property
+    def pool_name(self):
+        return self._pool.name
+
+
+class ConnectionPool:
+
+    def __init__(self, connect, size=5, max_overflow=10, timeout=30.0, recycle=3600, pre_ping=True, max_statements=64, metrics=None, name="primary") -> None:
+        # Factory that opens a new raw connection
+        self.connect = connect
+        # "primary" or the replica name, tells callers where a connection came from
+        self.name = name
+        self.size = size
+        self.max_overflow = max_overflow
+        self.timeout = timeout
+        self.recycle = recycle
+        self.pre_ping = pre_ping
+        self.max_statements = max_statements
+        # Optional Metrics receiving query and acquire timings
+        self.metrics = metrics
+        # id(raw connection) -> {query: prepared cursor}, statements live as long as their connection
+        self.statements = {}
+        self.condition = threading.Condition()
+        # Idle connections as (connection, created_at) pairs, most recently used on the right
+        self.idle = deque()
+        self.opened = 0
+        self.in_use = 0
+        self.waiting = 0
+        # Counters for pool stats
+        self.checkouts = 0
+        self.timeouts = 0
+        self.connects = 0
+        self.recycled = 0
+        self.ping_failures = 0
+        self.discarded = 0
+        self.prepares = 0
+        self.total_wait_time = 0.0
+        self.max_wait_time = 0.0
+
+    def acquire(self):
+        start = time.monotonic()
+        deadline = start + self.timeout
+        entry = None
+        with self.condition:
+            while True:
+                if self.idle:
+                    entry = self.idle.pop()
+                    break
+                if self.opened < self.size + self.max_overflow:
+                    # Reserve a slot and open the connection outside the lock
+                    self.opened += 1
+                    break
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    self.timeouts += 1
+                    raise PoolTimeout(f"No connection available within {self.timeout} seconds")
+                self.waiting += 1
+                try:
+                    self.condition.wait(remaining)
+                finally:
+                    self.waiting -= 1
+            self.in_use += 1
+            self.checkouts += 1
+            wait_time = time.monotonic() - start
+            self.total_wait_time += wait_time
+            self.max_wait_time = max(self.max_wait_time, wait_time)
+
+        try:
+            if entry is not None:
+                entry = self.validate(*entry)
+            if entry is None:
+                entry = (self.connect(), time.monotonic())
+                with self.condition:
+                    self.connects += 1
+        except Exception:
+            # Give the reserved slot back so other threads are not starved
+            with self.condition:
+                self.opened -= 1
+                self.in_use -= 1
+                self.condition.notify()
+            raise
+
+        if self.metrics is not None:
+            # Includes the ping or connect, not only the wait for a free slot
+            self.metrics.observe("db_pool_acquire_seconds", (("pool", self.name),), time.monotonic() - start)
+        return PooledConnection(self, *entry)
+
+    def validate(self, connection, created_at):
+        # Returns the entry if the connection is still usable, otherwise None
+        if self.recycle is not None and time.monotonic() - created_at > self.recycle:
+            self.close_quietly(connection)
+            with self.condition:
+                self.recycled += 1
+            return None
+
+        if self.pre_ping:
+            try:
+                connection.ping(reconnect=False)
+            except Exception:
+                self.close_quietly(connection)
+                with self.condition:
+                    self.ping_failures += 1
+                return None
+
+        return (connection, created_at)
+
+    def release(self, connection, created_at) -> None:
+        keep = True
+        try:
+            # End any open transaction so the next user gets a fresh snapshot
+            connection.rollback()
+        except Exception:
+            keep = False
+
+        with self.condition:
+            self.in_use -= 1
+            if keep and len(self.idle) < self.size:
+                self.idle.append((connection, created_at))
+                connection = None
+            else:
+                # Overflow or broken connection, drop it
+                self.opened -= 1
+                if not keep:
+                    self.discarded += 1
+            self.condition.notify()
+
+        if connection is not None:
+            self.close_quietly(connection)
+
+    def prepared(self, connection, query):
+        # Only one thread holds a connection at a time, so its statements need no lock
+        statements = self.statements.get(id(connection))
+        if statements is None:
+            statements = self.statements[id(connection)] = OrderedDict()
+        cursor = statements.get(query)
+        if cursor is not None:
+            statements.move_to_end(query)
+            return cursor
+        cursor = connection.cursor(prepared=True)
+        if self.metrics is not None:
+            cursor = TimedCursor(cursor, self.metrics)
+        statements[query] = cursor
+        self.prepares += 1
+        if len(statements) > self.max_statements:
+            # Least recently used statement is deallocated on the server
+            _, oldest = statements.popitem(last=False)
+            try:
+                oldest.close()
+            except Exception:
+                pass
+        return cursor
+
+    def close_quietly(self, connection) -> None:
+        self.statements.pop(id(connection), None)
+        try:
+            connection.close()
+        except Exception:
+            pass
+
+    def dispose(self) -> None:
+        with self.condition:
+            idle = list(self.idle)
+            self.idle.clear()
+            self.opened -= len(idle)
+        for connection, _ in idle:
+            self.close_quietly(connection)
+
+    def stats(self) -> dict:
+        with self.condition:
+            return {
+                "size": self.size,
+                "max_overflow": self.max_overflow,
+                "opened": self.opened,
+                "in_use": self.in_use,
+                "idle": len(self.idle),
+                "waiting": self.waiting,
+                "checkouts": self.checkouts,
+                "timeouts": self.timeouts,
+                "connects": self.connects,
+                "recycled": self.recycled,
+                "ping_failures": self.ping_failures,
+                "discarded": self.discarded,
+                "prepares": self.prepares,
+                "prepared_statements": sum(len(statements) for statements in list(self.statements.values())),
+                "total_wait_time": self.total_wait_time,
+                "max_wait_time": self.max_wait_time,
+                "avg_wait_time": self.total_wait_time / self.checkouts if self.checkouts else 0.0,
+            }
@@ -1,140 +1,248 @@
-import mysql.connector
 import json
 import os
+import threading
 from Logger import Logger
+from ConnectionPool import ConnectionPool
+from Backend import MySQLBackend, SQLiteBackend
+from ReplicaSet import ReplicaSet
 
 class Database:
     
     def __init__(self) -> None:
-        # Load credentials from json file
-        with open(os.path.join("f:/Others/Car Collection Project/Python Api/", "DBCredentials.json"), "r") as file:
+        # Load credentials from json file, next to this module unless API_DB_CREDENTIALS names another one
+        path = os.environ.get("API_DB_CREDENTIALS", os.path.join(os.path.dirname(os.path.abspath(__file__)), "DBCredentials.json"))
+        with open(path, "r") as file:
             credentials = json.load(file)
-        self.host = credentials["mysql"]["host"]
-        self.user = credentials["mysql"]["user"]
-        self.password = credentials["mysql"]["password"]
-        self.database_name = credentials["mysql"]["database"]
+        # "mysql" or "sqlite", API_DB_BACKEND overrides the file so benchmarks can run without a server
+        backend_name = os.environ.get("API_DB_BACKEND", credentials.get("backend", "mysql"))
+        if backend_name not in ["mysql", "sqlite"]:
+            raise ValueError(f"Unknown database backend {backend_name}")
+        settings = dict(credentials.get(backend_name, {}))
+        if backend_name == "sqlite" and "API_SQLITE_PATH" in os.environ:
+            settings["path"] = os.environ["API_SQLITE_PATH"]
+        # Relative SQLite files are kept next to the credentials file
+        self.base_path = os.path.dirname(os.path.abspath(path))
+        self.backend = self.create_backend(backend_name, settings)
+        if backend_name == "mysql":
+            # Also read by AsyncApi for its aiomysql pool
+            self.host = self.backend.host
+            self.user = self.backend.user
+            self.password = self.backend.password
+            self.database_name = self.backend.database_name
+        # Read replicas only override what differs from the primary, e.g. the host
+        self.replica_backends = []
+        for index, replica in enumerate(settings.get("replicas", [])):
+            replica_settings = dict(settings, **replica)
+            if backend_name == "sqlite":
+                replica_settings["read_only"] = True
+            name = replica.get("name", f"replica-{index + 1}")
+            # Missing pool keys fall back to the primary's pool settings
+            self.replica_backends.append((name, self.create_backend(backend_name, replica_settings), replica.get("pool", {})))
+        self.replica_eject_seconds = settings.get("replica_eject_seconds", 30)
+        self.replica_max_lag = settings.get("replica_max_lag")
+        self.replica_check_interval = settings.get("replica_check_interval", 5)
+        # Pool settings are optional, missing keys fall back to the defaults below
+        pool_settings = settings.get("pool", {})
+        self.pool_size = pool_settings.get("size", 5)
+        self.pool_max_overflow = pool_settings.get("max_overflow", 10)
+        if self.backend.max_connections is not None:
+            self.pool_size = min(self.pool_size, self.backend.max_connections)
+            self.pool_max_overflow = max(0, min(self.pool_max_overflow, self.backend.max_connections - self.pool_size))
+        self.pool_timeout = pool_settings.get("timeout", 30)
+        self.pool_recycle = pool_settings.get("recycle", 3600)
+        self.pool_pre_ping = pool_settings.get("pre_ping", True)
+        self.pool_max_statements = pool_settings.get("max_statements", 64)
         # Create an instance class of Logger
         self.logger = Logger()
         # Initialize table as dictionary
         self.tables = {}
+        # Column names of the API tables in the order they are defined
+        self.columns = {
+            "cars": ["id", "name", "model", "description", "image", "brand_id", "category_id", "created_at", "updated_at"],
+            "brands": ["id", "name", "image", "created_at", "updated_at"],
+            "categories": ["id", "name", "created_at", "updated_at"],
+            "colours": ["id", "name", "hex", "created_at", "updated_at"],
+        }
+        # Optional Metrics for query and connection acquire timings, set before the pool is created
+        self.metrics = None
+        # The pools are created lazily so every gunicorn worker gets its own sockets
+        self.pool = None
+        self.replicas = None
+        self.pool_pid = None
+        self.pool_lock = threading.Lock()
         
-    def db_connection(self):
+    def create_backend(self, name, settings):
+        if name == "sqlite":
+            return SQLiteBackend(settings, self.base_path)
+        return MySQLBackend(settings)
+        
+    def connect(self):
+        # Open a new raw connection, used by the pool to fill itself
+        return self.backend.connect()
+        
+    def create_pool(self, connect, pool_settings, name):
+        return ConnectionPool(
+            connect,
+            size=pool_settings.get("size", self.pool_size),
+            max_overflow=pool_settings.get("max_overflow", self.pool_max_overflow),
+            timeout=pool_settings.get("timeout", self.pool_timeout),
+            recycle=pool_settings.get("recycle", self.pool_recycle),
+            pre_ping=pool_settings.get("pre_ping", self.pool_pre_ping),
+            max_statements=pool_settings.get("max_statements", self.pool_max_statements),
+            metrics=self.metrics,
+            name=name
+        )
+        
+    def get_pool(self):
+        with self.pool_lock:
+            if self.pool is None or self.pool_pid != os.getpid():
+                self.pool = self.create_pool(self.connect, {}, "primary")
+                self.replicas = ReplicaSet(
+                    [(name, backend, self.create_pool(backend.connect, pool_settings, name)) for name, backend, pool_settings in self.replica_backends],
+                    eject_seconds=self.replica_eject_seconds,
+                    max_lag=self.replica_max_lag,
+                    check_interval=self.replica_check_interval,
+                    metrics=self.metrics
+                )
+                self.pool_pid = os.getpid()
+            return self.pool
+        
+    def db_connection(self, read_only=False):
         try:
-            connection = mysql.connector.connect(
-                user=self.user,
-                password=self.password,
-                host=self.host,
-                database=self.database_name
-            )
-            return connection
+            # Reads that may be slightly stale go to a healthy replica when there is one
+            if read_only and self.replica_backends:
+                self.get_pool()
+                connection = self.replicas.acquire()
+                if connection is not None:
+                    return connection
+            # Calling close() on the returned connection hands it back to the pool
+            return self.get_pool().acquire()
                 
         except Exception as error:
             self.logger.debug(error)
+            
+    def pool_stats(self):
+        return self.get_pool().stats()
+        
+    def replica_stats(self):
+        self.get_pool()
+        return self.replicas.stats()
         
     def create_tables(self):
         try:
             connection = self.db_connection()
-            self.tables["users"] = (
-                "CREATE TABLE IF NOT EXISTS `users` ("
-                "`id` bigint(20) UNSIGNED NOT NULL AUTO_INCREMENT,"
-                "`email` varchar(255) NOT NULL,"
-                "`password` varchar(255) NOT NULL,"
-                "`role` varchar(255) NOT NULL,"
-                "`created_at` timestamp NULL DEFAULT NULL,"
-                "`updated_at` timestamp NULL DEFAULT NULL,"
-                "PRIMARY KEY (`id`)"
-                ") ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci"
-            )
+            # Columns are (name, type, options), the backend turns "id", "bigint" and "int" into its own types
+            self.tables["users"] = {
+                "columns": [
+                    ("id", "id", ""),
+                    ("email", "varchar(255)", "NOT NULL"),
+                    ("password", "varchar(255)", "NOT NULL"),
+                    ("role", "varchar(255)", "NOT NULL"),
+                    ("created_at", "timestamp", "NULL DEFAULT NULL"),
+                    ("updated_at", "timestamp", "NULL DEFAULT NULL"),
+                ],
+            }
+            
+            self.tables["cars"] = {
+                "columns": [
+                    ("id", "id", ""),
+                    ("name", "varchar(255)", "DEFAULT NULL"),
+                    ("model", "varchar(255)", "DEFAULT NULL"),
+                    ("description", "text", "DEFAULT NULL"),
+                    ("image", "varchar(255)", "DEFAULT NULL"),
+                    ("brand_id", "bigint", "DEFAULT NULL"),
+                    ("category_id", "bigint", "DEFAULT NULL"),
+                    ("created_at", "timestamp", "NULL DEFAULT NULL"),
+                    ("updated_at", "timestamp", "NULL DEFAULT NULL"),
+                ],
+            }
             
-            self.tables["cars"] = (
-                "CREATE TABLE IF NOT EXISTS `cars` ("
-                "`id` bigint(20) UNSIGNED NOT NULL AUTO_INCREMENT,"
-                "`name` varchar(255) DEFAULT NULL,"
-                "`model` varchar(255) DEFAULT NULL,"
-                "`description` text DEFAULT NULL,"
-                "`image` varchar(255) DEFAULT NULL,"
-                "`brand_id` bigint(20) UNSIGNED DEFAULT NULL,"
-                "`category_id` bigint(20) UNSIGNED DEFAULT NULL,"
-                "`created_at` timestamp NULL DEFAULT NULL,"
-                "`updated_at` timestamp NULL DEFAULT NULL,"
-                "PRIMARY KEY (`id`)"
-                ") ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci"
-            )
+            self.tables["brands"] = {
+                "columns": [
+                    ("id", "id", ""),
+                    ("name", "varchar(255)", "NOT NULL"),
+                    ("image", "varchar(255)", "DEFAULT NULL"),
+                    ("created_at", "timestamp", "NULL DEFAULT NULL"),
+                    ("updated_at", "timestamp", "NULL DEFAULT NULL"),
+                ],
+            }
             
-            self.tables["brands"] = (
-                "CREATE TABLE IF NOT EXISTS `brands` ("
-                "`id` bigint(20) UNSIGNED NOT NULL AUTO_INCREMENT,"
-                "`name` varchar(255) NOT NULL,"
-                "`image` varchar(255) DEFAULT NULL,"
-                "`created_at` timestamp NULL DEFAULT NULL,"
-                "`updated_at` timestamp NULL DEFAULT NULL,"
-                "PRIMARY KEY (`id`)"
-                ") ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci"
-            )
+            self.tables["categories"] = {
+                "columns": [
+                    ("id", "id", ""),
+                    ("name", "varchar(255)", "NOT NULL"),
+                    ("created_at", "timestamp", "NULL DEFAULT NULL"),
+                    ("updated_at", "timestamp", "NULL DEFAULT NULL"),
+                ],
+            }
             
-            self.tables["categories"] = (
-                "CREATE TABLE IF NOT EXISTS `categories` ("
-                "`id` bigint(20) UNSIGNED NOT NULL AUTO_INCREMENT,"
-                "`name` varchar(255) NOT NULL,"
-                "`created_at` timestamp NULL DEFAULT NULL,"
-                "`updated_at` timestamp NULL DEFAULT NULL,"
-                "PRIMARY KEY (`id`)"
-                ") ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci"
-            )
+            self.tables["colours"] = {
+                "columns": [
+                    ("id", "id", ""),
+                    ("name", "varchar(255)", "NOT NULL"),
+                    ("hex", "varchar(7)", "NOT NULL"),
+                    ("created_at", "timestamp", "NULL DEFAULT NULL"),
+                    ("updated_at", "timestamp", "NULL DEFAULT NULL"),
+                ],
+            }
             
-            self.tables["colours"] = (
-                "CREATE TABLE IF NOT EXISTS `colours` ("
-                "`id` bigint(20) UNSIGNED NOT NULL AUTO_INCREMENT,"
-                "`name` varchar(255) NOT NULL,"
-                "`hex` varchar(7) NOT NULL,"
-                "`created_at` timestamp NULL DEFAULT NULL,"
-                "`updated_at` timestamp NULL DEFAULT NULL,"
-                "PRIMARY KEY (`id`)"
-                ") ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci"
-            )
+            self.tables["car_colours"] = {
+                "columns": [
+                    ("car_id", "bigint", "NOT NULL"),
+                    ("colour_id", "bigint", "NOT NULL"),
+                    ("created_at", "timestamp", "NULL DEFAULT NULL"),
+                    ("updated_at", "timestamp", "NULL DEFAULT NULL"),
+                ],
+                "keys": [
+                    ("foreign", "car_id", "cars(id)"),
+                    ("foreign", "colour_id", "colours(id)"),
+                ],
+            }
             
-            self.tables["car_colours"] = (
-                "CREATE TABLE IF NOT EXISTS `car_colours` ("
-                "car_id bigint(20) UNSIGNED NOT NULL,"
-                "colour_id bigint(20) UNSIGNED NOT NULL,"
-                "FOREIGN KEY (car_id) REFERENCES cars(id) ON UPDATE CASCADE,"
-                "FOREIGN KEY (colour_id) REFERENCES colours(id) ON UPDATE CASCADE,"
-                "`created_at` timestamp NULL DEFAULT NULL,"
-                "`updated_at` timestamp NULL DEFAULT NULL"
-                ") ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci"
-            )
+            self.tables["access_tokens"] = {
+                "columns": [
+                    ("id", "id", ""),
+                    ("jti", "varchar(255)", "NOT NULL"),
+                    ("token", "varchar(255)", "NOT NULL"),
+                    ("email", "varchar(255)", "NOT NULL"),
+                    ("created_at", "timestamp", "NULL DEFAULT NULL"),
+                    ("updated_at", "timestamp", "NULL DEFAULT NULL"),
+                    ("expired_at", "timestamp", "NULL DEFAULT NULL"),
+                ],
+            }
             
-            self.tables["access_tokens"] = (
-                "CREATE TABLE IF NOT EXISTS `access_tokens` ("
-                "`id` bigint(20) UNSIGNED NOT NULL AUTO_INCREMENT,"
-                "`jti` varchar(255) NOT NULL,"
-                "`token` varchar(255) NOT NULL,"
-                "`email` varchar(255) NOT NULL,"
-                "`created_at` timestamp NULL DEFAULT NULL,"
-                "`updated_at` timestamp NULL DEFAULT NULL,"
-                "`expired_at` timestamp NULL DEFAULT NULL,"
-                "PRIMARY KEY (`id`)"
-                ") ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci"
-            )
+            self.tables["expired_access_tokens"] = {
+                "columns": [
+                    ("id", "id", ""),
+                    ("jti", "varchar(255)", "NOT NULL"),
+                    ("token", "varchar(255)", "NOT NULL"),
+                    ("email", "varchar(255)", "NOT NULL"),
+                    ("created_at", "timestamp", "NULL DEFAULT NULL"),
+                    ("updated_at", "timestamp", "NULL DEFAULT NULL"),
+                    ("expired_at", "timestamp", "NULL DEFAULT NULL"),
+                ],
+            }
             
-            self.tables["expired_access_tokens"] = (
-                "CREATE TABLE IF NOT EXISTS `expired_access_tokens` ("
-                "`id` bigint(20) UNSIGNED NOT NULL AUTO_INCREMENT,"
-                "`jti` varchar(255) NOT NULL,"
-                "`token` varchar(255) NOT NULL,"
-                "`email` varchar(255) NOT NULL,"
-                "`created_at` timestamp NULL DEFAULT NULL,"
-                "`updated_at` timestamp NULL DEFAULT NULL,"
-                "`expired_at` timestamp NULL DEFAULT NULL,"
-                "PRIMARY KEY (`id`)"
-                ") ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci"
-            )
+            self.tables["import_jobs"] = {
+                "columns": [
+                    ("id", "id", ""),
+                    ("name", "varchar(255)", "NOT NULL"),
+                    ("rows_committed", "bigint", "NOT NULL DEFAULT 0"),
+                    ("inserted", "bigint", "NOT NULL DEFAULT 0"),
+                    ("rejected", "bigint", "NOT NULL DEFAULT 0"),
+                    ("status", "varchar(32)", "NOT NULL"),
+                    ("created_at", "timestamp", "NULL DEFAULT NULL"),
+                    ("updated_at", "timestamp", "NULL DEFAULT NULL"),
+                ],
+                "keys": [
+                    ("unique", "import_jobs_name_unique", ["name"]),
+                ],
+            }
             
             # Create a cursor to execute SQL queries
             cursor = connection.cursor()
             for table_name in self.tables:
-                create_definition = self.tables[table_name]
-                cursor.execute(create_definition)
+                cursor.execute(self.backend.create_table(table_name, self.tables[table_name]))
             # Close cursor and connection
             cursor.close()
             connection.close()
@@ -143,5 +251,8 @@ class Database:
             self.logger.debug(error)
             
 if __name__ == "__main__":
+    from Migrations import Migrations
     db_instance = Database()
-    db_instance.create_tables()
\ No newline at end of file
+    db_instance.create_tables()
+    # Add the indexes and keys of later schema versions
+    Migrations(db_instance, db_instance.logger).migrate()
\ No newline at end of file
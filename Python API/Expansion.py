@@ -0,0 +1,73 @@
+class Expansion:
+
+    def __init__(self, database) -> None:
+        self.database = database
+        self.relations = ["brand", "category", "colours"]
+
+    def parse(self, value):
+        # Read expand=brand,category,colours, raises ValueError on unknown relations
+        if not value:
+            return []
+        requested = [relation.strip() for relation in value.split(",") if relation.strip()]
+        unknown = [relation for relation in requested if relation not in self.relations]
+        if unknown:
+            raise ValueError(f"unknown expand: {', '.join(unknown)}")
+        return [relation for relation in self.relations if relation in requested]
+
+    def required_fields(self, expand):
+        # Car columns the expansion needs even when fields= leaves them out
+        fields = []
+        if "brand" in expand:
+            fields.append("brand_id")
+        if "category" in expand:
+            fields.append("category_id")
+        return fields
+
+    def related_tables(self, expand):
+        # Tables whose changes must also change the validators of an expanded list
+        tables = []
+        if "brand" in expand:
+            tables.append("brands")
+        if "category" in expand:
+            tables.append("categories")
+        if "colours" in expand:
+            tables.extend(["car_colours", "colours"])
+        return tables
+
+    def expand(self, cursor, cars, expand) -> None:
+        # One batched query per relation, however many cars are on the page
+        if not cars or not expand:
+            return
+
+        if "brand" in expand:
+            brands = self.fetch_by_id(cursor, "brands", set(car["brand_id"] for car in cars if car["brand_id"] is not None))
+            for car in cars:
+                car["brand"] = brands.get(car["brand_id"])
+
+        if "category" in expand:
+            categories = self.fetch_by_id(cursor, "categories", set(car["category_id"] for car in cars if car["category_id"] is not None))
+            for car in cars:
+                car["category"] = categories.get(car["category_id"])
+
+        if "colours" in expand:
+            colours = {car["id"]: [] for car in cars}
+            placeholders = ", ".join(["%s"] * len(colours))
+            columns = self.database.columns["colours"]
+            query = (
+                f"SELECT car_colours.car_id, {', '.join('colours.' + column for column in columns)} "
+                "FROM car_colours JOIN colours ON colours.id = car_colours.colour_id "
+                f"WHERE car_colours.car_id IN ({placeholders}) ORDER BY car_colours.car_id, colours.id"
+            )
+            cursor.execute(query, list(colours))
+            for row in cursor.fetchall():
+                colours[row[0]].append(dict(zip(columns, row[1:])))
+            for car in cars:
+                car["colours"] = colours[car["id"]]
+
+    def fetch_by_id(self, cursor, table, ids):
+        if not ids:
+            return {}
+        columns = self.database.columns[table]
+        query = f"SELECT {', '.join(columns)} FROM {table} WHERE id IN ({', '.join(['%s'] * len(ids))})"
+        cursor.execute(query, list(ids))
+        return {row[0]: dict(zip(columns, row)) for row in cursor.fetchall()}
@@ -0,0 +1,41 @@
+from datetime import datetime
+
+
+class Filters:
+
+    def __init__(self) -> None:
+        # Query parameter -> (parameterised SQL condition, value parser), only these are accepted
+        self.allowed = {
+            "cars": {
+                "brand_id": ("cars.brand_id = %s", int),
+                "category_id": ("cars.category_id = %s", int),
+                "colour_id": (
+                    "EXISTS (SELECT 1 FROM car_colours "
+                    "WHERE car_colours.car_id = cars.id AND car_colours.colour_id = %s)",
+                    int
+                ),
+                "created_after": ("cars.created_at > %s", datetime.fromisoformat),
+            },
+        }
+        # Columns accepted by sort=, each one is backed by an index
+        self.sortable = {
+            "cars": ["id", "name", "created_at", "updated_at"],
+            "brands": ["id", "name"],
+            "categories": ["id", "name"],
+            "colours": ["id", "name"],
+        }
+
+    def parse(self, table, args):
+        # Returns (conditions, params) for the filters present in args, raises ValueError on bad values
+        conditions = []
+        params = []
+        for key, (condition, parse_value) in self.allowed.get(table, {}).items():
+            value = args.get(key)
+            if value is None:
+                continue
+            try:
+                params.append(parse_value(value))
+            except ValueError:
+                raise ValueError(f"invalid value for {key}")
+            conditions.append(condition)
+        return conditions, params
@@ -0,0 +1,235 @@
+import hashlib
+import multiprocessing
+import os
+import re
+import tempfile
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+try:
+    from PIL import Image
+except ImportError:
+    Image = None
+
+
+def write_atomic(path, data) -> None:
+    # Readers see either no file or the whole file, never a partial one
+    directory = os.path.dirname(path)
+    os.makedirs(directory, exist_ok=True)
+    fd, temporary = tempfile.mkstemp(dir=directory, prefix=".upload-")
+    try:
+        with os.fdopen(fd, "wb") as file:
+            file.write(data)
+        os.replace(temporary, path)
+    except Exception:
+        os.unlink(temporary)
+        raise
+
+
+def make_variants(original, directory, digest, widths, quality) -> list:
+    # Runs in a worker process, resizing is CPU bound and would hold the GIL on a request thread
+    created = []
+    with Image.open(original) as image:
+        image.load()
+        if image.mode not in ["RGB", "RGBA"]:
+            image = image.convert("RGBA" if "transparency" in image.info else "RGB")
+        for width in widths:
+            if width < image.width:
+                resized = image.resize((width, round(image.height * width / image.width)), Image.LANCZOS)
+            else:
+                # Never upscale, smaller originals are only re-encoded
+                resized = image
+            for extension, save in [
+                ("webp", {"format": "WEBP", "quality": quality, "method": 4}),
+                ("jpg", {"format": "JPEG", "quality": quality, "optimize": True, "progressive": True}),
+            ]:
+                name = f"{digest}-{width}.{extension}"
+                path = os.path.join(directory, name)
+                if os.path.exists(path):
+                    continue
+                output = resized.convert("RGB") if extension == "jpg" and resized.mode != "RGB" else resized
+                fd, temporary = tempfile.mkstemp(dir=directory, prefix=".variant-")
+                try:
+                    with os.fdopen(fd, "wb") as file:
+                        output.save(file, **save)
+                    os.replace(temporary, path)
+                except Exception:
+                    os.unlink(temporary)
+                    raise
+                created.append(name)
+    return created
+
+
+class ImageStore:
+
+    def __init__(self, root, widths=(160, 480, 1024), workers=2, max_bytes=10 * 1024 * 1024, quality=80, logger=None, metrics=None) -> None:
+        # Files live under root/<first 2 hex>/<next 2 hex>/ so no directory grows too large
+        self.root = root
+        self.widths = tuple(sorted(widths))
+        self.workers = workers
+        self.max_bytes = max_bytes
+        self.quality = quality
+        self.logger = logger
+        self.metrics = metrics
+        self.digest_pattern = re.compile(r"^[0-9a-f]{64}$")
+        # Magic bytes -> file extension, anything else is rejected
+        self.signatures = [
+            (b"\xff\xd8\xff", "jpg"),
+            (b"\x89PNG\r\n\x1a\n", "png"),
+            (b"GIF87a", "gif"),
+            (b"GIF89a", "gif"),
+        ]
+        self.content_types = {"jpg": "image/jpeg", "png": "image/png", "gif": "image/gif", "webp": "image/webp"}
+        self.lock = threading.Lock()
+        self.executor = None
+        self.executor_pid = None
+        # Variants being generated, so a repeated upload does not queue the same work twice
+        self.pending = set()
+        # Images Pillow could not read, they are served as uploaded instead of being retried on every request
+        self.failed = set()
+        # Counters for image stats
+        self.uploads = 0
+        self.duplicates = 0
+        self.variants_created = 0
+        self.variant_failures = 0
+        if Image is None and logger is not None:
+            logger.warning("Pillow is not installed, images are served without thumbnails")
+
+    def get_executor(self):
+        # Created lazily so every gunicorn worker owns its processes, spawned because the API process runs threads
+        with self.lock:
+            if self.executor is None or self.executor_pid != os.getpid():
+                self.executor = ProcessPoolExecutor(max_workers=self.workers, mp_context=multiprocessing.get_context("spawn"))
+                self.executor_pid = os.getpid()
+            return self.executor
+
+    def detect(self, data):
+        # Returns the file extension of a supported image, or None
+        if data[:4] == b"RIFF" and data[8:12] == b"WEBP":
+            return "webp"
+        for signature, extension in self.signatures:
+            if data.startswith(signature):
+                return extension
+        return None
+
+    def directory(self, digest) -> str:
+        return os.path.join(self.root, digest[:2], digest[2:4])
+
+    def original(self, digest):
+        # Path of the uploaded file, None when there is no image with this hash
+        if not self.digest_pattern.match(digest):
+            return None
+        directory = self.directory(digest)
+        for extension in self.content_types:
+            path = os.path.join(directory, f"{digest}.{extension}")
+            if os.path.exists(path):
+                return path
+        return None
+
+    def save(self, data):
+        # Returns (hash, created), an image that is already stored is not written again
+        extension = self.detect(data)
+        if extension is None:
+            raise ValueError("Unsupported image type, use JPEG, PNG, GIF or WebP")
+        digest = hashlib.sha256(data).hexdigest()
+        with self.lock:
+            self.uploads += 1
+        path = self.original(digest)
+        created = path is None
+        if created:
+            path = os.path.join(self.directory(digest), f"{digest}.{extension}")
+            write_atomic(path, data)
+        else:
+            with self.lock:
+                self.duplicates += 1
+        self.generate(digest, path)
+        return digest, created
+
+    def missing_variants(self, digest) -> list:
+        directory = self.directory(digest)
+        return [
+            width for width in self.widths
+            if not all(os.path.exists(os.path.join(directory, f"{digest}-{width}.{extension}")) for extension in ["webp", "jpg"])
+        ]
+
+    def generate(self, digest, path) -> None:
+        # Queued on the process pool, the upload response does not wait for it
+        if Image is None:
+            return
+        widths = self.missing_variants(digest)
+        with self.lock:
+            if not widths or digest in self.pending or digest in self.failed:
+                return
+            self.pending.add(digest)
+        executor = None
+        try:
+            executor = self.get_executor()
+            future = executor.submit(make_variants, path, self.directory(digest), digest, widths, self.quality)
+        except Exception as error:
+            # The image is stored already, missing thumbnails are queued again on the next request for them
+            with self.lock:
+                self.pending.discard(digest)
+            if isinstance(error, BrokenProcessPool) and executor is not None:
+                self.drop_executor(executor)
+            if self.logger is not None:
+                self.logger.error(f"Queueing variants of {digest} failed: {error}")
+            return
+        future.add_done_callback(lambda future: self.generated(digest, future, executor))
+
+    def drop_executor(self, executor) -> None:
+        # A pool whose worker died refuses all work, the next get_executor() starts a new one
+        with self.lock:
+            if self.executor is not executor:
+                return
+            self.executor = None
+        executor.shutdown(wait=False)
+
+    def generated(self, digest, future, executor) -> None:
+        with self.lock:
+            self.pending.discard(digest)
+        error = future.exception()
+        if isinstance(error, BrokenProcessPool):
+            # A worker was killed, e.g. out of memory on a huge image, the image is not retried
+            self.drop_executor(executor)
+        if error is not None:
+            with self.lock:
+                self.variant_failures += 1
+                self.failed.add(digest)
+            if self.logger is not None:
+                self.logger.error(f"Creating variants of {digest} failed: {error}")
+            return
+        created = future.result()
+        with self.lock:
+            self.variants_created += len(created)
+        if self.metrics is not None:
+            self.metrics.increment("image_variants_total", (), len(created))
+
+    def variant(self, digest, width=None, format=None):
+        # Returns (path, content type, final), final is False when the variant is still being generated
+        original = self.original(digest)
+        if original is None:
+            return None
+        if width is None and format is None:
+            return original, self.content_types[original.rsplit(".", 1)[1]], True
+        # Smallest configured width that is at least the requested one, the largest without a width
+        widths = [value for value in self.widths if width is not None and value >= width] or [self.widths[-1]]
+        name = f"{digest}-{widths[0]}.{'webp' if format == 'webp' else 'jpg'}"
+        path = os.path.join(self.directory(digest), name)
+        if os.path.exists(path):
+            return path, self.content_types[name.rsplit(".", 1)[1]], True
+        self.generate(digest, original)
+        # A stand-in is never final, the same URL names a different file once the variant exists
+        # or when Pillow is installed later, so caches must not keep the original for long
+        return original, self.content_types[original.rsplit(".", 1)[1]], False
+
+    def stats(self) -> dict:
+        with self.lock:
+            return {
+                "thumbnails": Image is not None,
+                "uploads": self.uploads,
+                "duplicates": self.duplicates,
+                "pending": len(self.pending),
+                "variants_created": self.variants_created,
+                "variant_failures": self.variant_failures,
+            }
@@ -0,0 +1,211 @@
+import argparse
+import csv
+import json
+import os
+import time
+from datetime import datetime
+from Database import Database
+from Logger import Logger
+
+
+class Importer:
+
+    def __init__(self, database, logger, chunk_size=1000, progress_every=10000) -> None:
+        self.database = database
+        self.logger = logger
+        self.chunk_size = chunk_size
+        self.progress_every = progress_every
+        # Only the first few rejected rows are kept for the report
+        self.max_errors = 100
+
+    def parse(self, lines, format):
+        # Yields one item per source row without reading the whole file, decode() turns it into a record
+        # inside the per-row error handling, so a malformed row is rejected instead of ending the import
+        if format == "csv":
+            reader = csv.DictReader(lines)
+            while True:
+                try:
+                    record = next(reader)
+                except StopIteration:
+                    return
+                except csv.Error as error:
+                    # The reader starts again on the next line
+                    yield error
+                    continue
+                yield record
+        elif format == "ndjson":
+            for line in lines:
+                line = line.strip()
+                if line:
+                    yield line
+        else:
+            raise ValueError(f"Unknown import format {format}")
+
+    def decode(self, item):
+        if isinstance(item, Exception):
+            raise ValueError(f"Unreadable row - {item}")
+        if isinstance(item, str):
+            item = json.loads(item)
+        if not isinstance(item, dict):
+            raise ValueError("Row is not an object")
+        return item
+
+    def load_names(self, cursor):
+        # Lower-cased brand and category names mapped to their ids
+        cursor.execute("SELECT id, name FROM brands")
+        brands = {name.strip().lower(): id for id, name in cursor.fetchall()}
+        cursor.execute("SELECT id, name FROM categories")
+        categories = {name.strip().lower(): id for id, name in cursor.fetchall()}
+        return brands, categories
+
+    def resolve(self, record, names, key):
+        # Accept either brand_id / category_id or brand / category by name
+        if record.get(f"{key}_id") not in [None, ""]:
+            return int(record[f"{key}_id"])
+        name = record.get(key)
+        if name in [None, ""]:
+            return None
+        id = names.get(str(name).strip().lower())
+        if id is None:
+            raise ValueError(f"Unknown {key} '{name}'")
+        return id
+
+    def start_job(self, cursor, job):
+        # Returns the number of source rows already committed by an earlier run
+        cursor.execute("SELECT rows_committed, inserted, rejected, status FROM import_jobs WHERE name = %s", (job,))
+        row = cursor.fetchone()
+        if row is None:
+            now = datetime.now()
+            cursor.execute(
+                "INSERT INTO import_jobs (name, rows_committed, inserted, rejected, status, created_at, updated_at) "
+                "VALUES (%s, 0, 0, 0, 'running', %s, %s)",
+                (job, now, now)
+            )
+            return 0, 0, 0, "running"
+        return row
+
+    def run(self, lines, format, job, report=None):
+        connection = None
+        cursor = None
+        try:
+            connection = self.database.db_connection()
+            cursor = connection.cursor()
+            committed, inserted, rejected, status = self.start_job(cursor, job)
+            connection.commit()
+            if status == "done":
+                return {"job": job, "status": "done", "rows": committed, "inserted": inserted, "rejected": rejected, "resumed_from": committed}
+
+            brands, categories = self.load_names(cursor)
+            query = (
+                "INSERT INTO cars "
+                "(name, model, description, image, brand_id, category_id, created_at, updated_at) "
+                "VALUES (%s, %s, %s, %s, %s, %s, %s, %s)"
+            )
+
+            resumed_from = committed
+            position = 0
+            chunk = []
+            chunk_rejected = 0
+            errors = []
+            start = time.monotonic()
+            last_report = 0
+
+            for item in self.parse(lines, format):
+                position += 1
+                # Skip what a previous run already committed
+                if position <= resumed_from:
+                    continue
+                try:
+                    record = self.decode(item)
+                    now = datetime.now()
+                    chunk.append((
+                        record.get("name"),
+                        record.get("model"),
+                        record.get("description"),
+                        record.get("image"),
+                        self.resolve(record, brands, "brand"),
+                        self.resolve(record, categories, "category"),
+                        now,
+                        now
+                    ))
+                except (ValueError, TypeError, AttributeError) as error:
+                    chunk_rejected += 1
+                    if len(errors) < self.max_errors:
+                        errors.append({"row": position, "error": str(error)})
+
+                if len(chunk) + chunk_rejected >= self.chunk_size:
+                    inserted += self.commit_chunk(connection, cursor, query, chunk, job, position, inserted + len(chunk), rejected + chunk_rejected)
+                    rejected += chunk_rejected
+                    committed = position
+                    chunk = []
+                    chunk_rejected = 0
+
+                    if committed - last_report >= self.progress_every:
+                        last_report = committed
+                        self.progress(job, committed - resumed_from, start, report)
+
+            # Last partial chunk also marks the job as done
+            committed = max(position, committed)
+            inserted += self.commit_chunk(connection, cursor, query, chunk, job, committed, inserted + len(chunk), rejected + chunk_rejected, "done")
+            rejected += chunk_rejected
+
+            elapsed = time.monotonic() - start
+            summary = {
+                "job": job,
+                "status": "done",
+                "rows": committed,
+                "inserted": inserted,
+                "rejected": rejected,
+                "resumed_from": resumed_from,
+                "elapsed": elapsed,
+                "rows_per_sec": (committed - resumed_from) / elapsed if elapsed > 0 else 0.0,
+                "errors": errors,
+            }
+            self.logger.debug(f"Import {job} finished: {committed} rows, {inserted} inserted, {rejected} rejected in {elapsed:.1f}s")
+            return summary
+
+        except Exception:
+            if connection is not None:
+                connection.rollback()
+            raise
+
+        finally:
+            if cursor is not None:
+                cursor.close()
+            if connection is not None:
+                connection.close()
+
+    def commit_chunk(self, connection, cursor, query, chunk, job, position, inserted, rejected, status="running") -> int:
+        # Rows and checkpoint are committed together so a resumed run never inserts twice
+        if chunk:
+            cursor.executemany(query, chunk)
+        cursor.execute(
+            "UPDATE import_jobs SET rows_committed = %s, inserted = %s, rejected = %s, status = %s, updated_at = %s "
+            "WHERE name = %s",
+            (position, inserted, rejected, status, datetime.now(), job)
+        )
+        connection.commit()
+        return len(chunk)
+
+    def progress(self, job, rows, start, report) -> None:
+        elapsed = time.monotonic() - start
+        rate = rows / elapsed if elapsed > 0 else 0.0
+        message = f"Import {job}: {rows} rows in {elapsed:.1f}s ({rate:.0f} rows/s)"
+        self.logger.debug(message)
+        if report is not None:
+            report(message)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Import cars from a CSV or NDJSON file")
+    parser.add_argument("path")
+    parser.add_argument("--format", choices=["csv", "ndjson"], help="defaults to the file extension")
+    parser.add_argument("--job", help="job name used to resume, defaults to the file name")
+    parser.add_argument("--chunk-size", type=int, default=1000)
+    args = parser.parse_args()
+
+    format = args.format or ("ndjson" if args.path.endswith((".ndjson", ".jsonl")) else "csv")
+    importer = Importer(Database(), Logger(), chunk_size=args.chunk_size)
+    with open(args.path, "r", encoding="utf-8", newline="") as file:
+        summary = importer.run(file, format, args.job or os.path.basename(args.path), report=print)
+    print(json.dumps(summary, indent=4))
@@ -0,0 +1,185 @@
+import argparse
+import json
+import time
+from datetime import date, datetime, timedelta, timezone
+from decimal import Decimal
+from json.encoder import encode_basestring_ascii
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+class JsonEncoder:
+
+    def __init__(self, backend=None, dates="http") -> None:
+        # backend is "orjson" or "json", by default orjson when it is installed
+        if backend is None:
+            backend = "orjson" if orjson is not None else "json"
+        if backend == "orjson" and orjson is None:
+            raise ValueError("orjson is not installed")
+        if backend not in ["orjson", "json"]:
+            raise ValueError(f"Unknown JSON backend {backend}")
+        # "http" keeps the RFC 822 dates Flask has always sent, "iso" is ISO 8601 and faster with orjson
+        if dates not in ["http", "iso"]:
+            raise ValueError(f"Unknown date format {dates}")
+        self.backend = backend
+        self.dates = dates
+        self.day_names = ["Mon", "Tue", "Wed", "Thu", "Fri", "Sat", "Sun"]
+        self.month_names = ["Jan", "Feb", "Mar", "Apr", "May", "Jun", "Jul", "Aug", "Sep", "Oct", "Nov", "Dec"]
+        if backend == "orjson":
+            # Keys are sorted like Flask's provider so responses do not change
+            self.options = orjson.OPT_SORT_KEYS | orjson.OPT_NON_STR_KEYS
+            if dates == "http":
+                self.options |= orjson.OPT_PASSTHROUGH_DATETIME
+        # type -> function returning the JSON text of a value, used to encode rows without dictionaries
+        self.value_encoders = {
+            str: encode_basestring_ascii,
+            int: int.__repr__,
+            float: float.__repr__,
+            bool: lambda value: "true" if value else "false",
+            type(None): lambda value: "null",
+            datetime: lambda value: encode_basestring_ascii(self.format_date(value)),
+            date: lambda value: encode_basestring_ascii(self.format_date(value)),
+        }
+        # fields -> (key fragments, column order) so each row shape is prepared once
+        self.layouts = {}
+        # Formatted dates, rows often share timestamps and created_at equals updated_at until the first update
+        self.date_cache = {}
+        self.date_cache_size = 10000
+
+    def http_date(self, value) -> str:
+        # Same output as werkzeug's http_date, naive values are taken as UTC
+        if isinstance(value, datetime):
+            if value.tzinfo is not None:
+                value = value.astimezone(timezone.utc)
+            hour, minute, second = value.hour, value.minute, value.second
+        else:
+            hour = minute = second = 0
+        return "%s, %02d %s %04d %02d:%02d:%02d GMT" % (
+            self.day_names[value.weekday()], value.day, self.month_names[value.month - 1], value.year, hour, minute, second
+        )
+
+    def format_date(self, value) -> str:
+        text = self.date_cache.get(value)
+        if text is None:
+            text = self.http_date(value) if self.dates == "http" else value.isoformat()
+            if len(self.date_cache) >= self.date_cache_size:
+                self.date_cache.clear()
+            self.date_cache[value] = text
+        return text
+
+    def default(self, value):
+        # Types neither encoder handles natively, same conversions as Flask's provider
+        if isinstance(value, date):
+            return self.format_date(value)
+        if isinstance(value, Decimal):
+            return str(value)
+        if isinstance(value, (bytes, bytearray)):
+            return value.decode("utf-8")
+        if isinstance(value, (set, frozenset)):
+            return list(value)
+        raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+    def dumps(self, value, indent=False) -> bytes:
+        if self.backend == "orjson":
+            options = self.options | orjson.OPT_INDENT_2 if indent else self.options
+            return orjson.dumps(value, default=self.default, option=options)
+        if indent:
+            return json.dumps(value, default=self.default, sort_keys=True, indent=2).encode("utf-8")
+        return json.dumps(value, default=self.default, sort_keys=True, separators=(",", ":")).encode("utf-8")
+
+    def layout(self, fields):
+        key = tuple(fields)
+        layout = self.layouts.get(key)
+        if layout is None:
+            # Columns in sorted key order, each with its '"key":' prefix
+            order = sorted(range(len(fields)), key=lambda index: fields[index])
+            layout = [(index, encode_basestring_ascii(fields[index]) + ":") for index in order]
+            self.layouts[key] = layout
+        return layout
+
+    def encode_row(self, layout, row) -> str:
+        encoders = self.value_encoders
+        parts = []
+        for index, prefix in layout:
+            value = row[index]
+            encoder = encoders.get(type(value))
+            parts.append(prefix + (encoder(value) if encoder is not None else json.dumps(value, default=self.default)))
+        return "{" + ",".join(parts) + "}"
+
+    def rows(self, fields, rows) -> bytes:
+        # JSON array of objects straight from cursor tuples
+        if self.backend == "orjson":
+            # orjson only writes objects from dicts, zipping in C is cheap next to encoding in Python
+            return orjson.dumps([dict(zip(fields, row)) for row in rows], default=self.default, option=self.options)
+        layout = self.layout(fields)
+        return ("[" + ",".join([self.encode_row(layout, row) for row in rows]) + "]").encode("utf-8")
+
+    def lines(self, fields, rows) -> bytes:
+        # NDJSON, one object per row
+        if self.backend == "orjson":
+            return b"".join([orjson.dumps(dict(zip(fields, row)), default=self.default, option=self.options) + b"\n" for row in rows])
+        layout = self.layout(fields)
+        return "".join([self.encode_row(layout, row) + "\n" for row in rows]).encode("utf-8")
+
+
+def sample_cars(count):
+    # Rows shaped like SELECT * FROM cars, every tenth car updated after it was created
+    start = datetime(2024, 1, 1, 9, 0, 0)
+    rows = []
+    for id in range(1, count + 1):
+        created_at = start + timedelta(seconds=id // 50)
+        updated_at = created_at + timedelta(days=1) if id % 10 == 0 else created_at
+        rows.append((id, f"Car {id}", f"Model {id % 250}", "Die-cast model in original box, minor wear", f"https://example.com/cars/{id}.jpg", id % 40 + 1, id % 12 + 1, created_at, updated_at))
+    return rows
+
+
+def stdlib_jsonify(fields, rows):
+    # What jsonify did before: dictionaries, sorted keys and werkzeug's http_date for every datetime
+    from email.utils import format_datetime
+    def default(value):
+        if isinstance(value, date):
+            return format_datetime(value.replace(tzinfo=timezone.utc), usegmt=True)
+        raise TypeError(type(value).__name__)
+    return json.dumps([dict(zip(fields, row)) for row in rows], default=default, sort_keys=True, separators=(",", ":")).encode("utf-8")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compare JSON encoders on cars rows")
+    parser.add_argument("--rows", type=int, default=100000, help="Number of synthetic cars rows")
+    parser.add_argument("--from-database", action="store_true", help="Read the rows from the cars table instead")
+    parser.add_argument("--repeat", type=int, default=5, help="Runs per encoder, the best one is reported")
+    args = parser.parse_args()
+
+    fields = ["id", "name", "model", "description", "image", "brand_id", "category_id", "created_at", "updated_at"]
+    if args.from_database:
+        from Database import Database
+        connection = Database().db_connection()
+        cursor = connection.cursor()
+        cursor.execute(f"SELECT {', '.join(fields)} FROM cars ORDER BY id LIMIT %s", (args.rows,))
+        rows = cursor.fetchall()
+        cursor.close()
+        connection.close()
+    else:
+        rows = sample_cars(args.rows)
+
+    candidates = [("stdlib jsonify", lambda: stdlib_jsonify(fields, rows))]
+    for backend in ["json", "orjson"] if orjson is not None else ["json"]:
+        for dates in ["http", "iso"]:
+            encoder = JsonEncoder(backend, dates)
+            candidates.append((f"{backend} rows, {dates} dates", lambda encoder=encoder: encoder.rows(fields, rows)))
+
+    expected = json.loads(candidates[0][1]())
+    baseline = None
+    for name, encode in candidates:
+        timings = []
+        for _ in range(args.repeat):
+            start = time.perf_counter()
+            output = encode()
+            timings.append(time.perf_counter() - start)
+        best = min(timings)
+        baseline = baseline or best
+        same = "same output" if json.loads(output) == expected else "different dates"
+        print(f"{name:<24} {len(rows)} rows  {best * 1000:8.1f} ms  {len(output) / 1048576:6.1f} MiB  {baseline / best:5.2f}x  {same}")
@@ -0,0 +1,28 @@
+from flask.json.provider import DefaultJSONProvider
+
+
+class JsonProvider(DefaultJSONProvider):
+
+    def __init__(self, app, encoder) -> None:
+        super().__init__(app)
+        # JsonEncoder doing the actual work, orjson or the stdlib
+        self.encoder = encoder
+
+    def dumps(self, obj, **kwargs) -> str:
+        # Explicit json.dumps arguments are only understood by the stdlib provider
+        if kwargs:
+            return super().dumps(obj, **kwargs)
+        return self.encoder.dumps(obj).decode("utf-8")
+
+    def response(self, *args, **kwargs):
+        # Used by jsonify, pretty printed in debug mode like Flask's own provider
+        obj = self._prepare_response_obj(args, kwargs)
+        indent = not (self.compact or (self.compact is None and not self._app.debug))
+        return self._app.response_class(self.encoder.dumps(obj, indent) + b"\n", mimetype=self.mimetype)
+
+    def rows_response(self, fields, rows):
+        # Same body as jsonify([dict(zip(fields, row)) for row in rows])
+        return self._app.response_class(self.encoder.rows(fields, rows) + b"\n", mimetype=self.mimetype)
+
+    def lines(self, fields, rows) -> bytes:
+        return self.encoder.lines(fields, rows)
@@ -1,16 +1,152 @@
+import atexit
+import contextvars
+import copy
+import json
 import logging
+import logging.handlers
+import os
+import queue
+import random
+import threading
+import time
+from datetime import datetime, timezone
+
+# Request id, route and start time of the request being handled by this thread or task
+request_context = contextvars.ContextVar("request_context", default=None)
+
+
+class DroppingQueueHandler(logging.handlers.QueueHandler):
+
+    def __init__(self, log_queue) -> None:
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def prepare(self, record):
+        # Same as QueueHandler.prepare but the traceback stays apart from the message
+        record = copy.copy(record)
+        record.message = record.getMessage()
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+        record.msg = record.message
+        record.args = None
+        record.exc_info = None
+        return record
+
+    def enqueue(self, record) -> None:
+        # A slow disk must never block a request thread, records are dropped instead
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+class ContextFilter(logging.Filter):
+
+    def __init__(self, debug_sample_rate=1.0) -> None:
+        super().__init__()
+        self.debug_sample_rate = debug_sample_rate
+        self.sampled_out = 0
+
+    def filter(self, record) -> bool:
+        # Runs on the calling thread, before the record is queued
+        if record.levelno <= logging.DEBUG and self.debug_sample_rate < 1.0 and random.random() >= self.debug_sample_rate:
+            self.sampled_out += 1
+            return False
+        context = request_context.get()
+        if context is not None:
+            record.request_id = context["request_id"]
+            record.route = context["route"]
+            record.duration_ms = round((time.perf_counter() - context["started"]) * 1000, 3)
+        return True
+
+
+class JsonFormatter(logging.Formatter):
+
+    def format(self, record) -> str:
+        entry = {
+            "time": datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "message": record.getMessage(),
+        }
+        for key in ["request_id", "route", "duration_ms"]:
+            value = getattr(record, key, None)
+            if value is not None:
+                entry[key] = value
+        entry.update(getattr(record, "fields", {}))
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            entry["exception"] = record.exc_text
+        return json.dumps(entry, default=str)
+
 
 class Logger:
-    
+
+    # One queue and writer thread per process, shared by every Logger instance
+    lock = threading.Lock()
+    handler = None
+    context_filter = None
+    listener = None
+    pid = None
+
     def __init__(self) -> None:
-        logging.basicConfig(
-            format="%(asctime)s %(levelname)s %(message)s",
-            encoding="utf-8",
-            filename=r"F:\Others\Car Collection Project\Python API\app.log",
-            datefmt="%d/%m/%Y %H:%M:%S",
-            level=logging.DEBUG
-        )
-        self.logger = logging.getLogger()
-        
-    def debug(self, data) -> None:
-        self.logger.debug(data)
\ No newline at end of file
+        self.logger = logging.getLogger("car_collection")
+        self.setup()
+
+    def setup(self) -> None:
+        with Logger.lock:
+            # Also runs again in forked gunicorn workers, the writer thread does not survive a fork
+            if Logger.pid == os.getpid():
+                return
+            level = os.environ.get("API_LOG_LEVEL", "DEBUG").upper()
+            path = os.environ.get("API_LOG_FILE", os.path.join(os.path.dirname(os.path.abspath(__file__)), "app.log"))
+            queue_size = int(os.environ.get("API_LOG_QUEUE_SIZE", 10000))
+            debug_sample_rate = float(os.environ.get("API_LOG_DEBUG_SAMPLE", 1.0))
+
+            file_handler = logging.FileHandler(path, encoding="utf-8")
+            file_handler.setFormatter(JsonFormatter())
+            log_queue = queue.Queue(maxsize=queue_size)
+            handler = DroppingQueueHandler(log_queue)
+            context_filter = ContextFilter(debug_sample_rate)
+            handler.addFilter(context_filter)
+            listener = logging.handlers.QueueListener(log_queue, file_handler)
+            listener.start()
+            atexit.register(listener.stop)
+
+            self.logger.handlers = [handler]
+            self.logger.setLevel(level)
+            self.logger.propagate = False
+            Logger.handler = handler
+            Logger.context_filter = context_filter
+            Logger.listener = listener
+            Logger.pid = os.getpid()
+
+    def log(self, level, message, exc_info=False, **fields) -> None:
+        if Logger.pid != os.getpid():
+            self.setup()
+        if self.logger.isEnabledFor(level):
+            self.logger.log(level, message, exc_info=exc_info, extra={"fields": fields} if fields else None)
+
+    def debug(self, data, **fields) -> None:
+        self.log(logging.DEBUG, data, **fields)
+
+    def info(self, data, **fields) -> None:
+        self.log(logging.INFO, data, **fields)
+
+    def warning(self, data, **fields) -> None:
+        self.log(logging.WARNING, data, **fields)
+
+    def error(self, data, **fields) -> None:
+        self.log(logging.ERROR, data, **fields)
+
+    def exception(self, data, **fields) -> None:
+        # Only inside an except block, the traceback is added to the record
+        self.log(logging.ERROR, data, exc_info=True, **fields)
+
+    def stats(self) -> dict:
+        return {
+            "level": logging.getLevelName(self.logger.level),
+            "queued": Logger.handler.queue.qsize() if Logger.handler is not None else 0,
+            "dropped": Logger.handler.dropped if Logger.handler is not None else 0,
+            "sampled_out": Logger.context_filter.sampled_out if Logger.context_filter is not None else 0,
+        }
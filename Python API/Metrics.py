@@ -0,0 +1,114 @@
+import bisect
+import re
+import threading
+
+
+class Metrics:
+
+    def __init__(self, buckets=(0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)) -> None:
+        # Upper bounds in seconds shared by every histogram, +Inf is implied
+        self.buckets = tuple(buckets)
+        self.lock = threading.Lock()
+        # name -> (type, help text), in registration order for a stable exposition
+        self.descriptions = {}
+        # name -> {label pairs: value}
+        self.counters = {}
+        self.gauges = {}
+        # name -> {label pairs: [count per bucket..., sum, count]}
+        self.histograms = {}
+        # Callables returning {(name, label pairs): value} for gauges read at scrape time
+        self.collectors = []
+        # SQL -> (operation, table) labels, parsed once per query text
+        self.query_labels = {}
+        self.table_pattern = re.compile(r"\b(?:FROM|INTO|UPDATE|TABLE)\s+`?(\w+)", re.IGNORECASE)
+
+    def describe(self, name, kind, help) -> None:
+        self.descriptions[name] = (kind, help)
+
+    def increment(self, name, labels=(), value=1) -> None:
+        with self.lock:
+            series = self.counters.setdefault(name, {})
+            series[labels] = series.get(labels, 0) + value
+
+    def add(self, name, labels=(), value=1) -> None:
+        # Gauges go up and down, e.g. requests in flight
+        with self.lock:
+            series = self.gauges.setdefault(name, {})
+            series[labels] = series.get(labels, 0) + value
+
+    def observe(self, name, labels, value) -> None:
+        index = bisect.bisect_left(self.buckets, value)
+        with self.lock:
+            series = self.histograms.setdefault(name, {})
+            counts = series.get(labels)
+            if counts is None:
+                counts = series[labels] = [0] * (len(self.buckets) + 3)
+            # Only the first matching bucket is counted here, render() makes them cumulative
+            counts[index] += 1
+            counts[-2] += value
+            counts[-1] += 1
+
+    def observe_query(self, query, seconds) -> None:
+        labels = self.query_labels.get(query)
+        if labels is None:
+            words = query.split(None, 1)
+            match = self.table_pattern.search(query)
+            labels = (("operation", words[0].upper() if words else ""), ("table", match.group(1) if match else ""))
+            # Dynamic list queries have many texts, keep the label cache bounded
+            if len(self.query_labels) > 1000:
+                self.query_labels.clear()
+            self.query_labels[query] = labels
+        self.observe("db_query_duration_seconds", labels, seconds)
+
+    def collector(self, function) -> None:
+        self.collectors.append(function)
+
+    def format_labels(self, labels, extra=()) -> str:
+        pairs = tuple(labels) + tuple(extra)
+        if not pairs:
+            return ""
+        return "{" + ",".join(f'{key}="{self.escape(value)}"' for key, value in pairs) + "}"
+
+    def escape(self, value) -> str:
+        return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+    def format_value(self, value) -> str:
+        if isinstance(value, float):
+            return repr(value)
+        return str(value)
+
+    def render(self) -> str:
+        # Prometheus text exposition format 0.0.4
+        collected = {}
+        for function in self.collectors:
+            try:
+                for (name, labels), value in function().items():
+                    collected.setdefault(name, {})[labels] = value
+            except Exception:
+                # A failing collector must not break the scrape
+                continue
+
+        with self.lock:
+            counters = {name: dict(series) for name, series in self.counters.items()}
+            gauges = {name: dict(series) for name, series in self.gauges.items()}
+            histograms = {name: {labels: list(counts) for labels, counts in series.items()} for name, series in self.histograms.items()}
+        gauges.update(collected)
+
+        lines = []
+        for name, (kind, help) in self.descriptions.items():
+            lines.append(f"# HELP {name} {help}")
+            lines.append(f"# TYPE {name} {kind}")
+            if kind == "histogram":
+                for labels, counts in histograms.get(name, {}).items():
+                    cumulative = 0
+                    for bound, count in zip(self.buckets, counts):
+                        cumulative += count
+                        lines.append(f"{name}_bucket{self.format_labels(labels, [('le', bound)])} {cumulative}")
+                    lines.append(f"{name}_bucket{self.format_labels(labels, [('le', '+Inf')])} {counts[-1]}")
+                    lines.append(f"{name}_sum{self.format_labels(labels)} {self.format_value(counts[-2])}")
+                    lines.append(f"{name}_count{self.format_labels(labels)} {counts[-1]}")
+            else:
+                series = (counters if kind == "counter" else gauges).get(name, {})
+                for labels, value in series.items():
+                    lines.append(f"{name}{self.format_labels(labels)} {self.format_value(value)}")
+        return "\n".join(lines) + "\n"
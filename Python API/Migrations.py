@@ -0,0 +1,211 @@
+import argparse
+import sys
+from datetime import datetime
+from AccessTokens import AccessTokens
+from Database import Database
+from Filters import Filters
+from Logger import Logger
+from Pagination import Pagination
+from QueryRegistry import QueryRegistry
+from Schema import Schema
+
+
+class Migrations:
+
+    def __init__(self, database, logger) -> None:
+        self.database = database
+        self.logger = logger
+        # Ordered list of (version, description, steps), never edit a version that was released
+        self.migrations = [
+            (1, "Indexes for user and access token lookups", [
+                ("unique", "users", "users_email_unique", ["email"]),
+                ("index", "access_tokens", "access_tokens_token_index", ["token"]),
+                ("index", "access_tokens", "access_tokens_email_index", ["email"]),
+                ("index", "access_tokens", "access_tokens_jti_index", ["jti"]),
+                ("index", "access_tokens", "access_tokens_expired_at_index", ["expired_at"]),
+                ("index", "expired_access_tokens", "expired_access_tokens_jti_index", ["jti"]),
+                ("index", "expired_access_tokens", "expired_access_tokens_expired_at_index", ["expired_at"]),
+            ]),
+            (2, "Indexes for car foreign keys", [
+                ("index", "cars", "cars_brand_id_index", ["brand_id"]),
+                ("index", "cars", "cars_category_id_index", ["category_id"]),
+            ]),
+            (3, "Primary key on car_colours", [
+                ("dedupe", "car_colours", ["car_id", "colour_id"]),
+                ("primary", "car_colours", ["car_id", "colour_id"]),
+                ("index", "car_colours", "car_colours_colour_id_index", ["colour_id"]),
+            ]),
+            (4, "Indexes on updated_at for list validators", [
+                ("index", "cars", "cars_updated_at_index", ["updated_at"]),
+                ("index", "brands", "brands_updated_at_index", ["updated_at"]),
+                ("index", "categories", "categories_updated_at_index", ["updated_at"]),
+                ("index", "colours", "colours_updated_at_index", ["updated_at"]),
+            ]),
+            (5, "Indexes for sorting and filtering list endpoints", [
+                ("index", "cars", "cars_name_index", ["name", "id"]),
+                ("index", "cars", "cars_created_at_index", ["created_at", "id"]),
+                ("index", "brands", "brands_name_index", ["name", "id"]),
+                ("index", "categories", "categories_name_index", ["name", "id"]),
+                ("index", "colours", "colours_name_index", ["name", "id"]),
+            ]),
+            (6, "Index for purging old revocations", [
+                ("index", "expired_access_tokens", "expired_access_tokens_created_at_index", ["created_at"]),
+            ]),
+            (7, "Index for syncing revocations between workers", [
+                ("index", "expired_access_tokens", "expired_access_tokens_updated_at_index", ["updated_at"]),
+            ]),
+        ]
+        # Queries the API runs on hot paths, checked with EXPLAIN by check()
+        self.check_queries = self.api_queries()
+
+    def api_queries(self) -> list:
+        # Built from the same objects that compile the API's SQL, so the check follows the code
+        queries = []
+        schema = Schema()
+        registry = QueryRegistry(schema, self.database.columns)
+        for (table, kind), query in registry.queries.items():
+            if kind in ["select", "exists", "delete"]:
+                queries.append((query, (1,)))
+        for resource in schema.resources.values():
+            queries.append((registry.update(resource["table"], ["updated_at"]), (datetime.now(), 1)))
+        queries.extend(AccessTokens(self.database).check_queries())
+        # Every sort order and filter of the list endpoints, on a page after a cursor
+        pagination = Pagination()
+        filters = Filters()
+        for table, sortable in filters.sortable.items():
+            fields = self.database.columns[table]
+            for column in sortable:
+                value = datetime.now() if column.endswith("_at") else ("name" if column == "name" else 1)
+                for descending in [False, True]:
+                    queries.append(pagination.query(table, fields, (value, 1), pagination.default_limit, (column, descending)))
+            for condition, parse_value in filters.allowed.get(table, {}).values():
+                example = datetime.now() if parse_value is datetime.fromisoformat else 1
+                queries.append(pagination.query(table, fields, (1, 1), pagination.default_limit, ("id", False), ([condition], [example])))
+        # Expansion, token revocation and background jobs
+        queries.extend([
+            ("SELECT car_colours.car_id, colours.id, colours.name FROM car_colours JOIN colours ON colours.id = car_colours.colour_id WHERE car_colours.car_id IN (%s) ORDER BY car_colours.car_id, colours.id", (1,)),
+            ("SELECT car_id FROM car_colours WHERE colour_id = %s", (1,)),
+            ("SELECT jti, created_at FROM expired_access_tokens WHERE created_at > %s", (datetime.now(),)),
+            ("SELECT jti, created_at FROM expired_access_tokens WHERE updated_at > %s", (datetime.now(),)),
+            ("SELECT id, name, updated_at FROM brands WHERE updated_at >= %s", (datetime.now(),)),
+            ("SELECT id, name, updated_at FROM categories WHERE updated_at >= %s", (datetime.now(),)),
+            ("SELECT id, name, model, description, brand_id, category_id, updated_at FROM cars WHERE updated_at >= %s", (datetime.now(),)),
+            ("SELECT rows_committed, inserted, rejected, status FROM import_jobs WHERE name = %s", ("job",)),
+            ("SELECT id, jti, token, email, created_at, expired_at FROM access_tokens WHERE expired_at <= %s ORDER BY expired_at, id LIMIT %s", (datetime.now(), 500)),
+            ("SELECT id, jti, token, email, created_at, updated_at, expired_at FROM expired_access_tokens WHERE created_at < %s ORDER BY created_at, id LIMIT %s", (datetime.now(), 500)),
+        ])
+        return queries
+
+    def ensure_version_table(self, cursor) -> None:
+        cursor.execute(self.database.backend.create_table("schema_version", {
+            "columns": [
+                ("version", "int", "NOT NULL"),
+                ("description", "varchar(255)", "NOT NULL"),
+                ("applied_at", "timestamp", "NULL DEFAULT NULL"),
+            ],
+            "keys": [("primary", ["version"])],
+        }))
+
+    def current_version(self, cursor) -> int:
+        cursor.execute("SELECT MAX(version) FROM schema_version")
+        version = cursor.fetchone()[0]
+        return version or 0
+
+    def migrate(self) -> list:
+        # Applies every pending migration and returns the versions that were applied
+        connection = None
+        cursor = None
+        applied = []
+        try:
+            connection = self.database.db_connection()
+            cursor = connection.cursor()
+            self.ensure_version_table(cursor)
+            current = self.current_version(cursor)
+            for version, description, steps in self.migrations:
+                if version <= current:
+                    continue
+                # DDL commits implicitly, so every step checks whether it already ran
+                for step in steps:
+                    self.apply(connection, cursor, step)
+                cursor.execute(
+                    "INSERT INTO schema_version (version, description, applied_at) VALUES (%s, %s, %s)",
+                    (version, description, datetime.now())
+                )
+                connection.commit()
+                self.logger.debug(f"Applied migration {version}: {description}")
+                applied.append(version)
+            return applied
+
+        except Exception as error:
+            self.logger.debug(error)
+            raise
+
+        finally:
+            if cursor is not None:
+                cursor.close()
+            if connection is not None:
+                connection.close()
+
+    def apply(self, connection, cursor, step) -> None:
+        backend = self.database.backend
+        kind, table = step[0], step[1]
+        if kind in ["index", "unique"]:
+            name, columns = step[2], step[3]
+            if not self.index_exists(cursor, table, name):
+                cursor.execute(backend.create_index(table, name, columns, unique=kind == "unique"))
+        elif kind == "primary":
+            if not self.index_exists(cursor, table, backend.primary_key_name(table)):
+                cursor.execute(backend.add_primary_key(table, step[2]))
+        elif kind == "dedupe":
+            self.dedupe(connection, cursor, table, step[2])
+        else:
+            raise ValueError(f"Unknown migration step {kind}")
+
+    def index_exists(self, cursor, table, name) -> bool:
+        return self.database.backend.index_exists(cursor, table, name)
+
+    def dedupe(self, connection, cursor, table, columns) -> None:
+        # Keep one row per key so the primary key can be added to existing data
+        key = ", ".join(columns)
+        cursor.execute(f"SELECT COUNT(*) FROM (SELECT {key} FROM `{table}` GROUP BY {key} HAVING COUNT(*) > 1) AS duplicates")
+        if cursor.fetchone()[0] == 0:
+            return
+        cursor.execute(
+            f"CREATE TEMPORARY TABLE `{table}_dedupe` AS "
+            f"SELECT {key}, MIN(created_at) AS created_at, MAX(updated_at) AS updated_at FROM `{table}` GROUP BY {key}"
+        )
+        cursor.execute(f"DELETE FROM `{table}`")
+        cursor.execute(f"INSERT INTO `{table}` ({key}, created_at, updated_at) SELECT {key}, created_at, updated_at FROM `{table}_dedupe`")
+        connection.commit()
+        cursor.execute(self.database.backend.drop_temporary_table(f"{table}_dedupe"))
+
+    def check(self) -> list:
+        # Runs EXPLAIN on the API queries and returns those that can only use a full table scan
+        connection = None
+        failures = []
+        try:
+            connection = self.database.db_connection()
+            for query, params in self.check_queries:
+                for table in self.database.backend.full_scans(connection, query, params):
+                    failures.append({"query": query, "table": table})
+            return failures
+
+        finally:
+            if connection is not None:
+                connection.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Apply schema migrations")
+    parser.add_argument("--check", action="store_true", help="EXPLAIN the API queries and fail on full scans")
+    args = parser.parse_args()
+
+    migrations = Migrations(Database(), Logger())
+    if args.check:
+        failures = migrations.check()
+        for failure in failures:
+            print(f"Full table scan on {failure['table']}: {failure['query']}")
+        sys.exit(1 if failures else 0)
+
+    applied = migrations.migrate()
+    print(f"Applied migrations: {applied}" if applied else "Schema is up to date.")
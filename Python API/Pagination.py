@@ -0,0 +1,141 @@
+import base64
+import json
+from datetime import datetime
+from urllib.parse import urlencode
+
+
+class Pagination:
+
+    def __init__(self, default_limit=100, max_limit=1000) -> None:
+        self.default_limit = default_limit
+        self.max_limit = max_limit
+
+    def parse(self, args, columns, sortable=("id",)):
+        # Read limit, after, fields and sort from the query string, raises ValueError on bad input
+        limit = args.get("limit", self.default_limit)
+        try:
+            limit = int(limit)
+        except (TypeError, ValueError):
+            raise ValueError("limit must be an integer")
+        if limit < 1 or limit > self.max_limit:
+            raise ValueError(f"limit must be between 1 and {self.max_limit}")
+
+        sort = self.parse_sort(args.get("sort"), sortable)
+        after = self.decode_cursor(args.get("after"), sort)
+        fields = self.parse_fields(args.get("fields"), columns)
+        # The sort column is needed to build the next cursor
+        if sort[0] not in fields:
+            fields = [column for column in columns if column in fields or column == sort[0]]
+        return fields, after, limit, sort
+
+    def parse_fields(self, value, columns):
+        if not value:
+            return list(columns)
+        requested = set(field.strip() for field in value.split(",") if field.strip())
+        unknown = requested.difference(columns)
+        if unknown:
+            raise ValueError(f"unknown fields: {', '.join(sorted(unknown))}")
+        # The id is always returned because the cursor is built from it
+        requested.add("id")
+        # Keep the table column order so responses are stable
+        return [column for column in columns if column in requested]
+
+    def parse_sort(self, value, sortable):
+        # sort=created_at is ascending, sort=-created_at is descending, ties are broken by id
+        if not value:
+            return ("id", False)
+        descending = value.startswith("-")
+        column = value.lstrip("-")
+        if column not in sortable:
+            raise ValueError(f"sort must be one of {', '.join(sortable)}")
+        return (column, descending)
+
+    def decode_cursor(self, value, sort):
+        # Returns (sort value, id) or None
+        if value is None:
+            return None
+        if sort == ("id", False):
+            # Plain id cursors for the default order
+            try:
+                return (int(value), int(value))
+            except ValueError:
+                raise ValueError("after must be an id")
+        try:
+            column, sort_value, id = json.loads(base64.urlsafe_b64decode(value.encode("ascii")))
+            if column != sort[0]:
+                raise ValueError
+            if sort_value is not None and column.endswith("_at"):
+                sort_value = datetime.fromisoformat(sort_value)
+            return (sort_value, int(id))
+        except (ValueError, TypeError, json.JSONDecodeError):
+            raise ValueError("after is not a valid cursor for this sort")
+
+    def encode_cursor(self, sort_value, id, sort) -> str:
+        if sort == ("id", False):
+            return str(id)
+        if isinstance(sort_value, datetime):
+            sort_value = sort_value.isoformat()
+        data = json.dumps([sort[0], sort_value, id], separators=(",", ":"))
+        return base64.urlsafe_b64encode(data.encode("utf-8")).decode("ascii")
+
+    def keyset(self, after, sort):
+        # Condition for rows after the cursor in (sort column, id) order
+        column, descending = sort
+        value, id = after
+        if column == "id":
+            return ("id < %s" if descending else "id > %s"), [id]
+        # MySQL sorts NULL first ascending and last descending
+        if descending:
+            if value is None:
+                return f"({column} IS NULL AND id < %s)", [id]
+            return f"({column} < %s OR ({column} = %s AND id < %s) OR {column} IS NULL)", [value, value, id]
+        if value is None:
+            return f"(({column} IS NULL AND id > %s) OR {column} IS NOT NULL)", [id]
+        return f"({column} > %s OR ({column} = %s AND id > %s))", [value, value, id]
+
+    def query(self, table, fields, after, limit, sort=("id", False), filters=None):
+        # filters is a (conditions, params) pair of parameterised SQL
+        conditions, params = (list(filters[0]), list(filters[1])) if filters else ([], [])
+        if after is not None:
+            condition, values = self.keyset(after, sort)
+            conditions.append(condition)
+            params.extend(values)
+
+        query = f"SELECT {', '.join(fields)} FROM {table}"
+        if conditions:
+            query += " WHERE " + " AND ".join(conditions)
+        column, descending = sort
+        direction = " DESC" if descending else ""
+        if column == "id":
+            query += f" ORDER BY id{direction}"
+        else:
+            query += f" ORDER BY {column}{direction}, id{direction}"
+        # No limit is used by full table exports, one extra row tells whether there is a next page
+        if limit is not None:
+            query += " LIMIT %s"
+            params.append(limit + 1)
+        return query, params
+
+    def page(self, rows, fields, limit, sort=("id", False)):
+        # Returns the rows of this page as dictionaries and the cursor of the next page
+        rows, next_cursor = self.page_rows(rows, fields, limit, sort)
+        return [dict(zip(fields, row)) for row in rows], next_cursor
+
+    def page_rows(self, rows, fields, limit, sort=("id", False)):
+        # Same as page() but keeps the cursor tuples for encoders that take rows directly
+        next_cursor = None
+        if len(rows) > limit:
+            rows = rows[:limit]
+            last = rows[-1]
+            next_cursor = self.encode_cursor(last[fields.index(sort[0])], last[fields.index("id")], sort)
+        return rows, next_cursor
+
+    def add_headers(self, response, request, next_cursor):
+        if next_cursor is None:
+            return response
+        args = request.args.to_dict()
+        args["after"] = next_cursor
+        response.headers["X-Next-Cursor"] = str(next_cursor)
+        # Built from the request path so the same code serves Flask and Quart
+        response.headers["Link"] = f'<{request.path}?{urlencode(args)}>; rel="next"'
+        return response
@@ -0,0 +1,100 @@
+import os
+import threading
+import time
+import bcrypt
+from concurrent.futures import ThreadPoolExecutor
+
+
+class HasherBusy(Exception):
+    pass
+
+
+class PasswordHasher:
+
+    def __init__(self, workers=4, queue_size=32, queue_timeout=0.5, metrics=None) -> None:
+        # bcrypt releases the GIL, so a small thread pool runs hashes in parallel
+        self.workers = workers
+        self.queue_size = queue_size
+        self.queue_timeout = queue_timeout
+        # Optional Metrics receiving hash and queue timings
+        self.metrics = metrics
+        # Admission slots for running plus queued jobs, beyond that callers are rejected
+        self.slots = threading.BoundedSemaphore(workers + queue_size)
+        self.lock = threading.Lock()
+        self.executor = None
+        self.executor_pid = None
+        # Counters for hasher stats
+        self.admitted = 0
+        self.running = 0
+        self.rejected = 0
+        self.completed = 0
+        self.total_hash_time = 0.0
+        self.max_hash_time = 0.0
+        self.total_queue_time = 0.0
+
+    def get_executor(self):
+        # Created lazily so every gunicorn worker owns its threads
+        with self.lock:
+            if self.executor is None or self.executor_pid != os.getpid():
+                self.executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="bcrypt")
+                self.executor_pid = os.getpid()
+            return self.executor
+
+    def check(self, password: bytes, hashed: bytes) -> bool:
+        return self.run("check", bcrypt.checkpw, password, hashed)
+
+    def hash(self, password: bytes) -> bytes:
+        return self.run("hash", lambda value: bcrypt.hashpw(value, bcrypt.gensalt()), password)
+
+    def run(self, operation, function, *args):
+        # Wait a short while for a slot, then fail fast instead of piling up requests
+        if not self.slots.acquire(timeout=self.queue_timeout):
+            with self.lock:
+                self.rejected += 1
+            if self.metrics is not None:
+                self.metrics.increment("bcrypt_rejected_total")
+            raise HasherBusy("Password hashing queue is full")
+
+        with self.lock:
+            self.admitted += 1
+        try:
+            submitted_at = time.monotonic()
+            return self.get_executor().submit(self.timed, operation, submitted_at, function, *args).result()
+        finally:
+            with self.lock:
+                self.admitted -= 1
+            self.slots.release()
+
+    def timed(self, operation, submitted_at, function, *args):
+        start = time.monotonic()
+        with self.lock:
+            self.running += 1
+            self.total_queue_time += start - submitted_at
+        try:
+            return function(*args)
+        finally:
+            elapsed = time.monotonic() - start
+            with self.lock:
+                self.running -= 1
+                self.completed += 1
+                self.total_hash_time += elapsed
+                self.max_hash_time = max(self.max_hash_time, elapsed)
+            if self.metrics is not None:
+                labels = (("operation", operation),)
+                self.metrics.observe("bcrypt_duration_seconds", labels, elapsed)
+                self.metrics.observe("bcrypt_queue_seconds", labels, start - submitted_at)
+
+    def stats(self) -> dict:
+        with self.lock:
+            return {
+                "workers": self.workers,
+                "queue_size": self.queue_size,
+                "running": self.running,
+                "queue_depth": self.admitted - self.running,
+                "rejected": self.rejected,
+                "completed": self.completed,
+                "total_hash_time": self.total_hash_time,
+                "max_hash_time": self.max_hash_time,
+                "avg_hash_time": self.total_hash_time / self.completed if self.completed else 0.0,
+                "avg_queue_time": self.total_queue_time / self.completed if self.completed else 0.0,
+            }
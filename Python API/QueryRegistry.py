@@ -0,0 +1,61 @@
+import threading
+
+
+class QueryRegistry:
+
+    def __init__(self, schema, columns) -> None:
+        self.columns = columns
+        self.lock = threading.Lock()
+        # (table, kind) -> SQL, built once at startup instead of on every request
+        self.queries = {}
+        for resource in schema.resources.values():
+            table = resource["table"]
+            insert_columns = list(resource["keys"].values()) + ["created_at", "updated_at"]
+            self.queries[(table, "select")] = f"SELECT {', '.join(columns[table])} FROM {table} WHERE id = %s"
+            self.queries[(table, "exists")] = f"SELECT id FROM {table} WHERE id = %s"
+            self.queries[(table, "delete")] = f"DELETE FROM {table} WHERE id = %s"
+            self.queries[(table, "insert")] = (
+                f"INSERT INTO {table} "
+                f"({', '.join(insert_columns)}) "
+                f"VALUES ({', '.join(['%s'] * len(insert_columns))})"
+            )
+        # SQL -> function turning a row tuple into a dictionary, built from the first cursor description
+        self.converters = {}
+
+    def get(self, table, kind) -> str:
+        return self.queries[(table, kind)]
+
+    def update(self, table, columns) -> str:
+        # One UPDATE per combination of columns, compiled the first time it is used
+        key = (table, "update", tuple(columns))
+        query = self.queries.get(key)
+        if query is None:
+            set_clause = ", ".join(f"{column} = %s" for column in columns)
+            query = f"UPDATE {table} SET {set_clause} WHERE id = %s"
+            with self.lock:
+                self.queries[key] = query
+        return query
+
+    def execute(self, connection, query, params):
+        # Prepared cursors are kept per pooled connection, so the server parses each query once per connection
+        cursor = connection.prepared(query)
+        cursor.execute(query, params)
+        return cursor
+
+    def converter(self, query, cursor):
+        convert = self.converters.get(query)
+        if convert is None:
+            names = tuple(column[0] for column in cursor.description)
+            def convert(row):
+                return dict(zip(names, row))
+            with self.lock:
+                self.converters[query] = convert
+        return convert
+
+    def fetch_one(self, connection, query, params):
+        # Returns the first row as a dictionary or None, always reads the whole result so the cursor can be reused
+        cursor = self.execute(connection, query, params)
+        rows = cursor.fetchall()
+        if not rows:
+            return None
+        return self.converter(query, cursor)(rows[0])
@@ -0,0 +1,151 @@
+import math
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+
+class MemoryBuckets:
+
+    def __init__(self, max_keys=100000) -> None:
+        self.max_keys = max_keys
+        self.lock = threading.Lock()
+        # key -> (tokens, updated_at, full_at), least recently updated first
+        self.buckets = OrderedDict()
+        self.evictions = 0
+
+    def take(self, key, rate, burst):
+        # Returns 0 when a token was taken, otherwise the seconds until one is available
+        now = time.monotonic()
+        with self.lock:
+            entry = self.buckets.get(key)
+            tokens = burst if entry is None else min(burst, entry[0] + (now - entry[1]) * rate)
+            if tokens < 1:
+                return (1 - tokens) / rate
+            tokens -= 1
+            self.buckets[key] = (tokens, now, now + (burst - tokens) / rate)
+            self.buckets.move_to_end(key)
+            self.expire(now)
+            return 0
+
+    def expire(self, now) -> None:
+        # A bucket that has refilled is the same as no bucket, the oldest ones are dropped first
+        while self.buckets:
+            key, (_, _, full_at) = next(iter(self.buckets.items()))
+            if full_at > now and len(self.buckets) <= self.max_keys:
+                break
+            if full_at > now:
+                # Over max_keys, the evicted key starts again with a full bucket
+                self.evictions += 1
+            del self.buckets[key]
+
+    def stats(self) -> dict:
+        with self.lock:
+            return {"store": "memory", "keys": len(self.buckets), "evictions": self.evictions}
+
+
+class SQLiteBuckets:
+
+    def __init__(self, path, busy_timeout=1000) -> None:
+        # One small table in a local file shared by every worker process on the host
+        self.path = path
+        self.busy_timeout = busy_timeout
+        self.local = threading.local()
+        self.takes = 0
+        self.lock = threading.Lock()
+        connection = self.connection()
+        connection.execute("CREATE TABLE IF NOT EXISTS buckets (key TEXT PRIMARY KEY, tokens REAL NOT NULL, updated_at REAL NOT NULL, full_at REAL NOT NULL) WITHOUT ROWID")
+        connection.execute("CREATE INDEX IF NOT EXISTS buckets_full_at_index ON buckets (full_at)")
+
+    def connection(self):
+        # One connection per thread, autocommit so the transaction is controlled with BEGIN IMMEDIATE
+        connection = getattr(self.local, "connection", None)
+        if connection is None:
+            connection = sqlite3.connect(self.path, timeout=self.busy_timeout / 1000, isolation_level=None)
+            connection.execute("PRAGMA journal_mode=WAL")
+            # Counters are worth losing on a power cut, not worth an fsync per login
+            connection.execute("PRAGMA synchronous=OFF")
+            self.local.connection = connection
+        return connection
+
+    def take(self, key, rate, burst):
+        # Wall clock time, the file outlives the processes that wrote it
+        now = time.time()
+        connection = self.connection()
+        connection.execute("BEGIN IMMEDIATE")
+        try:
+            row = connection.execute("SELECT tokens, updated_at FROM buckets WHERE key = ?", (key,)).fetchone()
+            tokens = burst if row is None else min(burst, row[0] + max(0.0, now - row[1]) * rate)
+            if tokens < 1:
+                connection.execute("ROLLBACK")
+                return (1 - tokens) / rate
+            tokens -= 1
+            connection.execute(
+                "INSERT INTO buckets (key, tokens, updated_at, full_at) VALUES (?, ?, ?, ?) "
+                "ON CONFLICT (key) DO UPDATE SET tokens = excluded.tokens, updated_at = excluded.updated_at, full_at = excluded.full_at",
+                (key, tokens, now, now + (burst - tokens) / rate)
+            )
+            with self.lock:
+                self.takes += 1
+                expire = self.takes % 1000 == 0
+            if expire:
+                connection.execute("DELETE FROM buckets WHERE full_at <= ?", (now,))
+            connection.execute("COMMIT")
+            return 0
+        except Exception:
+            connection.execute("ROLLBACK")
+            raise
+
+    def stats(self) -> dict:
+        keys = self.connection().execute("SELECT COUNT(*) FROM buckets").fetchone()[0]
+        return {"store": "sqlite", "path": self.path, "keys": keys}
+
+
+class RateLimiter:
+
+    def __init__(self, limits, store=None, logger=None, metrics=None) -> None:
+        # name -> (requests, seconds), e.g. {"ip": (20, 60)} allows bursts of 20 refilled over a minute
+        self.limits = {name: (requests / seconds, requests) for name, (requests, seconds) in limits.items()}
+        self.store = store if store is not None else MemoryBuckets()
+        self.logger = logger
+        self.metrics = metrics
+        self.lock = threading.Lock()
+        self.limited = {name: 0 for name in self.limits}
+        self.store_errors = 0
+
+    @staticmethod
+    def parse(value):
+        # "20/60" is 20 requests per 60 seconds, an empty value disables the limit
+        if not value:
+            return None
+        requests, seconds = value.split("/")
+        return (int(requests), float(seconds))
+
+    def check(self, name, key):
+        # Returns None when the request may go on, otherwise the Retry-After value in whole seconds
+        limit = self.limits.get(name)
+        if limit is None:
+            return None
+        rate, burst = limit
+        try:
+            wait = self.store.take(f"{name}:{key}", rate, burst)
+        except Exception as error:
+            # A broken shared store must not lock everybody out
+            with self.lock:
+                self.store_errors += 1
+            if self.logger is not None:
+                self.logger.debug(error)
+            return None
+        if wait <= 0:
+            return None
+        with self.lock:
+            self.limited[name] += 1
+        if self.metrics is not None:
+            self.metrics.increment("rate_limited_total", (("limit", name),))
+        return max(1, math.ceil(wait))
+
+    def stats(self) -> dict:
+        with self.lock:
+            limited = dict(self.limited)
+            store_errors = self.store_errors
+        return {"limited": limited, "store_errors": store_errors, **self.store.stats()}
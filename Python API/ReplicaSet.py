@@ -0,0 +1,90 @@
+import threading
+import time
+from ConnectionPool import PoolTimeout
+
+
+class ReplicaSet:
+
+    def __init__(self, replicas, eject_seconds=30, max_lag=None, check_interval=5, metrics=None) -> None:
+        # replicas are (name, backend, pool) tuples, each replica has its own pool
+        self.replicas = [
+            {"name": name, "backend": backend, "pool": pool, "ejected_until": 0.0, "checked_at": 0.0, "ejections": 0, "last_error": None}
+            for name, backend, pool in replicas
+        ]
+        # How long a failed replica gets no reads before it is tried again
+        self.eject_seconds = eject_seconds
+        # Replicas further behind than this many seconds are ejected, None skips the lag check
+        self.max_lag = max_lag
+        self.check_interval = check_interval
+        self.metrics = metrics
+        self.lock = threading.Lock()
+        self.next = 0
+        # Reads that found no healthy replica and went to the primary
+        self.fallbacks = 0
+
+    def candidates(self) -> list:
+        # Healthy replicas in round robin order, a different one first on every call
+        if not self.replicas:
+            return []
+        now = time.monotonic()
+        with self.lock:
+            start = self.next
+            self.next = (self.next + 1) % len(self.replicas)
+        ordered = self.replicas[start:] + self.replicas[:start]
+        return [replica for replica in ordered if replica["ejected_until"] <= now]
+
+    def acquire(self):
+        # Returns a pooled replica connection, or None when the read has to go to the primary
+        for replica in self.candidates():
+            try:
+                connection = replica["pool"].acquire()
+            except PoolTimeout:
+                # Busy, not broken, try the next replica
+                continue
+            except Exception as error:
+                self.eject(replica, error)
+                continue
+            if self.lagging(replica, connection):
+                connection.close()
+                continue
+            return connection
+        with self.lock:
+            self.fallbacks += 1
+        return None
+
+    def lagging(self, replica, connection) -> bool:
+        # Replication lag is checked at most every check_interval seconds per replica
+        now = time.monotonic()
+        if self.max_lag is None or now - replica["checked_at"] < self.check_interval:
+            return False
+        replica["checked_at"] = now
+        try:
+            lag = replica["backend"].replica_lag(connection)
+        except Exception as error:
+            self.eject(replica, error)
+            return True
+        if lag is None or lag > self.max_lag:
+            self.eject(replica, f"Replication lag {lag} seconds")
+            return True
+        return False
+
+    def eject(self, replica, error) -> None:
+        with self.lock:
+            replica["ejected_until"] = time.monotonic() + self.eject_seconds
+            replica["ejections"] += 1
+            replica["last_error"] = str(error)
+        if self.metrics is not None:
+            self.metrics.increment("db_replica_ejections_total", (("replica", replica["name"]),))
+
+    def stats(self) -> list:
+        now = time.monotonic()
+        return [
+            {
+                "name": replica["name"],
+                "healthy": replica["ejected_until"] <= now,
+                "ejections": replica["ejections"],
+                "last_error": replica["last_error"],
+                "pool": replica["pool"].stats(),
+            }
+            for replica in self.replicas
+        ]
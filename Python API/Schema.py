@@ -0,0 +1,82 @@
+import re
+
+
+class Schema:
+
+    def __init__(self) -> None:
+        # URL name -> resource description, routes and queries are generated from this
+        # keys maps request keys to table columns in insert order, all of them are required on create
+        # search tells which search index hook runs after a write, patterns validate request values
+        # and nullable lists the keys that also accept null, which stores NULL in the column
+        self.resources = {
+            "car": {
+                "table": "cars",
+                "plural": "cars",
+                "title": "Car",
+                "keys": {
+                    "car_name": "name",
+                    "car_model": "model",
+                    "car_description": "description",
+                    "car_image": "image",
+                    "brand_id": "brand_id",
+                    "category_id": "category_id",
+                },
+                "patterns": {
+                    "car_image": (re.compile(r"^[0-9a-f]{64}$"), "Invalid image - upload it to /api/upload_image and send the returned hash"),
+                },
+                "nullable": ["car_image"],
+                "search": "car",
+                "expand": True,
+            },
+            "brand": {
+                "table": "brands",
+                "plural": "brands",
+                "title": "Brand",
+                "keys": {
+                    "brand_name": "name",
+                    "brand_image": "image",
+                },
+                "patterns": {
+                    "brand_image": (re.compile(r"^[0-9a-f]{64}$"), "Invalid image - upload it to /api/upload_image and send the returned hash"),
+                },
+                "nullable": ["brand_image"],
+                "search": "brand",
+                "expand": False,
+            },
+            "category": {
+                "table": "categories",
+                "plural": "categories",
+                "title": "Category",
+                "keys": {
+                    "category_name": "name",
+                },
+                "patterns": {},
+                "nullable": [],
+                "search": "category",
+                "expand": False,
+            },
+            "colour": {
+                "table": "colours",
+                "plural": "colours",
+                "title": "Colour",
+                "keys": {
+                    "colour_name": "name",
+                    "hex_code": "hex",
+                },
+                "patterns": {
+                    "hex_code": (re.compile(r"^#([a-f0-9]{6}|[a-f0-9]{3})$", re.IGNORECASE), "Invalid hex code"),
+                },
+                "nullable": [],
+                "search": None,
+                "expand": False,
+            },
+        }
+
+    def validate(self, resource, item):
+        # Returns the error message of the first invalid value, or None
+        for key, (pattern, message) in resource["patterns"].items():
+            if key in item and item[key] is None and key in resource["nullable"]:
+                continue
+            if key in item and (not isinstance(item[key], str) or not pattern.match(item[key])):
+                return message
+        return None
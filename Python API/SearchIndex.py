@@ -0,0 +1,272 @@
+import heapq
+import math
+import os
+import re
+import threading
+import time
+from collections import defaultdict
+
+
+class SearchIndex:
+
+    def __init__(self, database, logger, refresh_interval=30, rebuild_interval=600) -> None:
+        self.database = database
+        self.logger = logger
+        self.refresh_interval = refresh_interval
+        self.rebuild_interval = rebuild_interval
+        # Field weights used when counting term frequencies
+        self.weights = {"name": 3.0, "model": 2.0, "brand": 2.0, "category": 1.5, "description": 1.0}
+        self.token_pattern = re.compile(r"[0-9a-z]+")
+        # BM25 parameters
+        self.k1 = 1.2
+        self.b = 0.75
+        self.lock = threading.RLock()
+        self.reset()
+        self.ready = False
+        self.started_pid = None
+        self.watermark = None
+        # MAX(updated_at) of brands and categories at the last pass, names changed since then are picked up by refresh()
+        self.name_watermarks = {"brands": None, "categories": None}
+
+    def reset(self) -> None:
+        # term -> {car_id: weighted term frequency}
+        self.postings = defaultdict(dict)
+        # car_id -> stored car fields plus the terms and length of its document
+        self.documents = {}
+        # car_id -> document length, kept apart for the scoring loop
+        self.lengths = {}
+        self.brand_names = {}
+        self.category_names = {}
+        self.total_length = 0.0
+
+    def tokenize(self, text):
+        if not text:
+            return []
+        return self.token_pattern.findall(str(text).lower())
+
+    def start(self) -> None:
+        # Built in the background so startup is not blocked by a large cars table
+        if self.started_pid == os.getpid():
+            return
+        self.started_pid = os.getpid()
+        thread = threading.Thread(target=self.maintain, name="search-index", daemon=True)
+        thread.start()
+
+    def maintain(self) -> None:
+        last_rebuild = None
+        while True:
+            try:
+                if last_rebuild is None or time.monotonic() - last_rebuild >= self.rebuild_interval:
+                    # A full rebuild also drops cars deleted by other workers
+                    self.rebuild()
+                    last_rebuild = time.monotonic()
+                else:
+                    self.refresh()
+            except Exception as error:
+                self.logger.debug(error)
+            time.sleep(self.refresh_interval)
+
+    def rebuild(self) -> None:
+        connection = None
+        cursor = None
+        try:
+            connection = self.database.db_connection()
+            cursor = connection.cursor()
+            start = time.monotonic()
+            cursor.execute("SELECT id, name FROM brands")
+            brand_names = dict(cursor.fetchall())
+            cursor.execute("SELECT id, name FROM categories")
+            category_names = dict(cursor.fetchall())
+            cursor.execute("SELECT MAX(updated_at) FROM cars")
+            watermark = cursor.fetchone()[0]
+            name_watermarks = {}
+            for table in self.name_watermarks:
+                cursor.execute(f"SELECT MAX(updated_at) FROM {table}")
+                name_watermarks[table] = cursor.fetchone()[0]
+            cursor.execute("SELECT id, name, model, description, brand_id, category_id FROM cars")
+            rows = cursor.fetchall()
+
+            # Build a fresh index aside and swap it in, searches keep using the old one meanwhile
+            fresh = SearchIndex(self.database, self.logger)
+            fresh.brand_names = brand_names
+            fresh.category_names = category_names
+            for row in rows:
+                fresh.add(*row)
+
+            with self.lock:
+                self.postings = fresh.postings
+                self.documents = fresh.documents
+                self.lengths = fresh.lengths
+                self.brand_names = fresh.brand_names
+                self.category_names = fresh.category_names
+                self.total_length = fresh.total_length
+                self.watermark = watermark
+                self.name_watermarks = name_watermarks
+                self.ready = True
+            self.logger.debug(f"Search index built with {len(rows)} cars in {time.monotonic() - start:.2f}s")
+
+        finally:
+            if cursor is not None:
+                cursor.close()
+            if connection is not None:
+                connection.close()
+
+    def refresh(self) -> None:
+        # Pick up cars, brands and categories created or updated by other workers since the last pass
+        if not self.ready:
+            return
+        connection = None
+        cursor = None
+        try:
+            connection = self.database.db_connection()
+            cursor = connection.cursor()
+            # Names first, so new cars of a new brand are indexed with its name
+            for table, rename, names in [("brands", self.rename_brand, self.brand_names), ("categories", self.rename_category, self.category_names)]:
+                watermark = self.name_watermarks[table]
+                if watermark is None:
+                    cursor.execute(f"SELECT id, name, updated_at FROM {table} WHERE updated_at IS NOT NULL")
+                else:
+                    cursor.execute(f"SELECT id, name, updated_at FROM {table} WHERE updated_at >= %s", (watermark,))
+                for id, name, updated_at in cursor.fetchall():
+                    # The rows at the watermark are read again on every pass, only changed names re-index cars
+                    if names.get(id) != name:
+                        rename(id, name)
+                    if watermark is None or updated_at > watermark:
+                        watermark = updated_at
+                self.name_watermarks[table] = watermark
+            if self.watermark is None:
+                # The table was empty at the last rebuild
+                cursor.execute("SELECT id, name, model, description, brand_id, category_id, updated_at FROM cars WHERE updated_at IS NOT NULL")
+            else:
+                cursor.execute(
+                    "SELECT id, name, model, description, brand_id, category_id, updated_at FROM cars WHERE updated_at >= %s",
+                    (self.watermark,)
+                )
+            for row in cursor.fetchall():
+                self.add(*row[:6])
+                if self.watermark is None or row[6] > self.watermark:
+                    self.watermark = row[6]
+
+        finally:
+            if cursor is not None:
+                cursor.close()
+            if connection is not None:
+                connection.close()
+
+    def add(self, id, name, model, description, brand_id, category_id) -> None:
+        # Adding an id that is already indexed replaces it
+        with self.lock:
+            self.remove(id)
+            fields = {
+                "name": name,
+                "model": model,
+                "description": description,
+                "brand": self.brand_names.get(brand_id),
+                "category": self.category_names.get(category_id),
+            }
+            frequencies = defaultdict(float)
+            for field, text in fields.items():
+                for token in self.tokenize(text):
+                    frequencies[token] += self.weights[field]
+            length = sum(frequencies.values())
+            for token, frequency in frequencies.items():
+                self.postings[token][id] = frequency
+            self.documents[id] = {
+                "id": id,
+                "name": name,
+                "model": model,
+                "description": description,
+                "brand_id": brand_id,
+                "category_id": category_id,
+                "terms": list(frequencies),
+            }
+            self.lengths[id] = length
+            self.total_length += length
+
+    def update(self, id, changes) -> None:
+        # changes uses the cars column names, e.g. {"name": "Saga", "brand_id": 2}
+        with self.lock:
+            document = self.documents.get(id)
+            if document is None:
+                return
+            values = {key: document[key] for key in ["name", "model", "description", "brand_id", "category_id"]}
+            values.update((key, value) for key, value in changes.items() if key in values)
+            self.add(id, values["name"], values["model"], values["description"], values["brand_id"], values["category_id"])
+
+    def remove(self, id) -> None:
+        with self.lock:
+            document = self.documents.pop(id, None)
+            if document is None:
+                return
+            for token in document["terms"]:
+                postings = self.postings.get(token)
+                if postings is not None:
+                    postings.pop(id, None)
+                    if not postings:
+                        del self.postings[token]
+            self.total_length -= self.lengths.pop(id)
+
+    def rename_brand(self, brand_id, name) -> None:
+        # Cars of the brand are re-indexed with the new name, None removes it
+        with self.lock:
+            if name is None:
+                self.brand_names.pop(brand_id, None)
+            else:
+                self.brand_names[brand_id] = name
+            for id in [id for id, document in self.documents.items() if document["brand_id"] == brand_id]:
+                self.update(id, {})
+
+    def rename_category(self, category_id, name) -> None:
+        with self.lock:
+            if name is None:
+                self.category_names.pop(category_id, None)
+            else:
+                self.category_names[category_id] = name
+            for id in [id for id, document in self.documents.items() if document["category_id"] == category_id]:
+                self.update(id, {})
+
+    def search(self, query, limit=20):
+        # BM25 over the weighted fields, returns the best matches first
+        terms = set(self.tokenize(query))
+        with self.lock:
+            count = len(self.documents)
+            if not terms or count == 0:
+                return []
+            # Length normalisation folded into two constants so the inner loop stays small
+            k1 = self.k1
+            base = k1 * (1 - self.b)
+            scale = k1 * self.b * count / max(self.total_length, 1.0)
+            lengths = self.lengths
+            scores = defaultdict(float)
+            for term in terms:
+                postings = self.postings.get(term)
+                if not postings:
+                    continue
+                idf = math.log(1 + (count - len(postings) + 0.5) / (len(postings) + 0.5))
+                weight = idf * (k1 + 1)
+                for id, frequency in postings.items():
+                    scores[id] += weight * frequency / (frequency + base + scale * lengths[id])
+
+            best = heapq.nlargest(limit, scores.items(), key=lambda item: item[1])
+            results = []
+            for id, score in best:
+                document = self.documents[id]
+                results.append({
+                    "id": id,
+                    "name": document["name"],
+                    "model": document["model"],
+                    "brand_id": document["brand_id"],
+                    "brand": self.brand_names.get(document["brand_id"]),
+                    "category_id": document["category_id"],
+                    "category": self.category_names.get(document["category_id"]),
+                    "score": round(score, 4),
+                })
+            return results
+
+    def stats(self) -> dict:
+        with self.lock:
+            return {
+                "ready": self.ready,
+                "documents": len(self.documents),
+                "terms": len(self.postings),
+            }
@@ -0,0 +1,110 @@
+import argparse
+import hashlib
+import random
+import bcrypt
+from datetime import datetime, timedelta
+from Database import Database
+from Logger import Logger
+
+
+class Seeder:
+
+    def __init__(self, database, logger, seed=42, chunk_size=1000) -> None:
+        self.database = database
+        self.logger = logger
+        # The same seed always produces the same rows, so runs on different commits are comparable
+        self.seed = seed
+        self.chunk_size = chunk_size
+        self.words = [
+            "classic", "roadster", "coupe", "estate", "racing", "vintage", "limited", "turbo", "diecast", "touring",
+            "convertible", "hatchback", "sedan", "rally", "sport", "edition", "custom", "prototype", "grand", "city",
+        ]
+
+    def image_hash(self, name) -> str:
+        # Shaped like the hashes /api/upload_image returns, no file is stored for them
+        return hashlib.sha256(name.encode("utf-8")).hexdigest()
+
+    def reset(self, cursor) -> None:
+        # Removes every row of the API tables, only for databases used for benchmarks
+        for table in ["car_colours", "cars", "brands", "categories", "colours", "access_tokens", "expired_access_tokens", "users"]:
+            cursor.execute(f"DELETE FROM {table}")
+
+    def insert(self, cursor, query, rows) -> None:
+        for start in range(0, len(rows), self.chunk_size):
+            cursor.executemany(query, rows[start:start + self.chunk_size])
+
+    def run(self, brands=50, categories=20, colours=30, cars=10000, users=200, password="benchmark", plain_cars=1000) -> dict:
+        # plain_cars are the cars with the highest ids, they have no colours so they can be deleted
+        generator = random.Random(self.seed)
+        plain_cars = min(plain_cars, cars)
+        now = datetime.now().replace(microsecond=0)
+        connection = None
+        cursor = None
+        try:
+            connection = self.database.db_connection()
+            cursor = connection.cursor()
+            self.reset(cursor)
+
+            cursor.executemany(
+                "INSERT INTO brands (id, name, image, created_at, updated_at) VALUES (%s, %s, %s, %s, %s)",
+                [(id, f"Brand {id}", self.image_hash(f"brand-{id}"), now, now) for id in range(1, brands + 1)]
+            )
+            cursor.executemany(
+                "INSERT INTO categories (id, name, created_at, updated_at) VALUES (%s, %s, %s, %s)",
+                [(id, f"Category {id}", now, now) for id in range(1, categories + 1)]
+            )
+            cursor.executemany(
+                "INSERT INTO colours (id, name, hex, created_at, updated_at) VALUES (%s, %s, %s, %s, %s)",
+                [(id, f"Colour {id}", "#%06x" % generator.randrange(0x1000000), now, now) for id in range(1, colours + 1)]
+            )
+
+            car_rows = []
+            colour_rows = []
+            for id in range(1, cars + 1):
+                created_at = now - timedelta(minutes=cars - id)
+                name = " ".join(generator.sample(self.words, 2)).title()
+                description = " ".join(generator.choice(self.words) for _ in range(12))
+                car_rows.append((id, name, f"Model {generator.randrange(1, 500)}", description, self.image_hash(f"car-{id}"), generator.randrange(1, brands + 1), generator.randrange(1, categories + 1), created_at, created_at))
+                if id <= cars - plain_cars:
+                    for colour_id in generator.sample(range(1, colours + 1), generator.randrange(1, 4)):
+                        colour_rows.append((id, colour_id, created_at, created_at))
+            self.insert(cursor, "INSERT INTO cars (id, name, model, description, image, brand_id, category_id, created_at, updated_at) VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s)", car_rows)
+            self.insert(cursor, "INSERT INTO car_colours (car_id, colour_id, created_at, updated_at) VALUES (%s, %s, %s, %s)", colour_rows)
+
+            # One bcrypt hash shared by every user, hashing thousands of them would dominate seeding
+            hashed = bcrypt.hashpw(password.encode("utf-8"), bcrypt.gensalt()).decode("utf-8")
+            self.insert(
+                cursor,
+                "INSERT INTO users (email, password, role, created_at, updated_at) VALUES (%s, %s, %s, %s, %s)",
+                [(f"user{id}@example.com", hashed, "user", now, now) for id in range(1, users + 1)]
+            )
+            connection.commit()
+
+            summary = {"brands": brands, "categories": categories, "colours": colours, "cars": cars, "car_colours": len(colour_rows), "users": users, "plain_cars": plain_cars}
+            self.logger.info("Seeded benchmark data", **summary)
+            return summary
+
+        except Exception as error:
+            self.logger.debug(error)
+            if connection is not None:
+                connection.rollback()
+            raise
+
+        finally:
+            if cursor is not None:
+                cursor.close()
+            if connection is not None:
+                connection.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Replace the API tables with synthetic benchmark data")
+    parser.add_argument("--brands", type=int, default=50)
+    parser.add_argument("--categories", type=int, default=20)
+    parser.add_argument("--colours", type=int, default=30)
+    parser.add_argument("--cars", type=int, default=10000)
+    parser.add_argument("--users", type=int, default=200)
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    print(Seeder(Database(), Logger(), seed=args.seed).run(args.brands, args.categories, args.colours, args.cars, args.users))
@@ -0,0 +1,59 @@
+from flask import Response
+
+
+class Streaming:
+
+    def __init__(self, json_provider, logger, batch_size=500) -> None:
+        self.json = json_provider
+        self.logger = logger
+        # Number of rows pulled from the server per fetchmany() call
+        self.batch_size = batch_size
+
+    def requested(self, request) -> bool:
+        # Streaming is chosen with ?stream=1 or an NDJSON Accept header
+        if request.args.get("stream") in ["1", "true", "ndjson"]:
+            return True
+        return request.accept_mimetypes.best == "application/x-ndjson"
+
+    def response(self, connection, query, params, fields):
+        # The query runs here so a failing one is still answered with a 500 by the caller,
+        # the returned response then owns the connection and closes it when the body is closed
+        cursor = None
+        try:
+            # Unbuffered cursor so rows are read from the socket as they are sent
+            cursor = connection.cursor(buffered=False)
+            cursor.execute(query, params)
+        except Exception:
+            if cursor is not None:
+                self.close_cursor(cursor)
+            raise
+        response = Response(self.generate(cursor, fields), mimetype="application/x-ndjson")
+        # Also runs for HEAD requests and for clients that leave before the first row, where the generator never starts
+        response.call_on_close(lambda: self.close(connection, cursor))
+        return response
+
+    def generate(self, cursor, fields):
+        try:
+            while True:
+                rows = cursor.fetchmany(self.batch_size)
+                if not rows:
+                    break
+                # Encoded straight from the row tuples, one object per line
+                yield self.json.lines(fields, rows)
+
+        except Exception as error:
+            # The status line is already sent, the client only sees a truncated body
+            self.logger.error(f"Streaming export failed: {error}")
+            raise
+
+    def close(self, connection, cursor) -> None:
+        self.close_cursor(cursor)
+        # Closing twice is a no-op, the connection goes back to the pool once
+        connection.close()
+
+    def close_cursor(self, cursor) -> None:
+        try:
+            cursor.close()
+        except Exception:
+            # Unread rows after a client disconnect, the pool discards the connection
+            pass
@@ -0,0 +1,216 @@
+import argparse
+import json
+import os
+import random
+import threading
+import time
+from datetime import datetime, timedelta
+from Database import Database
+from Logger import Logger
+
+
+class TokenSweeper:
+
+    def __init__(self, database, logger, lifetime=timedelta(days=1), retention=timedelta(days=7), interval=60, batch_size=500, pause=0.05, archive=None, metrics=None) -> None:
+        self.database = database
+        self.logger = logger
+        # Revocations are read back by TokenVerifier until the token would have expired on its own
+        if retention < lifetime:
+            raise ValueError("Retention must be at least the token lifetime")
+        self.lifetime = lifetime
+        self.retention = retention
+        self.interval = interval
+        # Each batch is its own short transaction on primary key lookups, the pause lets logins through
+        self.batch_size = batch_size
+        self.pause = pause
+        # NDJSON file that purged revocations are appended to, None deletes them
+        self.archive = archive
+        self.metrics = metrics
+        self.lock = threading.Lock()
+        self.started_pid = None
+        # Counters for stats
+        self.runs = 0
+        self.moved = 0
+        self.purged = 0
+        self.conflicts = 0
+        self.last_run = None
+
+    def start(self) -> None:
+        # Every worker sweeps, batches that another worker already moved are detected and skipped
+        if self.started_pid == os.getpid() or self.interval <= 0:
+            return
+        self.started_pid = os.getpid()
+        thread = threading.Thread(target=self.maintain, name="token-sweeper", daemon=True)
+        thread.start()
+
+    def maintain(self) -> None:
+        # Random start so the workers of one deployment do not sweep in lockstep
+        time.sleep(random.uniform(0, self.interval))
+        while True:
+            try:
+                self.run()
+            except Exception as error:
+                self.logger.debug(error)
+            time.sleep(self.interval)
+
+    def run(self) -> dict:
+        started = time.monotonic()
+        moved = self.move_expired()
+        purged = self.purge_revocations()
+        elapsed = time.monotonic() - started
+        lag = self.lag()
+        result = {
+            "moved": moved,
+            "purged": purged,
+            "seconds": round(elapsed, 3),
+            "rows_per_second": round((moved + purged) / elapsed, 1) if elapsed > 0 else 0.0,
+            "lag_seconds": lag["access_tokens"],
+            "retention_lag_seconds": lag["expired_access_tokens"],
+        }
+        with self.lock:
+            self.runs += 1
+            self.moved += moved
+            self.purged += purged
+            self.last_run = dict(result, finished_at=datetime.now().isoformat(timespec="seconds"))
+        if self.metrics is not None:
+            self.metrics.increment("token_sweeper_rows_total", (("action", "moved"),), moved)
+            self.metrics.increment("token_sweeper_rows_total", (("action", "purged"),), purged)
+        if moved or purged:
+            self.logger.info("Swept access tokens", **result)
+        return result
+
+    def batches(self, select, process) -> int:
+        # Runs select and process in short transactions until select returns no rows
+        total = 0
+        conflicts = 0
+        while True:
+            connection = None
+            cursor = None
+            try:
+                connection = self.database.db_connection()
+                cursor = connection.cursor()
+                cursor.execute(*select())
+                rows = cursor.fetchall()
+                if not rows:
+                    return total
+                if process(cursor, rows):
+                    connection.commit()
+                    total += len(rows)
+                else:
+                    # Another worker or a login took some of the rows first, read the batch again
+                    connection.rollback()
+                    conflicts += 1
+                    with self.lock:
+                        self.conflicts += 1
+                    if conflicts >= 3:
+                        return total
+
+            except Exception:
+                if connection is not None:
+                    connection.rollback()
+                raise
+
+            finally:
+                if cursor is not None:
+                    cursor.close()
+                if connection is not None:
+                    connection.close()
+            if len(rows) < self.batch_size:
+                return total
+            time.sleep(self.pause)
+
+    def move_expired(self) -> int:
+        def select():
+            return (
+                "SELECT id, jti, token, email, created_at, expired_at FROM access_tokens "
+                "WHERE expired_at <= %s ORDER BY expired_at, id LIMIT %s",
+                (datetime.now(), self.batch_size)
+            )
+
+        def process(cursor, rows):
+            # Delete first, a row that is already gone was moved by someone else and the batch starts over
+            placeholders = ", ".join(["%s"] * len(rows))
+            cursor.execute(f"DELETE FROM access_tokens WHERE id IN ({placeholders})", [row[0] for row in rows])
+            if cursor.rowcount != len(rows):
+                return False
+            now = datetime.now()
+            cursor.executemany(
+                "INSERT INTO expired_access_tokens (jti, token, email, created_at, updated_at, expired_at) VALUES (%s, %s, %s, %s, %s, %s)",
+                [(jti, token, email, created_at, now, expired_at) for _, jti, token, email, created_at, expired_at in rows]
+            )
+            return True
+
+        return self.batches(select, process)
+
+    def purge_revocations(self) -> int:
+        def select():
+            return (
+                "SELECT id, jti, token, email, created_at, updated_at, expired_at FROM expired_access_tokens "
+                "WHERE created_at < %s ORDER BY created_at, id LIMIT %s",
+                (datetime.now() - self.retention, self.batch_size)
+            )
+
+        def process(cursor, rows):
+            placeholders = ", ".join(["%s"] * len(rows))
+            cursor.execute(f"DELETE FROM expired_access_tokens WHERE id IN ({placeholders})", [row[0] for row in rows])
+            if cursor.rowcount != len(rows):
+                return False
+            if self.archive is not None:
+                # Written before the commit, a crash in between archives a row twice instead of losing it
+                fields = ["id", "jti", "token", "email", "created_at", "updated_at", "expired_at"]
+                with open(self.archive, "a", encoding="utf-8") as file:
+                    for row in rows:
+                        file.write(json.dumps(dict(zip(fields, row)), default=str) + "\n")
+            return True
+
+        return self.batches(select, process)
+
+    def lag(self) -> dict:
+        # Seconds the oldest row has been waiting for the sweeper, 0 when it is caught up
+        connection = None
+        cursor = None
+        try:
+            connection = self.database.db_connection()
+            cursor = connection.cursor()
+            now = datetime.now()
+            cursor.execute("SELECT MIN(expired_at) FROM access_tokens WHERE expired_at <= %s", (now,))
+            oldest_expired = cursor.fetchone()[0]
+            cursor.execute("SELECT MIN(created_at) FROM expired_access_tokens")
+            oldest_revocation = cursor.fetchone()[0]
+            cutoff = now - self.retention
+            return {
+                "access_tokens": round((now - oldest_expired).total_seconds(), 3) if oldest_expired is not None else 0.0,
+                "expired_access_tokens": round((cutoff - oldest_revocation).total_seconds(), 3) if oldest_revocation is not None and oldest_revocation < cutoff else 0.0,
+            }
+
+        finally:
+            if cursor is not None:
+                cursor.close()
+            if connection is not None:
+                connection.close()
+
+    def stats(self) -> dict:
+        with self.lock:
+            return {
+                "runs": self.runs,
+                "moved": self.moved,
+                "purged": self.purged,
+                "conflicts": self.conflicts,
+                "last_run": self.last_run,
+            }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Move expired access tokens and purge old revocations")
+    parser.add_argument("--retention-days", type=float, default=7, help="Days revocations are kept, at least the token lifetime")
+    parser.add_argument("--batch-size", type=int, default=500)
+    parser.add_argument("--archive", help="Append purged revocations to this NDJSON file instead of only deleting them")
+    parser.add_argument("--loop", type=float, default=0, help="Keep sweeping every this many seconds")
+    args = parser.parse_args()
+
+    sweeper = TokenSweeper(Database(), Logger(), retention=timedelta(days=args.retention_days), batch_size=args.batch_size, archive=args.archive)
+    while True:
+        print(sweeper.run())
+        if args.loop <= 0:
+            break
+        time.sleep(args.loop)
@@ -0,0 +1,182 @@
+import json
+import os
+import secrets
+import threading
+import time
+import jwt
+from datetime import datetime, timedelta
+from functools import wraps
+from flask import request, g
+
+
+class TokenError(Exception):
+    pass
+
+
+class TokenVerifier:
+
+    def __init__(self, database, logger, lifetime=timedelta(days=1), sync_interval=30, sync_lookback=timedelta(minutes=2)) -> None:
+        self.database = database
+        self.logger = logger
+        self.lifetime = lifetime
+        self.sync_interval = sync_interval
+        # Every sync reads this far back again, rows commit out of order and hosts' clocks differ
+        self.sync_lookback = sync_lookback
+        # Signing keys by key id, the first one signs new tokens and the rest only verify
+        self.keys = self.load_keys()
+        self.current_kid = next(iter(self.keys))
+        # Revoked jti -> unix time after which the token is expired anyway
+        self.revoked = {}
+        self.lock = threading.Lock()
+        # Start of the last successful sync, None until the first one read every live revocation
+        self.synced_at = None
+        self.sync_pid = None
+
+    def load_keys(self) -> dict:
+        # JWT_SIGNING_KEYS="kid1:secret1,kid2:secret2" takes precedence over the key file
+        value = os.environ.get("JWT_SIGNING_KEYS")
+        if value:
+            keys = {}
+            for pair in value.split(","):
+                kid, secret = pair.strip().split(":", 1)
+                keys[kid] = secret
+            return keys
+
+        path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "SigningKeys.json")
+        try:
+            # Only the first worker to start creates the file, the others read it
+            fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+            with os.fdopen(fd, "w") as file:
+                json.dump({"keys": {"k1": secrets.token_hex(32)}}, file)
+        except FileExistsError:
+            pass
+
+        for _ in range(50):
+            with open(path, "r") as file:
+                content = file.read()
+            if content:
+                return json.loads(content)["keys"]
+            # Another worker is still writing the file
+            time.sleep(0.01)
+        raise TokenError(f"Signing key file {path} is empty")
+
+    def issue(self, email, jti) -> str:
+        payload = {
+            "jti": jti,
+            "exp": int(time.time() + self.lifetime.total_seconds()),
+            "email": email,
+        }
+        return jwt.encode(payload, self.keys[self.current_kid], algorithm="HS256", headers={"kid": self.current_kid})
+
+    def verify(self, token) -> dict:
+        # Signature, exp and the deny-list are all checked in memory
+        self.ensure_sync_thread()
+        try:
+            kid = jwt.get_unverified_header(token).get("kid")
+            if kid not in self.keys:
+                raise TokenError("Unknown signing key")
+            claims = jwt.decode(
+                token,
+                self.keys[kid],
+                algorithms=["HS256"],
+                options={"require": ["exp", "jti"]}
+            )
+        except jwt.ExpiredSignatureError:
+            raise TokenError("Token expired")
+        except jwt.InvalidTokenError as error:
+            raise TokenError(f"Invalid token - {error}")
+
+        if claims["jti"] in self.revoked:
+            raise TokenError("Token revoked")
+        return claims
+
+    def required(self, view):
+        # Decorator for protected routes, the verified claims are stored in g.token_claims
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            header = request.headers.get("Authorization", "")
+            parts = header.split()
+            if len(parts) != 2 or parts[0].lower() != "bearer":
+                return "Unauthorized - Missing bearer token.", 401
+            try:
+                g.token_claims = self.verify(parts[1])
+            except TokenError as error:
+                return f"Unauthorized - {error}.", 401
+            g.token = parts[1]
+            return view(*args, **kwargs)
+        return wrapper
+
+    def revoke(self, jti, created_at=None, expires_at=None) -> None:
+        # Keep the jti until the token would have expired on its own, expires_at is the exp claim
+        if expires_at is None:
+            if created_at is None:
+                expires_at = time.time() + self.lifetime.total_seconds()
+            else:
+                expires_at = (created_at + self.lifetime).timestamp()
+        with self.lock:
+            self.revoked[jti] = expires_at
+
+    def ensure_sync_thread(self) -> None:
+        # Started lazily so every gunicorn worker runs its own sync thread
+        if self.sync_pid == os.getpid():
+            return
+        with self.lock:
+            if self.sync_pid == os.getpid():
+                return
+            self.sync_pid = os.getpid()
+        self.sync_revocations()
+        thread = threading.Thread(target=self.sync_loop, name="token-revocation-sync", daemon=True)
+        thread.start()
+
+    def sync_loop(self) -> None:
+        while True:
+            time.sleep(self.sync_interval)
+            self.sync_revocations()
+
+    def sync_revocations(self) -> None:
+        # Pull revocations written by other workers from expired_access_tokens
+        connection = None
+        cursor = None
+        try:
+            connection = self.database.db_connection()
+            cursor = connection.cursor()
+            started = datetime.now()
+            if self.synced_at is None:
+                # Every token that has not expired on its own yet
+                query = "SELECT jti, created_at FROM expired_access_tokens WHERE created_at > %s"
+                cursor.execute(query, (started - self.lifetime,))
+            else:
+                # updated_at is when the row was revoked, the overlap with the last sync catches rows
+                # that committed after newer ones, revoke() ignores the ones already known
+                query = "SELECT jti, created_at FROM expired_access_tokens WHERE updated_at > %s"
+                cursor.execute(query, (self.synced_at - self.sync_lookback,))
+            while True:
+                rows = cursor.fetchmany(1000)
+                if not rows:
+                    break
+                for jti, created_at in rows:
+                    self.revoke(jti, created_at)
+            self.synced_at = started
+
+            # Drop entries whose tokens have expired anyway
+            now = time.time()
+            with self.lock:
+                self.revoked = {jti: expires_at for jti, expires_at in self.revoked.items() if expires_at > now}
+
+        except Exception as error:
+            self.logger.debug(error)
+
+        finally:
+            if cursor is not None:
+                cursor.close()
+            if connection is not None:
+                connection.close()
+
+    def stats(self) -> dict:
+        with self.lock:
+            return {
+                "revoked": len(self.revoked),
+                "synced_at": self.synced_at.isoformat(timespec="seconds") if self.synced_at is not None else None,
+                "keys": list(self.keys),
+                "current_kid": self.current_kid,
+            }